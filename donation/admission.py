@@ -0,0 +1,133 @@
+import fcntl
+import math
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+BUCKETS_DB_NAME = "buckets.sqlite3"
+SLOT_FILE_PREFIX = "slot-"
+# Buckets untouched this long are full again and can be forgotten.
+PRUNE_INTERVAL = 300.0
+
+
+class Overloaded(RuntimeError):
+    """Request refused by admission control; ``retry_after`` is in seconds."""
+
+    def __init__(self, message: str, retry_after: float, status: int = 503):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.status = status
+
+
+class TokenBucketStore:
+    """Token buckets (``rate`` per second, up to ``burst``) shared by processes.
+
+    Buckets live in a small SQLite file under ``directory`` so every
+    gunicorn worker (and the outbox worker) draws from the same ones; a
+    BEGIN IMMEDIATE transaction makes each take() atomic across processes.
+    """
+
+    def __init__(self, directory: str | Path, rate: float, burst: float):
+        self.path = Path(directory) / BUCKETS_DB_NAME
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._local = threading.local()
+        self._next_prune = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def take(self, key: str, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens; returns 0 when allowed, else seconds until they are there."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key=?", (key,)).fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / self.rate
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            if now >= self._next_prune:
+                self._next_prune = now + PRUNE_INTERVAL
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - self.burst / self.rate - PRUNE_INTERVAL,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def wait(self, key: str, stop_event: threading.Event | None = None) -> None:
+        """Block until a token for ``key`` is taken (or ``stop_event`` is set)."""
+        while True:
+            delay = self.take(key)
+            if delay <= 0:
+                return
+            if stop_event is not None:
+                if stop_event.wait(delay):
+                    return
+            else:
+                time.sleep(delay)
+
+
+class SlotLimiter:
+    """At most ``slots`` holders at a time across all processes on this host.
+
+    Each slot is an flock()ed file under ``directory``. The kernel drops
+    the lock when its holder exits, so a killed worker never leaks a slot.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        slots: int,
+        wait: float = 0.0,
+        retry_after: float = 5.0,
+        poll_interval: float = 0.05,
+    ):
+        self.directory = Path(directory)
+        self.slots = slots
+        self.wait = wait
+        self.retry_after = retry_after
+        self.poll_interval = poll_interval
+
+    def acquire(self) -> int:
+        """Return a locked file descriptor, or raise Overloaded after ``wait`` seconds."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        deadline = time.monotonic() + self.wait
+        # Start at a different slot per process so workers do not all probe slot 0 first.
+        start = os.getpid() % self.slots
+        while True:
+            for offset in range(self.slots):
+                path = self.directory / f"{SLOT_FILE_PREFIX}{(start + offset) % self.slots}"
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    continue
+                return fd
+            if time.monotonic() >= deadline:
+                raise Overloaded(
+                    "ただいま混み合っています。しばらくしてから再度お試しください。", retry_after=self.retry_after
+                )
+            time.sleep(self.poll_interval)
+
+    def release(self, fd: int) -> None:
+        # Closing the descriptor releases the flock.
+        os.close(fd)
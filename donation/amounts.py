@@ -0,0 +1,23 @@
+import re
+import unicodedata
+
+MAX_AMOUNT_YEN = 1_000_000_000
+_DIGITS_RE = re.compile(r"[0-9]+")
+
+
+def parse_amount_yen(value) -> int:
+    """Parse a donation amount such as "3000", "3,000" or "３０００円".
+
+    Raises ValueError with a message for the donor or admin when the value
+    is not a whole number of yen in range.
+    """
+    text = unicodedata.normalize("NFKC", str(value or "")).strip()
+    text = text.replace(",", "").removesuffix("円").strip()
+    if not _DIGITS_RE.fullmatch(text):
+        raise ValueError("金額は1円以上の整数で入力してください。")
+    amount = int(text)
+    if amount < 1:
+        raise ValueError("金額は1円以上の整数で入力してください。")
+    if amount > MAX_AMOUNT_YEN:
+        raise ValueError("金額が上限を超えています。")
+    return amount
@@ -0,0 +1,208 @@
+import csv
+import io
+import os
+import time
+import zipfile
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+PAGE_SIZE = 500
+DONORS_PER_ARCHIVE = 1000
+INDEX_COLUMNS = ("file", "certificate_no", "donor_email", "donor_name", "donations", "total_amount")
+
+
+def iter_annual_donors(conn, year: int, checked_only: bool = False, after_key: str = "") -> Iterator[dict]:
+    """Group the year's active receipts by donor, in search_email order.
+
+    Donors are identified by the normalized email (search_email), so the
+    same address typed with different case or width is one donor. Rows are
+    read in keyset pages on (search_email, id), so memory holds one page
+    plus the donor being assembled; ``after_key`` resumes past a donor.
+    """
+    where = ["is_deleted=0", "donated_at >= %s", "donated_at < %s"]
+    params: list = [datetime(year, 1, 1), datetime(year + 1, 1, 1)]
+    if checked_only:
+        where.append("is_checked=1")
+    last_key, last_id = after_key, None
+    donor: dict | None = None
+    while True:
+        if last_id is None:
+            cursor_sql, cursor_params = "search_email > %s", [last_key]
+        else:
+            cursor_sql = "(search_email > %s OR (search_email = %s AND id > %s))"
+            cursor_params = [last_key, last_key, last_id]
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT id, search_email, certificate_no, donor_name, donor_address, donor_email,
+                       amount_value, payment_method, donated_at
+                FROM donation_receipts
+                WHERE {' AND '.join(where)} AND {cursor_sql}
+                ORDER BY search_email, id
+                LIMIT {PAGE_SIZE}
+                """,
+                [*params, *cursor_params],
+            )
+            rows = cur.fetchall()
+        conn.commit()
+        if not rows:
+            break
+        for row in rows:
+            if donor is None or donor["key"] != row["search_email"]:
+                if donor is not None:
+                    yield donor
+                donor = {"key": row["search_email"], "total_amount": 0, "donations": []}
+            # The latest receipt's name and address go on the certificate.
+            donor["donor_email"] = row["donor_email"]
+            donor["donor_name"] = row["donor_name"]
+            donor["donor_address"] = row["donor_address"]
+            donor["donations"].append(
+                {
+                    "donated_at": row["donated_at"],
+                    "certificate_no": row["certificate_no"],
+                    "payment_method": row["payment_method"],
+                    "amount_value": row["amount_value"],
+                }
+            )
+            # amount_value is NULL for amounts flagged invalid by migration 7.
+            donor["total_amount"] += row["amount_value"] or 0
+        last_key, last_id = rows[-1]["search_email"], rows[-1]["id"]
+    if donor is not None:
+        yield donor
+
+
+class AnnualProgress:
+    """Append-only log of finished archives: "<part>\\t<donors so far>\\t<last key>".
+
+    An archive is renamed into place before its line is written, so a rerun
+    starts after the last logged donor and rewrites any unlogged archive.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.next_part = 1
+        self.donors_done = 0
+        self.last_key = ""
+        if path.exists():
+            with open(path, encoding="utf-8") as fh:
+                for line in fh:
+                    part, donors, key = line.rstrip("\n").split("\t", 2)
+                    self.next_part = int(part) + 1
+                    self.donors_done = int(donors)
+                    self.last_key = key
+
+    def record(self, part: int, donors_done: int, last_key: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(f"{part}\t{donors_done}\t{last_key}\n")
+        self.next_part, self.donors_done, self.last_key = part + 1, donors_done, last_key
+
+
+def annual_certificate_no(year: int, ordinal: int) -> str:
+    return f"ANNUAL-{year}-{ordinal:06d}"
+
+
+def write_annual_archives(
+    donors: Iterable[dict],
+    render_many: Callable[[Iterable[dict]], Iterator[tuple[dict, bytes]]],
+    out_dir: Path,
+    year: int,
+    progress: AnnualProgress,
+    per_archive: int = DONORS_PER_ARCHIVE,
+    log: Callable[[str], None] | None = None,
+    progress_every: int = 500,
+) -> dict:
+    """Render one certificate per donor into numbered ZIP archives.
+
+    ``render_many`` is ReceiptRenderExecutor.map bound to "render_annual";
+    it yields PDFs in input order while the pool works ahead. Each PDF is
+    written to the open archive as it arrives, and every ``per_archive``
+    donors the archive is completed (with an index.csv) and logged in
+    ``progress``, which is what makes an interrupted run resumable.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    pending: deque = deque()
+    ordinal = progress.donors_done
+    stats = {"certificates": 0, "archives": 0, "resumed_after": progress.donors_done, "bytes": 0}
+    started = time.monotonic()
+
+    def jobs() -> Iterator[dict]:
+        nonlocal ordinal
+        for donor in donors:
+            ordinal += 1
+            certificate_no = annual_certificate_no(year, ordinal)
+            pending.append((donor["key"], certificate_no, donor))
+            yield {
+                "name": donor["donor_name"],
+                "address": donor["donor_address"],
+                "year": year,
+                "certificate_no": certificate_no,
+                "total_amount": donor["total_amount"],
+                "donations": donor["donations"],
+            }
+
+    archive = None
+    index: io.StringIO | None = None
+    part = progress.next_part
+    tmp_path = final_path = None
+    in_archive = 0
+    last_key = progress.last_key
+
+    def close_archive() -> None:
+        nonlocal archive, in_archive, part
+        archive.writestr("index.csv", "\ufeff" + index.getvalue())
+        archive.close()
+        os.replace(tmp_path, final_path)
+        progress.record(part, progress.donors_done + in_archive, last_key)
+        stats["archives"] += 1
+        if log:
+            log(f"wrote {final_path.name} ({in_archive} certificates)")
+        archive, in_archive, part = None, 0, part + 1
+
+    try:
+        for _, pdf_bytes in render_many(jobs()):
+            key, certificate_no, donor = pending.popleft()
+            if archive is None:
+                final_path = out_dir / f"annual-{year}-{part:04d}.zip"
+                tmp_path = final_path.with_name(f".{final_path.name}.tmp")
+                archive = zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED)
+                index = io.StringIO()
+                csv.writer(index, lineterminator="\r\n").writerow(INDEX_COLUMNS)
+            file_name = f"{certificate_no}.pdf"
+            archive.writestr(file_name, pdf_bytes)
+            csv.writer(index, lineterminator="\r\n").writerow(
+                (
+                    file_name,
+                    certificate_no,
+                    donor["donor_email"],
+                    donor["donor_name"],
+                    len(donor["donations"]),
+                    donor["total_amount"],
+                )
+            )
+            in_archive += 1
+            last_key = key
+            stats["certificates"] += 1
+            stats["bytes"] += len(pdf_bytes)
+            if in_archive >= per_archive:
+                close_archive()
+            if log and stats["certificates"] % progress_every == 0:
+                elapsed = time.monotonic() - started
+                log(
+                    f"progress: {progress.donors_done + in_archive} donors, "
+                    f"{stats['certificates'] / elapsed:.1f} certificates/s, {stats['bytes'] / elapsed / 1e6:.2f} MB/s"
+                )
+        if archive is not None:
+            close_archive()
+    finally:
+        # An archive left open by a failure is incomplete; the next run redoes it.
+        if archive is not None:
+            archive.close()
+
+    elapsed = time.monotonic() - started
+    return {
+        **stats,
+        "elapsed_sec": round(elapsed, 3),
+        "certificates_per_sec": round(stats["certificates"] / elapsed, 2) if elapsed > 0 else 0.0,
+    }
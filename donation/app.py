@@ -1,18 +1,26 @@
-import io
+import json
 import os
-import smtplib
+import re
+import signal
+import sqlite3
+import threading
+import time
 from functools import wraps
 from pathlib import Path
 from datetime import datetime
-from email.message import EmailMessage
-from urllib.parse import quote
+from typing import Callable
+from urllib.parse import quote, urlencode
 from uuid import uuid4
 
+import click
 import pymysql
 from dotenv import load_dotenv
 from flask import (
     Flask,
+    Response,
     abort,
+    g,
+    has_request_context,
     jsonify,
     redirect,
     render_template,
@@ -22,10 +30,31 @@ from flask import (
     session,
 )
 from werkzeug.middleware.proxy_fix import ProxyFix
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.cidfonts import UnicodeCIDFont
-from reportlab.pdfgen import canvas
+
+import admission
+import annual
+import bulk_mail
+import counters
+import export
+import idempotency
+import migrations
+import outbox
+import receipt_import
+import receipt_queries
+import reports
+import static_build
+from amounts import parse_amount_yen
+from certificates import allocate_certificate_sequence, format_certificate_no
+from db_pool import ConnectionPool, PoolExhaustedError
+from db_router import ReplicaRouter
+from donation_fields import validate_donation
+from mailer import SMTPSession
+from metrics import MetricsRegistry
+from pipeline import StageTimer
+from receipt_cache import ReceiptCache
+from receipt_renderer import LAYOUT_VERSION
+from render_pool import ReceiptRenderExecutor, RenderBusyError
+from search import search_columns, search_receipts
 
 load_dotenv()
 
@@ -35,12 +64,27 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
 app.json.ensure_ascii = False
 default_receipt_dir = f"/tmp/donation_receipts_{os.geteuid()}"
 RECEIPT_DIR = Path(os.getenv("RECEIPT_DIR", default_receipt_dir))
-RECEIPT_DIR.mkdir(parents=True, exist_ok=True)
+RECEIPT_CACHE_MAX_MB = float(os.getenv("RECEIPT_CACHE_MAX_MB", "512"))
+# e.g. "/_receipts/": nginx serves the file from an internal location
+# aliased to RECEIPT_DIR; empty means Flask sends the file itself.
+RECEIPT_ACCEL_REDIRECT_PREFIX = os.getenv("RECEIPT_ACCEL_REDIRECT_PREFIX", "").strip()
 BASE_DIR = Path(__file__).resolve().parent
 SEAL_IMAGE_PATH = Path(os.getenv("SEAL_IMAGE_PATH", str(BASE_DIR / "assets/seals/issuer_seal.png")))
 SIGNATURE_IMAGE_PATH = Path(
     os.getenv("SIGNATURE_IMAGE_PATH", str(BASE_DIR / "assets/seals/issuer_signature.png"))
 )
+# Output of `flask build-static`; nginx serves the site from here.
+STATIC_BUILD_DIR = Path(os.getenv("STATIC_BUILD_DIR", str(BASE_DIR.parent / "public")))
+RECEIPT_IMAGE_DPI = int(os.getenv("RECEIPT_IMAGE_DPI", "150"))
+receipt_cache = ReceiptCache(
+    RECEIPT_DIR,
+    max_bytes=int(RECEIPT_CACHE_MAX_MB * 1024 * 1024),
+    salt=f"layout={LAYOUT_VERSION};dpi={RECEIPT_IMAGE_DPI}",
+)
+RECEIPT_RENDER_MODE = os.getenv("RECEIPT_RENDER_MODE", "inline").strip() or "inline"
+RECEIPT_RENDER_WORKERS = int(os.getenv("RECEIPT_RENDER_WORKERS", "1"))
+RECEIPT_RENDER_TIMEOUT = float(os.getenv("RECEIPT_RENDER_TIMEOUT", "20"))
+RECEIPT_RENDER_MAX_PENDING = int(os.getenv("RECEIPT_RENDER_MAX_PENDING", "4"))
 
 
 # ===== メール設定（環境変数） =====
@@ -49,11 +93,59 @@ SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 SMTP_USER = os.getenv("SMTP_USER", "")
 SMTP_PASS = os.getenv("SMTP_PASS", "").replace(" ", "")
 FROM_MAIL = os.getenv("FROM_MAIL", SMTP_USER)
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_AUTH = os.getenv("SMTP_AUTH", "1") == "1"
+SMTP_SESSION_IDLE_TIMEOUT = float(os.getenv("SMTP_SESSION_IDLE_TIMEOUT", "60"))
+SMTP_SESSION_MAX_MESSAGES = int(os.getenv("SMTP_SESSION_MAX_MESSAGES", "100"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "30"))
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "3600"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_SEND_RATE_PER_MINUTE = float(os.getenv("OUTBOX_SEND_RATE_PER_MINUTE", "0"))
+OUTBOX_SEND_BURST = float(os.getenv("OUTBOX_SEND_BURST", "5"))
+# Admission control for /submit, shared by all workers through files here.
+ADMISSION_DIR = Path(os.getenv("ADMISSION_DIR", f"/tmp/donation_admission_{os.geteuid()}"))
+SUBMIT_RATE_PER_MINUTE = float(os.getenv("SUBMIT_RATE_PER_MINUTE", "10"))
+SUBMIT_RATE_BURST = float(os.getenv("SUBMIT_RATE_BURST", "5"))
+SUBMIT_MAX_IN_FLIGHT = int(os.getenv("SUBMIT_MAX_IN_FLIGHT", "4"))
+SUBMIT_QUEUE_WAIT = float(os.getenv("SUBMIT_QUEUE_WAIT", "2"))
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "60"))
+# Keep below client_max_body_size in deploy/nginx/donation.conf, or nginx
+# answers oversized uploads with its own bare 413 page.
+IMPORT_MAX_MB = float(os.getenv("IMPORT_MAX_MB", "10"))
+IDEMPOTENCY_CACHE_TTL = float(os.getenv("IDEMPOTENCY_CACHE_TTL", "600"))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "30"))
+IDEMPOTENCY_RETENTION_DAYS = int(os.getenv("IDEMPOTENCY_RETENTION_DAYS", "30"))
+IMPORT_ERROR_DISPLAY_LIMIT = 500
+# Shared by all gunicorn workers and the outbox worker, so a scrape sees
+# the service totals; set it empty to keep values in this process only.
+METRICS_DIR = os.getenv("METRICS_DIR", f"/tmp/donation_metrics_{os.geteuid()}").strip()
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+METRICS_ALLOWED_IPS = {ip.strip() for ip in os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",") if ip.strip()}
+SUBMIT_TIMING_LOG = os.getenv("SUBMIT_TIMING_LOG", "0") == "1"
 DB_HOST = os.getenv("DB_HOST", "127.0.0.1")
 DB_PORT = int(os.getenv("DB_PORT", "3306"))
 DB_USER = os.getenv("DB_USER", "kifukin_user")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_NAME = os.getenv("DB_NAME", "donation")
+# Off by default: migrations 7-8 can outlast gunicorn's worker timeout.
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "0") == "1"
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "4"))
+DB_POOL_MAX_IDLE = int(os.getenv("DB_POOL_MAX_IDLE", "2"))
+DB_POOL_IDLE_TIMEOUT = float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300"))
+DB_POOL_PING_INTERVAL = float(os.getenv("DB_POOL_PING_INTERVAL", "30"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Optional read replica for the admin listing, search, reports, export and db-check.
+DB_READ_HOST = os.getenv("DB_READ_HOST", "").strip()
+DB_READ_PORT = int(os.getenv("DB_READ_PORT", str(DB_PORT)))
+DB_READ_USER = os.getenv("DB_READ_USER", DB_USER)
+DB_READ_PASSWORD = os.getenv("DB_READ_PASSWORD", DB_PASSWORD)
+DB_READ_POOL_MAX_SIZE = int(os.getenv("DB_READ_POOL_MAX_SIZE", str(DB_POOL_MAX_SIZE)))
+DB_READ_MAX_LAG = float(os.getenv("DB_READ_MAX_LAG", "5"))
+DB_READ_LAG_CHECK_INTERVAL = float(os.getenv("DB_READ_LAG_CHECK_INTERVAL", "5"))
+DB_READ_RETRY_INTERVAL = float(os.getenv("DB_READ_RETRY_INTERVAL", "30"))
+DB_READ_STICKY_SECONDS = float(os.getenv("DB_READ_STICKY_SECONDS", "30"))
 CREDIT_CARD_INPUT_URL = os.getenv("CREDIT_CARD_INPUT_URL", "").strip()
 PUBLIC_DONATION_PREFIX = os.getenv("PUBLIC_DONATION_PREFIX", "/donation").rstrip("/")
 ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin").strip() or "admin"
@@ -82,6 +174,43 @@ def parse_multiline_env(value: str) -> str:
 
 BANK_TRANSFER_INFO = parse_multiline_env(os.getenv("BANK_TRANSFER_INFO", ""))
 
+# Templates link /style.css etc. through asset_url() so they get the
+# long-cached fingerprinted names once the site has been built.
+asset_manifest = static_build.AssetManifest(STATIC_BUILD_DIR)
+app.add_template_global(asset_manifest.url, "asset_url")
+
+metrics = MetricsRegistry(METRICS_DIR or None, flush_interval=METRICS_FLUSH_INTERVAL)
+metrics.install_atexit()
+metrics.counter("donation_http_requests_total", "HTTP requests by endpoint, method and status.")
+metrics.histogram("donation_http_request_duration_seconds", "HTTP request latency by endpoint.")
+metrics.histogram("donation_submit_stage_seconds", "Time spent in each stage of /submit.")
+metrics.counter("donation_receipt_render_rejected_total", "Submissions refused because the render pool was busy.")
+metrics.counter("donation_submit_replayed_total", "Duplicate submissions answered with the original result, by source.")
+metrics.counter("donation_submit_shed_total", "Submissions refused by admission control, by reason.")
+metrics.counter("donation_db_connections_opened_total", "New MySQL connections opened.")
+metrics.counter("donation_db_connect_errors_total", "Failed attempts to open a MySQL connection.")
+metrics.counter("donation_db_pool_exhausted_total", "Checkouts that timed out waiting for a pooled connection.")
+metrics.gauge("donation_db_pool_connections", "Pooled MySQL connections by role and state, summed over processes.")
+metrics.counter("donation_db_read_fallback_total", "Replica reads sent to the primary, by reason (down, lag, busy).")
+metrics.histogram("donation_email_stage_seconds", "Outbox worker time per stage (send, status_update).")
+metrics.counter("donation_email_messages_total", "Outbox deliveries by outcome (sent, retry, dead).")
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response: Response) -> Response:
+    endpoint = request.endpoint or "unmatched"
+    labels = {"endpoint": endpoint, "method": request.method, "status": str(response.status_code)}
+    metrics.inc("donation_http_requests_total", labels)
+    started = g.get("request_started")
+    if started is not None:
+        metrics.observe("donation_http_request_duration_seconds", time.perf_counter() - started, {"endpoint": endpoint})
+    return response
+
 
 def get_dashboard_users() -> dict[str, str]:
     users: dict[str, str] = {}
@@ -113,9 +242,33 @@ def public_admin_path(path: str = "") -> str:
 @app.route("/donation", methods=["GET"])
 @app.route("/donation/", methods=["GET"])
 def form_page():
+    # Normally nginx serves the built form; this is the fallback when it is not there.
+    if (STATIC_BUILD_DIR / static_build.FORM_PAGE).is_file():
+        return send_from_directory(STATIC_BUILD_DIR / "donation", "index.html")
     return send_from_directory(".", "index.html")
 
 
+_render_executor: ReceiptRenderExecutor | None = None
+_render_executor_lock = threading.Lock()
+
+
+def get_render_executor() -> ReceiptRenderExecutor:
+    global _render_executor
+    if _render_executor is None:
+        with _render_executor_lock:
+            if _render_executor is None:
+                _render_executor = ReceiptRenderExecutor(
+                    SEAL_IMAGE_PATH,
+                    SIGNATURE_IMAGE_PATH,
+                    image_dpi=RECEIPT_IMAGE_DPI,
+                    mode=RECEIPT_RENDER_MODE,
+                    workers=RECEIPT_RENDER_WORKERS,
+                    timeout=RECEIPT_RENDER_TIMEOUT,
+                    max_pending=RECEIPT_RENDER_MAX_PENDING,
+                )
+    return _render_executor
+
+
 def build_receipt_pdf(
     name: str,
     address: str,
@@ -125,74 +278,14 @@ def build_receipt_pdf(
     certificate_no: str,
 ) -> bytes:
     """Create receipt PDF bytes (Japanese compatible)."""
-    pdfmetrics.registerFont(UnicodeCIDFont("HeiseiKakuGo-W5"))
-
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    c.setFont("HeiseiKakuGo-W5", 12)
-
-    text = c.beginText(50, 800)
-    text.setFont("HeiseiKakuGo-W5", 12)
-    text.textLine("寄付受領書")
-    text.textLine("")
-    text.textLine(f"証明書番号：{certificate_no}")
-    text.textLine("")
-    text.textLine(f"{name} 様")
-    text.textLine(f"住所：{address}")
-    text.textLine("")
-    text.textLine(f"寄附金額：{amount} 円")
-    text.textLine(f"支払方法：{payment_method}")
-    text.textLine(f"日付：{donated_at.strftime('%Y年%m月%d日 %H:%M:%S')}")
-    text.textLine("")
-    text.textLine("受け入れ団体：NPO法人ほっこり サポートホーム／ほっこりくろちゃん")
-    text.textLine("所在地：〒612-8403 京都市伏見区深草ヲカヤ町23-6 サポートホーム")
-
-    c.drawText(text)
-    draw_issuer_assets(c)
-    c.showPage()
-    c.save()
-
-    return buffer.getvalue()
-
-
-def draw_issuer_assets(c: canvas.Canvas) -> None:
-    c.setFont("HeiseiKakuGo-W5", 10)
-    y_label = 140
-    has_seal = SEAL_IMAGE_PATH.exists()
-    has_signature = SIGNATURE_IMAGE_PATH.exists()
-
-    if has_seal:
-        c.drawString(60, y_label, "略印")
-    if has_signature:
-        c.drawString(250, y_label, "代表者署名")
-
-    try:
-        if has_seal:
-            c.drawImage(
-                str(SEAL_IMAGE_PATH),
-                x=60,
-                y=55,
-                width=130,
-                height=75,
-                preserveAspectRatio=True,
-                mask="auto",
-            )
-    except Exception:
-        pass
-
-    try:
-        if has_signature:
-            c.drawImage(
-                str(SIGNATURE_IMAGE_PATH),
-                x=250,
-                y=55,
-                width=220,
-                height=75,
-                preserveAspectRatio=True,
-                mask="auto",
-            )
-    except Exception:
-        pass
+    return get_render_executor().render(
+        name=name,
+        address=address,
+        amount=amount,
+        payment_method=payment_method,
+        donated_at=donated_at,
+        certificate_no=certificate_no,
+    )
 
 
 def normalize_payment_method(payment_method: str) -> str:
@@ -210,16 +303,11 @@ def build_credit_card_input_url(certificate_no: str) -> str:
     return f"{base_url}{separator}certificate_no={quote(certificate_no)}"
 
 
-def send_receipt_email(
-    name: str,
-    email: str,
-    pdf_bytes: bytes,
-    payment_method: str,
-    credit_card_input_url: str,
-) -> None:
-    if not SMTP_USER or not SMTP_PASS or not FROM_MAIL:
-        raise RuntimeError("SMTP設定が未完了です。SMTP_USER / SMTP_PASS / FROM_MAIL を設定してください。")
+RECEIPT_EMAIL_SUBJECT = "【NPO法人ほっこり】寄付受領書"
+RECEIPT_ATTACHMENT_NAME = "寄付受領書.pdf"
+
 
+def build_receipt_email_body(name: str, payment_method: str, credit_card_input_url: str) -> str:
     payment_kind = normalize_payment_method(payment_method)
     body_lines = [
         f"{name} 様",
@@ -246,161 +334,273 @@ def send_receipt_email(
             ]
         )
     body_lines.extend(["NPO法人ほっこり"])
+    return "\n".join(body_lines)
 
-    msg = EmailMessage()
-    msg["Subject"] = "【NPO法人ほっこり】寄付受領書"
-    msg["From"] = FROM_MAIL
-    msg["To"] = email
-    msg.set_content("\n".join(body_lines))
-    msg.add_attachment(
-        pdf_bytes,
-        maintype="application",
-        subtype="pdf",
-        filename="寄付受領書.pdf",
+
+def enqueue_receipt_email(
+    cur,
+    receipt_id: int,
+    name: str,
+    email: str,
+    pdf_bytes: bytes,
+    payment_method: str,
+    credit_card_input_url: str,
+) -> int:
+    """Queue the receipt mail in email_outbox; the outbox worker delivers it."""
+    return outbox.enqueue_email(
+        cur,
+        recipient=email,
+        subject=RECEIPT_EMAIL_SUBJECT,
+        body=build_receipt_email_body(name, payment_method, credit_card_input_url),
+        receipt_id=receipt_id,
+        attachment=pdf_bytes,
+        attachment_name=RECEIPT_ATTACHMENT_NAME,
     )
 
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=20) as server:
-        server.starttls()
-        server.login(SMTP_USER, SMTP_PASS)
-        server.send_message(msg)
 
+def build_smtp_session() -> SMTPSession:
+    # SMTP_AUTH=0 is meant for local relays and devtools/smtp_sink.py.
+    if not FROM_MAIL or (SMTP_AUTH and (not SMTP_USER or not SMTP_PASS)):
+        raise RuntimeError("SMTP設定が未完了です。SMTP_USER / SMTP_PASS / FROM_MAIL を設定してください。")
 
-def get_db_connection():
+    return SMTPSession(
+        SMTP_SERVER,
+        SMTP_PORT,
+        user=SMTP_USER if SMTP_AUTH else "",
+        password=SMTP_PASS if SMTP_AUTH else "",
+        starttls=SMTP_STARTTLS,
+        timeout=20,
+        idle_timeout=SMTP_SESSION_IDLE_TIMEOUT,
+        max_messages=SMTP_SESSION_MAX_MESSAGES,
+    )
+
+
+def open_db_connection():
     if not DB_HOST or not DB_USER or not DB_NAME:
         raise RuntimeError("DB設定が未完了です。DB_HOST / DB_USER / DB_NAME を設定してください。")
 
-    return pymysql.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        database=DB_NAME,
-        charset="utf8mb4",
-        cursorclass=pymysql.cursors.DictCursor,
-        autocommit=False,
-    )
+    try:
+        conn = pymysql.connect(
+            host=DB_HOST,
+            port=DB_PORT,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            database=DB_NAME,
+            charset="utf8mb4",
+            cursorclass=pymysql.cursors.DictCursor,
+            autocommit=False,
+        )
+    except Exception:
+        metrics.inc("donation_db_connect_errors_total", {"role": "primary"})
+        raise
+    metrics.inc("donation_db_connections_opened_total", {"role": "primary"})
+    return conn
+
+
+def open_db_read_connection():
+    """Connection to the read replica; the session refuses writes."""
+    try:
+        conn = pymysql.connect(
+            host=DB_READ_HOST,
+            port=DB_READ_PORT,
+            user=DB_READ_USER,
+            password=DB_READ_PASSWORD,
+            database=DB_NAME,
+            charset="utf8mb4",
+            cursorclass=pymysql.cursors.DictCursor,
+            autocommit=False,
+            connect_timeout=5,
+            init_command="SET SESSION TRANSACTION READ ONLY",
+        )
+    except Exception:
+        metrics.inc("donation_db_connect_errors_total", {"role": "replica"})
+        raise
+    metrics.inc("donation_db_connections_opened_total", {"role": "replica"})
+    return conn
+
+
+_db_pool: ConnectionPool | None = None
+_db_pool_pid: int | None = None
+_db_pool_lock = threading.Lock()
+
+
+def get_db_pool() -> ConnectionPool:
+    # One pool per process: a gunicorn worker forked from a parent that already
+    # built a pool must not share its sockets.
+    global _db_pool, _db_pool_pid
+    pid = os.getpid()
+    if _db_pool is None or _db_pool_pid != pid:
+        with _db_pool_lock:
+            if _db_pool is None or _db_pool_pid != pid:
+                _db_pool = ConnectionPool(
+                    open_db_connection,
+                    max_size=DB_POOL_MAX_SIZE,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    idle_timeout=DB_POOL_IDLE_TIMEOUT,
+                    ping_interval=DB_POOL_PING_INTERVAL,
+                    checkout_timeout=DB_POOL_TIMEOUT,
+                )
+                _db_pool_pid = pid
+    return _db_pool
+
+
+def get_db_connection():
+    """Check out a pooled connection; close() returns it to the pool."""
+    try:
+        return get_db_pool().acquire()
+    except PoolExhaustedError:
+        metrics.inc("donation_db_pool_exhausted_total")
+        raise
+
+
+_db_read_router: ReplicaRouter | None = None
+_db_read_router_pid: int | None = None
+
+
+def get_db_read_router() -> ReplicaRouter | None:
+    """The replica router of this process, or None without DB_READ_HOST."""
+    global _db_read_router, _db_read_router_pid
+    if not DB_READ_HOST:
+        return None
+    pid = os.getpid()
+    if _db_read_router is None or _db_read_router_pid != pid:
+        with _db_pool_lock:
+            if _db_read_router is None or _db_read_router_pid != pid:
+                pool = ConnectionPool(
+                    open_db_read_connection,
+                    max_size=DB_READ_POOL_MAX_SIZE,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    idle_timeout=DB_POOL_IDLE_TIMEOUT,
+                    ping_interval=DB_POOL_PING_INTERVAL,
+                    # Waiting for a busy replica is pointless when the primary can answer.
+                    checkout_timeout=min(DB_POOL_TIMEOUT, 1.0),
+                )
+                _db_read_router = ReplicaRouter(
+                    pool,
+                    max_lag=DB_READ_MAX_LAG,
+                    check_interval=DB_READ_LAG_CHECK_INTERVAL,
+                    retry_interval=DB_READ_RETRY_INTERVAL,
+                    on_fallback=lambda reason: metrics.inc("donation_db_read_fallback_total", {"reason": reason}),
+                )
+                _db_read_router_pid = pid
+    return _db_read_router
+
+
+def reads_stick_to_primary() -> bool:
+    return has_request_context() and session.get("db_primary_until", 0) > time.time()
+
+
+def stick_to_primary() -> None:
+    """Send this browser's reads to the primary for a while after it wrote.
+
+    The redirect after a confirm/delete/edit must show the change even
+    if the replica has not applied it yet.
+    """
+    if DB_READ_HOST:
+        session["db_primary_until"] = time.time() + DB_READ_STICKY_SECONDS
+
+
+def read_from_replica() -> ReplicaRouter | None:
+    router = get_db_read_router()
+    if router is None or reads_stick_to_primary():
+        return None
+    if not _schema_current:
+        # Migrations only ever run on the primary; the replica follows.
+        with get_db_connection() as conn:
+            ensure_receipts_table(conn)
+    return router
+
+
+def get_db_read_connection():
+    """Pooled connection for read-only views.
+
+    The replica when DB_READ_HOST is set, it is up and caught up, and this
+    session has not written recently; the primary otherwise.
+    """
+    router = read_from_replica()
+    conn = router.acquire() if router is not None else None
+    return conn if conn is not None else get_db_connection()
+
+
+def export_connection_factory():
+    """Unpooled connect function for the streaming export, chosen like get_db_read_connection()."""
+    router = read_from_replica()
+    if router is not None and router.available():
+        return open_db_read_connection
+    return open_db_connection
+
+
+def db_pool_gauges():
+    # Only pools built in this process; a forked parent's pools are not ours.
+    pools = []
+    if _db_pool is not None and _db_pool_pid == os.getpid():
+        pools.append(("primary", _db_pool))
+    if _db_read_router is not None and _db_read_router_pid == os.getpid():
+        pools.append(("replica", _db_read_router.pool))
+    gauges = []
+    for role, pool in pools:
+        stats = pool.stats()
+        gauges.append(("donation_db_pool_connections", {"role": role, "state": "in_use"}, stats["in_use"]))
+        gauges.append(("donation_db_pool_connections", {"role": role, "state": "idle"}, stats["idle"]))
+    return gauges
+
+
+metrics.gauge_source(db_pool_gauges)
+
+
+_schema_current = False
+_schema_lock = threading.Lock()
 
 
 def ensure_receipts_table(conn) -> None:
-    sql = """
-    CREATE TABLE IF NOT EXISTS donation_receipts (
-        id BIGINT NOT NULL AUTO_INCREMENT,
-        certificate_no VARCHAR(32) NOT NULL,
-        donor_name VARCHAR(255) NOT NULL,
-        donor_postal_code VARCHAR(16) NOT NULL,
-        donor_address VARCHAR(255) NOT NULL,
-        donor_email VARCHAR(255) NOT NULL,
-        amount_yen VARCHAR(64) NOT NULL,
-        payment_method VARCHAR(64) NOT NULL,
-        donated_at DATETIME NOT NULL,
-        download_token VARCHAR(64) DEFAULT NULL,
-        status VARCHAR(32) NOT NULL DEFAULT 'created',
-        is_checked TINYINT(1) NOT NULL DEFAULT 0,
-        checked_at DATETIME DEFAULT NULL,
-        checked_by VARCHAR(64) DEFAULT NULL,
-        is_deleted TINYINT(1) NOT NULL DEFAULT 0,
-        deleted_at DATETIME DEFAULT NULL,
-        deleted_by VARCHAR(64) DEFAULT NULL,
-        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        PRIMARY KEY (id),
-        UNIQUE KEY uk_certificate_no (certificate_no),
-        UNIQUE KEY uk_download_token (download_token)
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+    """Make sure the schema is at the latest migration.
+
+    Only the first call in each process reads schema_version; afterwards this
+    is a no-op. Migrations normally run once per deploy via `flask db-migrate`
+    (ExecStartPre in deploy/systemd/donation.service); a request against a
+    stale schema fails fast. DB_AUTO_MIGRATE=1 migrates here instead, which
+    is only meant for local development.
     """
+    global _schema_current
+    if _schema_current:
+        return
+    with _schema_lock:
+        if _schema_current:
+            return
+        if migrations.current_version(conn) < migrations.latest_version():
+            if not DB_AUTO_MIGRATE:
+                raise RuntimeError("DBスキーマが最新ではありません。`flask --app app db-migrate` を実行してください。")
+            migrations.run_migrations(conn, log=app.logger.info)
+        conn.commit()
+        _schema_current = True
+
+
+@app.cli.command("db-migrate")
+def db_migrate_command():
+    """Apply pending schema migrations."""
+    conn = open_db_connection()
+    try:
+        applied = migrations.run_migrations(conn, log=click.echo)
+        version = migrations.current_version(conn)
+    finally:
+        conn.close()
+    if applied:
+        click.echo(f"applied: {', '.join(str(v) for v in applied)}")
+    click.echo(f"schema version: {version}")
+
+
+def allocate_certificate_no(conn, donated_at: datetime) -> str:
+    # Committed on its own so the sequence row lock is not held while the PDF
+    # renders. A submission that fails later leaves a gap in the numbering.
     with conn.cursor() as cur:
-        cur.execute(sql)
-        cur.execute(
-            """
-            SELECT COUNT(*) AS cnt
-            FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA=%s AND TABLE_NAME='donation_receipts' AND COLUMN_NAME='donor_postal_code'
-            """,
-            (DB_NAME,),
-        )
-        if cur.fetchone()["cnt"] == 0:
-            cur.execute("ALTER TABLE donation_receipts ADD COLUMN donor_postal_code VARCHAR(16) NOT NULL DEFAULT ''")
-
-        cur.execute(
-            """
-            SELECT COUNT(*) AS cnt
-            FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA=%s AND TABLE_NAME='donation_receipts' AND COLUMN_NAME='donor_address'
-            """,
-            (DB_NAME,),
-        )
-        if cur.fetchone()["cnt"] == 0:
-            cur.execute("ALTER TABLE donation_receipts ADD COLUMN donor_address VARCHAR(255) NOT NULL DEFAULT ''")
-
-        cur.execute(
-            """
-            SELECT COUNT(*) AS cnt
-            FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA=%s AND TABLE_NAME='donation_receipts' AND COLUMN_NAME='is_checked'
-            """,
-            (DB_NAME,),
-        )
-        if cur.fetchone()["cnt"] == 0:
-            cur.execute("ALTER TABLE donation_receipts ADD COLUMN is_checked TINYINT(1) NOT NULL DEFAULT 0")
-
-        cur.execute(
-            """
-            SELECT COUNT(*) AS cnt
-            FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA=%s AND TABLE_NAME='donation_receipts' AND COLUMN_NAME='checked_at'
-            """,
-            (DB_NAME,),
-        )
-        if cur.fetchone()["cnt"] == 0:
-            cur.execute("ALTER TABLE donation_receipts ADD COLUMN checked_at DATETIME DEFAULT NULL")
-
-        cur.execute(
-            """
-            SELECT COUNT(*) AS cnt
-            FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA=%s AND TABLE_NAME='donation_receipts' AND COLUMN_NAME='checked_by'
-            """,
-            (DB_NAME,),
-        )
-        if cur.fetchone()["cnt"] == 0:
-            cur.execute("ALTER TABLE donation_receipts ADD COLUMN checked_by VARCHAR(64) DEFAULT NULL")
-
-        cur.execute(
-            """
-            SELECT COUNT(*) AS cnt
-            FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA=%s AND TABLE_NAME='donation_receipts' AND COLUMN_NAME='is_deleted'
-            """,
-            (DB_NAME,),
-        )
-        if cur.fetchone()["cnt"] == 0:
-            cur.execute("ALTER TABLE donation_receipts ADD COLUMN is_deleted TINYINT(1) NOT NULL DEFAULT 0")
-
-        cur.execute(
-            """
-            SELECT COUNT(*) AS cnt
-            FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA=%s AND TABLE_NAME='donation_receipts' AND COLUMN_NAME='deleted_at'
-            """,
-            (DB_NAME,),
-        )
-        if cur.fetchone()["cnt"] == 0:
-            cur.execute("ALTER TABLE donation_receipts ADD COLUMN deleted_at DATETIME DEFAULT NULL")
-
-        cur.execute(
-            """
-            SELECT COUNT(*) AS cnt
-            FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA=%s AND TABLE_NAME='donation_receipts' AND COLUMN_NAME='deleted_by'
-            """,
-            (DB_NAME,),
-        )
-        if cur.fetchone()["cnt"] == 0:
-            cur.execute("ALTER TABLE donation_receipts ADD COLUMN deleted_by VARCHAR(64) DEFAULT NULL")
+        sequence = allocate_certificate_sequence(cur, donated_at.year)
     conn.commit()
+    return format_certificate_no(donated_at.year, sequence)
 
 
-def create_receipt_record(
-    conn,
+def insert_receipt_record(
+    cur,
+    certificate_no: str,
     name: str,
     postal_code: str,
     address: str,
@@ -408,73 +608,174 @@ def create_receipt_record(
     amount: str,
     payment_method: str,
     donated_at: datetime,
-) -> tuple[int, str]:
-    with conn.cursor() as cur:
-        # certificate_no is VARCHAR(32), so keep temporary value within 32 chars.
-        temp_certificate_no = f"TEMP-{uuid4().hex[:27]}"
-        cur.execute(
-            """
-            INSERT INTO donation_receipts (
-                certificate_no, donor_name, donor_postal_code, donor_address, donor_email, amount_yen,
-                payment_method, donated_at, status
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'created')
-            """,
-            (temp_certificate_no, name, postal_code, address, email, amount, payment_method, donated_at),
-        )
-        receipt_id = cur.lastrowid
-        certificate_no = f"RCPT-{donated_at.year}-{receipt_id:06d}"
-        cur.execute(
-            "UPDATE donation_receipts SET certificate_no=%s WHERE id=%s",
-            (certificate_no, receipt_id),
-        )
-    conn.commit()
-    return receipt_id, certificate_no
+    download_token: str | None = None,
+    amount_value: int | None = None,
+) -> int:
+    """Insert a receipt in state "created" using the caller's transaction.
 
+    ``amount`` is kept as entered for the PDF; ``amount_value`` is the
+    parsed yen amount used for reporting (parsed here when not given).
+    """
+    if amount_value is None:
+        amount_value = parse_amount_yen(amount)
+    search = search_columns(name, email, postal_code)
+    cur.execute(
+        """
+        INSERT INTO donation_receipts (
+            certificate_no, donor_name, donor_postal_code, donor_address, donor_email, amount_yen,
+            amount_value, payment_method, donated_at, status, download_token,
+            search_name, search_email, search_postal
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 'created', %s, %s, %s, %s)
+        """,
+        (
+            certificate_no,
+            name,
+            postal_code,
+            address,
+            email,
+            amount,
+            amount_value,
+            payment_method,
+            donated_at,
+            download_token,
+            search["search_name"],
+            search["search_email"],
+            search["search_postal"],
+        ),
+    )
+    receipt_id = cur.lastrowid
+    counters.record_transition(
+        cur,
+        None,
+        {"is_deleted": 0, "is_checked": 0, "status": "created", "payment_method": payment_method},
+    )
+    return receipt_id
 
-def update_receipt_status(conn, receipt_id: int, status: str, token: str | None = None) -> None:
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            UPDATE donation_receipts
-            SET status=%s, download_token=COALESCE(%s, download_token)
-            WHERE id=%s
-            """,
-            (status, token, receipt_id),
-        )
-    conn.commit()
 
+DOWNLOAD_TOKEN_RE = re.compile(r"^(?:\d{10}-)?[0-9a-f]{32}$")
 
-def save_receipt(pdf_bytes: bytes) -> str:
-    # Keep files for a day and clean older ones opportunistically.
-    now_ts = datetime.now().timestamp()
-    for path in RECEIPT_DIR.glob("*.pdf"):
-        try:
-            if now_ts - path.stat().st_mtime > 24 * 60 * 60:
-                path.unlink(missing_ok=True)
-        except OSError:
-            continue
 
-    token = uuid4().hex
-    (RECEIPT_DIR / f"{token}.pdf").write_bytes(pdf_bytes)
-    return token
+def receipt_fields_from_row(row: dict) -> dict:
+    """Arguments for build_receipt_pdf() from a donation_receipts row."""
+    return {
+        "name": row["donor_name"],
+        "address": row["donor_address"],
+        "amount": row["amount_yen"],
+        "payment_method": row["payment_method"],
+        "donated_at": row["donated_at"],
+        "certificate_no": row["certificate_no"],
+    }
+
+
+def fetch_receipt_by_token(token: str) -> dict | None:
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT certificate_no, donor_name, donor_address, amount_yen, payment_method, donated_at
+                FROM donation_receipts
+                WHERE download_token=%s AND is_deleted=0
+                """,
+                (token,),
+            )
+            row = cur.fetchone()
+        conn.commit()
+        return row
+    finally:
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def cached_receipt_path(fields: dict) -> Path:
+    """Path of the receipt PDF for ``fields``, rendering it on a cache miss."""
+    key = receipt_cache.key_for(fields)
+    path = receipt_cache.get(key)
+    if path is None:
+        path = receipt_cache.put(key, build_receipt_pdf(**fields))
+    return path
 
 
 @app.route("/download/<token>", methods=["GET"])
 @app.route("/donation/download/<token>", methods=["GET"])
 def download_receipt(token: str):
-    receipt_path = RECEIPT_DIR / f"{token}.pdf"
-    if not receipt_path.exists():
+    # Links stay valid as long as the receipt row exists: the PDF file is
+    # only a cache and is rebuilt (byte-identical) when it has been evicted.
+    if not DOWNLOAD_TOKEN_RE.match(token):
         abort(404, description="受領書PDFが見つかりません。再度寄付フォームからお試しください。")
+    try:
+        row = fetch_receipt_by_token(token)
+    except Exception as exc:
+        app.logger.exception("Failed to look up receipt download")
+        return jsonify({"ok": False, "error": str(exc)}), 500
+    if row is None:
+        abort(404, description="受領書PDFが見つかりません。再度寄付フォームからお試しください。")
+    try:
+        receipt_path = cached_receipt_path(receipt_fields_from_row(row))
+    except RenderBusyError as exc:
+        app.logger.warning("Receipt render rejected: %s", exc)
+        return jsonify({"ok": False, "error": str(exc)}), 503, {"Retry-After": "5"}
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    download_name = f"寄付受領書_{timestamp}.pdf"
+    if RECEIPT_ACCEL_REDIRECT_PREFIX:
+        return accel_redirect_response(receipt_path, download_name, f"receipt_{timestamp}.pdf")
     return send_file(
         receipt_path,
         as_attachment=True,
-        download_name=f"寄付受領書_{timestamp}.pdf",
+        download_name=download_name,
         mimetype="application/pdf",
     )
 
 
+def accel_redirect_response(receipt_path: Path, download_name: str, ascii_name: str) -> Response:
+    # The gunicorn worker is released as soon as the headers are sent; nginx
+    # streams the body to slow clients.
+    relative_path = receipt_path.relative_to(RECEIPT_DIR).as_posix()
+    response = Response(status=200, mimetype="application/pdf")
+    response.headers["X-Accel-Redirect"] = f"{RECEIPT_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(relative_path)}"
+    response.headers["Content-Disposition"] = (
+        f"attachment; filename=\"{ascii_name}\"; "
+        f"filename*=UTF-8''{quote(download_name)}"
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.cli.command("receipts-sweep")
+def receipts_sweep_command():
+    """Evict cached receipt PDFs beyond RECEIPT_CACHE_MAX_MB (least recently used first)."""
+    removed = receipt_cache.prune()
+    click.echo(f"removed: {removed}")
+
+
+@app.cli.command("idempotency-purge")
+def idempotency_purge_command():
+    """Forget /submit idempotency keys older than IDEMPOTENCY_RETENTION_DAYS."""
+    conn = open_db_connection()
+    try:
+        removed = idempotency.purge_expired(conn, IDEMPOTENCY_RETENTION_DAYS)
+    finally:
+        conn.close()
+    click.echo(f"removed: {removed}")
+
+
+@app.cli.command("build-static")
+@click.option(
+    "--out",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Output directory (default: STATIC_BUILD_DIR).",
+)
+def build_static_command(out):
+    """Fingerprint and precompress the public site for nginx."""
+    static_build.build_site(BASE_DIR.parent, out or STATIC_BUILD_DIR, log=click.echo)
+
+
 @app.route("/admin/login", methods=["GET", "POST"])
 @app.route("/donation/admin/login", methods=["GET", "POST"])
 def admin_login():
@@ -503,59 +804,373 @@ def admin_logout():
 @app.route("/donation/admin", methods=["GET"])
 @require_dashboard_login
 def admin_dashboard():
+    current_user = session.get("dashboard_user", "")
+    query = request.args.get("q", "").strip()
+    if query:
+        return admin_dashboard_search(current_user, query)
+    try:
+        filters = receipt_queries.parse_filters(request.args, ALLOWED_PAYMENT_METHODS)
+        before_id = parse_cursor_arg("before")
+        after_id = parse_cursor_arg("after")
+    except ValueError as exc:
+        return render_dashboard(current_user=current_user, filters={}, db_error=str(exc)), 400
+
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         ensure_receipts_table(conn)
         with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) AS total FROM donation_receipts WHERE is_deleted=0")
-            total = cur.fetchone()["total"]
-            cur.execute(
-                """
-                SELECT
-                    id,
-                    certificate_no,
-                    donor_name,
-                    donor_postal_code,
-                    donor_address,
-                    donor_email,
-                    amount_yen,
-                    payment_method,
-                    status,
-                    is_checked,
-                    checked_at,
-                    checked_by,
-                    is_deleted,
-                    deleted_at,
-                    deleted_by,
-                    donated_at,
-                    created_at
-                FROM donation_receipts
-                WHERE is_deleted=0
-                ORDER BY id DESC
-                LIMIT 100
-                """
-            )
-            rows = cur.fetchall()
+            total = counters.count_for_filters(counters.read_counters(cur), filters)
+            total_capped = False
+            if total is None:
+                total, total_capped = receipt_queries.count_capped(cur, filters)
+            page = receipt_queries.fetch_page(cur, filters, before_id=before_id, after_id=after_id)
+        conn.commit()
     except Exception as exc:
-        return render_template(
-            "admin_dashboard.html",
-            total=0,
-            rows=[],
-            current_user=session.get("dashboard_user", ""),
-            db_error=str(exc),
-        )
+        return render_dashboard(current_user=current_user, filters=filters, db_error=str(exc))
+    finally:
+        if conn:
+            conn.close()
+
+    return render_dashboard(
+        current_user=current_user,
+        filters=filters,
+        total=total,
+        total_capped=total_capped,
+        page=page,
+    )
+
+
+def admin_dashboard_search(current_user: str, query: str):
+    conn = None
+    try:
+        conn = get_db_read_connection()
+        ensure_receipts_table(conn)
+        with conn.cursor() as cur:
+            rows = search_receipts(cur, query, receipt_queries.DASHBOARD_COLUMNS)
+        conn.commit()
+    except Exception as exc:
+        return render_dashboard(current_user=current_user, filters={}, query=query, db_error=str(exc))
+    finally:
+        if conn:
+            conn.close()
+
+    page = {"rows": rows, "has_newer": False, "has_older": False, "newest_id": None, "oldest_id": None}
+    return render_dashboard(current_user=current_user, filters={}, query=query, total=len(rows), page=page)
+
+
+@app.route("/admin/search.json", methods=["GET"])
+@app.route("/donation/admin/search.json", methods=["GET"])
+@require_dashboard_login
+def admin_search_json():
+    query = request.args.get("q", "").strip()
+    try:
+        limit = min(max(int(request.args.get("limit", "20")), 1), 100)
+    except ValueError:
+        return jsonify({"ok": False, "error": "limit は整数で指定してください。"}), 400
+    conn = None
+    try:
+        conn = get_db_read_connection()
+        ensure_receipts_table(conn)
+        with conn.cursor() as cur:
+            rows = search_receipts(cur, query, receipt_queries.DASHBOARD_COLUMNS, limit=limit)
+        conn.commit()
+        return jsonify({"ok": True, "q": query, "rows": rows}), 200
+    except Exception as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 500
     finally:
         if conn:
             conn.close()
 
+
+def parse_cursor_arg(name: str) -> int | None:
+    value = request.args.get(name, "").strip()
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValueError("ページ指定が不正です。")
+    return int(value)
+
+
+def dashboard_url(filters: dict, **cursor) -> str:
+    query = urlencode({**filters, **{key: value for key, value in cursor.items() if value is not None}})
+    return f"{public_admin_path()}?{query}" if query else public_admin_path()
+
+
+def export_url(fmt: str, filters: dict) -> str:
+    path = public_admin_path(f"/export.{fmt}")
+    query = urlencode(filters)
+    return f"{path}?{query}" if query else path
+
+
+def render_dashboard(
+    current_user: str,
+    filters: dict,
+    total: int = 0,
+    total_capped: bool = False,
+    page: dict | None = None,
+    query: str = "",
+    db_error: str | None = None,
+):
+    page = page or {"rows": [], "has_newer": False, "has_older": False, "newest_id": None, "oldest_id": None}
     return render_template(
         "admin_dashboard.html",
         total=total,
-        rows=rows,
-        current_user=session.get("dashboard_user", ""),
-        db_error=None,
+        total_capped=total_capped,
+        rows=page["rows"],
+        newer_url=dashboard_url(filters, after=page["newest_id"]) if page["has_newer"] else None,
+        older_url=dashboard_url(filters, before=page["oldest_id"]) if page["has_older"] else None,
+        filters=filters,
+        query=query,
+        export_csv_url=export_url("csv", filters),
+        export_xlsx_url=export_url("xlsx", filters),
+        statuses=receipt_queries.RECEIPT_STATUSES,
+        payment_methods=sorted(ALLOWED_PAYMENT_METHODS),
+        current_user=current_user,
+        notice=session.pop("dashboard_notice", None),
+        return_query=request.query_string.decode("utf-8", "replace"),
+        db_error=db_error,
+    )
+
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", export.iter_csv),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", export.iter_xlsx),
+}
+
+
+@app.route("/admin/export.<fmt>", methods=["GET"])
+@app.route("/donation/admin/export.<fmt>", methods=["GET"])
+@require_dashboard_login
+def admin_export(fmt: str):
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    if fmt == "xlsx" and export.openpyxl is None:
+        return jsonify({"ok": False, "error": "XLSX出力には openpyxl のインストールが必要です。"}), 501
+    try:
+        filters = receipt_queries.parse_filters(request.args, ALLOWED_PAYMENT_METHODS)
+    except ValueError as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 400
+
+    # A dedicated connection: the unbuffered cursor keeps it busy for the
+    # whole download, which must not starve the request pool.
+    mimetype, encode = EXPORT_FORMATS[fmt]
+    rows = export.iter_export_rows(export_connection_factory(), filters)
+    filename = f"donation_receipts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return Response(
+        encode(rows),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-store",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@app.cli.command("export-receipts")
+@click.option("--format", "fmt", type=click.Choice(sorted(EXPORT_FORMATS)), default="csv")
+@click.option("--out", type=click.Path(dir_okay=False), required=True, help="Output file ('-' for stdout, CSV only).")
+@click.option("--status", default="")
+@click.option("--payment-method", default="")
+@click.option("--is-checked", default="")
+@click.option("--donated-from", default="")
+@click.option("--donated-to", default="")
+def export_receipts_command(fmt, out, status, payment_method, is_checked, donated_from, donated_to):
+    """Export active receipts matching the dashboard filters as CSV or XLSX."""
+    filters = receipt_queries.parse_filters(
+        {
+            "status": status,
+            "payment_method": payment_method,
+            "is_checked": is_checked,
+            "donated_from": donated_from,
+            "donated_to": donated_to,
+        },
+        ALLOWED_PAYMENT_METHODS,
+    )
+    rows = export.iter_export_rows(open_db_connection, filters)
+    if out == "-":
+        if fmt != "csv":
+            raise click.UsageError("stdout output is only supported for CSV.")
+        stream = click.get_binary_stream("stdout")
+        for chunk in export.iter_csv(rows):
+            stream.write(chunk)
+        return
+    with open(out, "wb") as fh:
+        if fmt == "xlsx":
+            export.write_xlsx(rows, fh)
+        else:
+            for chunk in export.iter_csv(rows):
+                fh.write(chunk)
+    click.echo(f"wrote {out}")
+
+
+report_cache = reports.TTLCache(REPORT_CACHE_TTL)
+
+
+def load_donation_report(args) -> dict:
+    filters = receipt_queries.parse_filters(
+        {"donated_from": args.get("donated_from", ""), "donated_to": args.get("donated_to", "")},
+        ALLOWED_PAYMENT_METHODS,
+    )
+    start, end = reports.report_range(filters.get("donated_from"), filters.get("donated_to"))
+
+    def compute() -> dict:
+        conn = None
+        try:
+            conn = get_db_read_connection()
+            ensure_receipts_table(conn)
+            with conn.cursor() as cur:
+                report = reports.donation_report(cur, start, end)
+            conn.commit()
+            report["generated_at"] = datetime.now().isoformat(timespec="seconds")
+            return report
+        finally:
+            if conn:
+                conn.close()
+
+    return report_cache.get_or_compute((start, end), compute)
+
+
+@app.route("/admin/reports", methods=["GET"])
+@app.route("/donation/admin/reports", methods=["GET"])
+@require_dashboard_login
+def admin_reports():
+    current_user = session.get("dashboard_user", "")
+    try:
+        report = load_donation_report(request.args)
+    except ValueError as exc:
+        return render_template("admin_reports.html", report=None, current_user=current_user, error=str(exc)), 400
+    except Exception as exc:
+        return render_template("admin_reports.html", report=None, current_user=current_user, error=str(exc))
+    return render_template("admin_reports.html", report=report, current_user=current_user, error=None)
+
+
+@app.route("/admin/reports.json", methods=["GET"])
+@app.route("/donation/admin/reports.json", methods=["GET"])
+@require_dashboard_login
+def admin_reports_json():
+    try:
+        report = load_donation_report(request.args)
+    except ValueError as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 400
+    except Exception as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 500
+    return jsonify({"ok": True, **report}), 200
+
+
+@app.route("/admin/import", methods=["GET", "POST"])
+@app.route("/donation/admin/import", methods=["GET", "POST"])
+@require_dashboard_login
+def admin_import():
+    current_user = session.get("dashboard_user", "")
+    if request.method == "GET":
+        return render_template("admin_import.html", current_user=current_user, result=None, error=None)
+
+    def failed(message: str, status: int = 400):
+        return render_template("admin_import.html", current_user=current_user, result=None, error=message), status
+
+    upload = request.files.get("file")
+    if upload is None or not upload.filename:
+        return failed("CSVファイルを選択してください。")
+    data = upload.read(int(IMPORT_MAX_MB * 1024 * 1024) + 1)
+    if len(data) > IMPORT_MAX_MB * 1024 * 1024:
+        return failed(f"ファイルが大きすぎます（上限 {IMPORT_MAX_MB:g}MB）。", 413)
+    dry_run = request.form.get("dry_run") == "1"
+    skip_invalid = request.form.get("skip_invalid") == "1"
+    try:
+        donations, errors = receipt_import.parse_import_csv(
+            data, ALLOWED_PAYMENT_METHODS, datetime.now().replace(microsecond=0)
+        )
+    except ValueError as exc:
+        return failed(str(exc))
+
+    result = {
+        "filename": upload.filename,
+        "valid": len(donations),
+        "errors": errors[:IMPORT_ERROR_DISPLAY_LIMIT],
+        "error_count": len(errors),
+        "imported": 0,
+        "dry_run": dry_run,
+        "first_certificate_no": None,
+        "last_certificate_no": None,
+    }
+    if dry_run or (errors and not skip_invalid) or not donations:
+        return render_template("admin_import.html", current_user=current_user, result=result, error=None)
+
+    conn = None
+    error = None
+    try:
+        conn = get_db_connection()
+        ensure_receipts_table(conn)
+        result["imported"] = receipt_import.import_donations(conn, donations)
+    except receipt_import.ImportFailed as exc:
+        app.logger.exception("Donation import failed")
+        result["imported"] = exc.imported
+        error = str(exc)
+    except Exception as exc:
+        error = str(exc)
+    finally:
+        if conn:
+            conn.close()
+    if result["imported"]:
+        result["first_certificate_no"] = donations[0]["certificate_no"]
+        result["last_certificate_no"] = donations[result["imported"] - 1]["certificate_no"]
+        report_cache.clear()
+        stick_to_primary()
+    return render_template("admin_import.html", current_user=current_user, result=result, error=error)
+
+
+@app.cli.command("explain-dashboard")
+@click.option("--status", default="")
+@click.option("--payment-method", default="")
+@click.option("--is-checked", default="")
+@click.option("--donated-from", default="")
+@click.option("--donated-to", default="")
+@click.option("--before", type=int, default=None, help="Explain the page of ids below this one.")
+def explain_dashboard_command(status, payment_method, is_checked, donated_from, donated_to, before):
+    """Print the MySQL query plan for a dashboard page with the given filters."""
+    filters = receipt_queries.parse_filters(
+        {
+            "status": status,
+            "payment_method": payment_method,
+            "is_checked": is_checked,
+            "donated_from": donated_from,
+            "donated_to": donated_to,
+        },
+        ALLOWED_PAYMENT_METHODS,
     )
+    sql, params = receipt_queries.page_query(filters, before_id=before)
+    conn = open_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"EXPLAIN {sql}", params)
+            plan = cur.fetchall()
+    finally:
+        conn.close()
+    for row in plan:
+        click.echo(
+            f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']} extra={row.get('Extra') or ''}"
+        )
+        if row["type"] == "ALL":
+            click.echo("warning: full table scan; run `flask --app app db-migrate` to add the dashboard indexes")
+
+
+@app.cli.command("reconcile-counters")
+@click.option("--fix", is_flag=True, help="Add the drift back so the counters match the table.")
+def reconcile_counters_command(fix: bool):
+    """Recount donation_receipts and report drift in receipt_counters."""
+    conn = open_db_connection()
+    try:
+        drift = counters.reconcile(conn, fix=fix, log=click.echo)
+    finally:
+        conn.close()
+    if not drift:
+        click.echo("counters match")
+    elif fix:
+        click.echo(f"fixed {len(drift)} counters")
+    else:
+        raise SystemExit(1)
 
 
 @app.route("/admin/confirm/<int:receipt_id>", methods=["POST"])
@@ -568,7 +1183,7 @@ def admin_confirm(receipt_id: int):
     try:
         conn = get_db_connection()
         ensure_receipts_table(conn)
-        with conn.cursor() as cur:
+        with conn.cursor() as cur, counters.track_receipt_change(cur, receipt_id):
             if checked:
                 cur.execute(
                     """
@@ -588,6 +1203,7 @@ def admin_confirm(receipt_id: int):
                     (receipt_id,),
                 )
         conn.commit()
+        stick_to_primary()
     except Exception as exc:
         return jsonify({"ok": False, "error": str(exc)}), 500
     finally:
@@ -606,7 +1222,7 @@ def admin_delete(receipt_id: int):
     try:
         conn = get_db_connection()
         ensure_receipts_table(conn)
-        with conn.cursor() as cur:
+        with conn.cursor() as cur, counters.track_receipt_change(cur, receipt_id):
             cur.execute(
                 """
                 UPDATE donation_receipts
@@ -616,6 +1232,7 @@ def admin_delete(receipt_id: int):
                 (current_user, receipt_id),
             )
         conn.commit()
+        stick_to_primary()
     except Exception as exc:
         return jsonify({"ok": False, "error": str(exc)}), 500
     finally:
@@ -625,6 +1242,107 @@ def admin_delete(receipt_id: int):
     return redirect(public_admin_path())
 
 
+BULK_ACTION_MAX_IDS = 1000
+
+
+def parse_bulk_ids() -> list[int]:
+    ids = sorted({int(value) for value in request.form.getlist("ids") if value.strip().isdigit()})
+    if not ids:
+        raise ValueError("対象の寄付を選択してください。")
+    if len(ids) > BULK_ACTION_MAX_IDS:
+        raise ValueError(f"一度に操作できるのは{BULK_ACTION_MAX_IDS}件までです。")
+    return ids
+
+
+def bulk_return_path() -> str:
+    # Back to the page (filters and cursor) the action was submitted from.
+    query = request.form.get("return_query", "").lstrip("?")
+    return f"{public_admin_path()}?{query}" if query else public_admin_path()
+
+
+@app.route("/admin/bulk/confirm", methods=["POST"])
+@app.route("/donation/admin/bulk/confirm", methods=["POST"])
+@require_dashboard_login
+def admin_bulk_confirm():
+    checked = request.form.get("checked", "1") == "1"
+    current_user = session.get("dashboard_user", "")
+    conn = None
+    try:
+        ids = parse_bulk_ids()
+        placeholders = ", ".join(["%s"] * len(ids))
+        conn = get_db_connection()
+        ensure_receipts_table(conn)
+        with conn.cursor() as cur, counters.track_receipt_changes(cur, ids):
+            if checked:
+                cur.execute(
+                    f"""
+                    UPDATE donation_receipts
+                    SET is_checked=1, checked_at=NOW(), checked_by=%s
+                    WHERE id IN ({placeholders}) AND is_deleted=0 AND is_checked=0
+                    """,
+                    (current_user, *ids),
+                )
+            else:
+                cur.execute(
+                    f"""
+                    UPDATE donation_receipts
+                    SET is_checked=0, checked_at=NULL, checked_by=NULL
+                    WHERE id IN ({placeholders}) AND is_deleted=0 AND is_checked=1
+                    """,
+                    ids,
+                )
+            affected = cur.rowcount
+        conn.commit()
+        stick_to_primary()
+    except ValueError as exc:
+        session["dashboard_notice"] = str(exc)
+        return redirect(bulk_return_path())
+    except Exception as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+    label = "確認済みにしました" if checked else "確認を外しました"
+    session["dashboard_notice"] = f"{len(ids)}件中{affected}件を{label}。"
+    return redirect(bulk_return_path())
+
+
+@app.route("/admin/bulk/delete", methods=["POST"])
+@app.route("/donation/admin/bulk/delete", methods=["POST"])
+@require_dashboard_login
+def admin_bulk_delete():
+    current_user = session.get("dashboard_user", "")
+    conn = None
+    try:
+        ids = parse_bulk_ids()
+        conn = get_db_connection()
+        ensure_receipts_table(conn)
+        with conn.cursor() as cur, counters.track_receipt_changes(cur, ids):
+            cur.execute(
+                f"""
+                UPDATE donation_receipts
+                SET is_deleted=1, deleted_at=NOW(), deleted_by=%s
+                WHERE id IN ({', '.join(['%s'] * len(ids))}) AND is_deleted=0
+                """,
+                (current_user, *ids),
+            )
+            affected = cur.rowcount
+        conn.commit()
+        stick_to_primary()
+    except ValueError as exc:
+        session["dashboard_notice"] = str(exc)
+        return redirect(bulk_return_path())
+    except Exception as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+    session["dashboard_notice"] = f"{len(ids)}件中{affected}件を削除しました。"
+    return redirect(bulk_return_path())
+
+
 @app.route("/admin/edit/<int:receipt_id>", methods=["GET", "POST"])
 @app.route("/donation/admin/edit/<int:receipt_id>", methods=["GET", "POST"])
 @require_dashboard_login
@@ -638,7 +1356,8 @@ def admin_edit(receipt_id: int):
 
     conn = None
     try:
-        conn = get_db_connection()
+        # The form is read from the replica; saving goes to the primary.
+        conn = get_db_connection() if request.method == "POST" else get_db_read_connection()
         ensure_receipts_table(conn)
         with conn.cursor() as cur:
             if request.method == "POST":
@@ -666,38 +1385,51 @@ def admin_edit(receipt_id: int):
                 if payment_method not in ALLOWED_PAYMENT_METHODS:
                     raise ValueError("支払方法は 現金 / 振込 / クレジットカード から選択してください。")
 
+                amount_value = parse_amount_yen(amount_yen)
+                search = search_columns(donor_name, donor_email, donor_postal_code)
                 donated_at = parse_dt(donated_at_raw)
                 created_at = parse_dt(created_at_raw)
 
-                cur.execute(
-                    """
-                    UPDATE donation_receipts
-                    SET
-                        donor_name=%s,
-                        donor_postal_code=%s,
-                        donor_address=%s,
-                        donor_email=%s,
-                        amount_yen=%s,
-                        payment_method=%s,
-                        status=%s,
-                        donated_at=%s,
-                        created_at=%s
-                    WHERE id=%s AND is_deleted=0
-                    """,
-                    (
-                        donor_name,
-                        donor_postal_code,
-                        donor_address,
-                        donor_email,
-                        amount_yen,
-                        payment_method,
-                        status,
-                        donated_at,
-                        created_at,
-                        receipt_id,
-                    ),
-                )
+                with counters.track_receipt_change(cur, receipt_id):
+                    cur.execute(
+                        """
+                        UPDATE donation_receipts
+                        SET
+                            donor_name=%s,
+                            donor_postal_code=%s,
+                            donor_address=%s,
+                            donor_email=%s,
+                            amount_yen=%s,
+                            amount_value=%s,
+                            amount_invalid=0,
+                            search_name=%s,
+                            search_email=%s,
+                            search_postal=%s,
+                            payment_method=%s,
+                            status=%s,
+                            donated_at=%s,
+                            created_at=%s
+                        WHERE id=%s AND is_deleted=0
+                        """,
+                        (
+                            donor_name,
+                            donor_postal_code,
+                            donor_address,
+                            donor_email,
+                            amount_yen,
+                            amount_value,
+                            search["search_name"],
+                            search["search_email"],
+                            search["search_postal"],
+                            payment_method,
+                            status,
+                            donated_at,
+                            created_at,
+                            receipt_id,
+                        ),
+                    )
                 conn.commit()
+                stick_to_primary()
                 return redirect(public_admin_path())
 
             cur.execute(
@@ -760,17 +1492,31 @@ def db_check():
             conn.close()
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    # ProxyFix has already replaced remote_addr with the client behind nginx.
+    if request.remote_addr not in METRICS_ALLOWED_IPS:
+        abort(403)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/db-check/pool", methods=["GET"])
+def db_check_pool():
+    router = get_db_read_router()
+    replica = router.stats() if router is not None else None
+    return jsonify({"ok": True, "pid": os.getpid(), "pool": get_db_pool().stats(), "replica": replica}), 200
+
+
 @app.route("/db-check/receipts", methods=["GET"])
 def db_check_receipts():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         ensure_receipts_table(conn)
         with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) AS total FROM donation_receipts WHERE is_deleted=0")
-            total = cur.fetchone()["total"]
-            cur.execute("SELECT COUNT(*) AS total_deleted FROM donation_receipts WHERE is_deleted=1")
-            total_deleted = cur.fetchone()["total_deleted"]
+            counter_values = counters.read_counters(cur)
+            total = counter_values.get("active", 0)
+            total_deleted = counter_values.get("deleted", 0)
 
             cur.execute(
                 """
@@ -808,108 +1554,228 @@ def db_check_receipts():
             conn.close()
 
 
+def log_submit_stage(stage: str, seconds: float) -> None:
+    app.logger.info("submit stage %s: %.1f ms", stage, seconds * 1000)
+
+
+def record_submit_stage(stage: str, seconds: float) -> None:
+    metrics.observe("donation_submit_stage_seconds", seconds, {"stage": stage})
+
+
+# Called as hook(stage, seconds) for connect / ensure_schema / idempotency /
+# allocate / render / persist.
+SUBMIT_STAGE_HOOKS: list[Callable[[str, float], None]] = [record_submit_stage]
+if SUBMIT_TIMING_LOG:
+    SUBMIT_STAGE_HOOKS.append(log_submit_stage)
+
+
 @app.route("/submit", methods=["POST"])
 @app.route("/submit/", methods=["POST"])
 @app.route("/donation/submit", methods=["POST"])
 @app.route("/donation/submit/", methods=["POST"])
 def submit():
-    name = request.form.get("name", "匿名").strip() or "匿名"
-    postal_code = request.form.get("postal_code", "").strip()
-    address = request.form.get("address", "").strip()
-    email = request.form.get("email", "").strip()
-    amount = request.form.get("amount", "").strip()
-    payment_method = request.form.get("payment_method", "未指定").strip() or "未指定"
-
-    if not postal_code or not address or not email or not amount:
-        abort(400, description="postal_code / address / email / amount は必須です。")
-    if payment_method not in ALLOWED_PAYMENT_METHODS:
-        abort(400, description="payment_method は 現金 / 振込 / クレジットカード のみ指定できます。")
-
-    donated_at = datetime.now()
-
+    try:
+        donation = validate_donation(request.form, ALLOWED_PAYMENT_METHODS)
+    except ValueError as exc:
+        abort(400, description=str(exc))
+    # Set by index.html once per form view; a double click or a browser
+    # retry repeats it. Forms cached from before it existed send none.
+    idempotency_key = request.form.get("idempotency_key", "").strip()
+    if idempotency_key and not idempotency.KEY_RE.match(idempotency_key):
+        abort(400, description="送信キーが不正です。ページを再読み込みしてから送信してください。")
+    fingerprint = idempotency.request_fingerprint(donation)
+    if idempotency_key:
+        cached = submit_results.get(idempotency_key)
+        if cached is not None:
+            try:
+                return replay_submit(cached, fingerprint, "cache")
+            except idempotency.KeyReused as exc:
+                abort(422, description=str(exc))
+    try:
+        slot = admit_submit()
+    except admission.Overloaded as exc:
+        return jsonify({"ok": False, "error": str(exc)}), exc.status, {"Retry-After": str(exc.retry_after)}
+    name = donation["name"]
+    postal_code = donation["postal_code"]
+    address = donation["address"]
+    email = donation["email"]
+    amount = donation["amount"]
+    payment_method = donation["payment_method"]
+    amount_value = donation["amount_value"]
+
+    # DATETIME keeps whole seconds; match it so the emailed PDF is identical
+    # to one regenerated from the row later.
+    donated_at = datetime.now().replace(microsecond=0)
+    timer = StageTimer(SUBMIT_STAGE_HOOKS)
+
+    # allocate (own commit) -> render -> persist (one commit for the receipt
+    # row, its download token and the outbox message), all on one
+    # pooled connection. The outbox worker later moves the receipt from
+    # "created" to "issued", or to "mail_failed" while retries are pending.
     conn = None
+    locked = False
     try:
-        conn = get_db_connection()
-        ensure_receipts_table(conn)
-        receipt_id, certificate_no = create_receipt_record(
-            conn=conn,
-            name=name,
-            postal_code=postal_code,
-            address=address,
-            email=email,
-            amount=amount,
-            payment_method=payment_method,
-            donated_at=donated_at,
-        )
+        with timer.stage("connect"):
+            conn = get_db_connection()
+        with timer.stage("ensure_schema"):
+            ensure_receipts_table(conn)
+        if idempotency_key:
+            # A concurrent duplicate blocks here until the first one is done.
+            with timer.stage("idempotency"):
+                idempotency.acquire_lock(conn, idempotency_key, IDEMPOTENCY_LOCK_TIMEOUT)
+                locked = True
+                with conn.cursor() as cur:
+                    previous = idempotency.find_result(cur, idempotency_key)
+                conn.commit()
+            if previous is not None:
+                submit_results.put(idempotency_key, previous)
+                return replay_submit(previous, fingerprint, "db")
+        with timer.stage("allocate"):
+            certificate_no = allocate_certificate_no(conn, donated_at)
+
+        try:
+            with timer.stage("render"):
+                pdf_bytes = build_receipt_pdf(
+                    name=name,
+                    address=address,
+                    amount=amount,
+                    payment_method=payment_method,
+                    donated_at=donated_at,
+                    certificate_no=certificate_no,
+                )
+        except RenderBusyError as exc:
+            app.logger.warning("Receipt render rejected: %s", exc)
+            metrics.inc("donation_receipt_render_rejected_total")
+            return jsonify({"ok": False, "error": str(exc)}), 503, {"Retry-After": "5"}
+
+        credit_card_input_url = build_credit_card_input_url(certificate_no)
+        token = uuid4().hex
+
+        with timer.stage("persist"):
+            with conn.cursor() as cur:
+                receipt_id = insert_receipt_record(
+                    cur,
+                    certificate_no=certificate_no,
+                    name=name,
+                    postal_code=postal_code,
+                    address=address,
+                    email=email,
+                    amount=amount,
+                    payment_method=payment_method,
+                    donated_at=donated_at,
+                    download_token=token,
+                    amount_value=amount_value,
+                )
+                enqueue_receipt_email(
+                    cur,
+                    receipt_id=receipt_id,
+                    name=name,
+                    email=email,
+                    pdf_bytes=pdf_bytes,
+                    payment_method=payment_method,
+                    credit_card_input_url=credit_card_input_url,
+                )
+                if idempotency_key:
+                    idempotency.record_result(cur, idempotency_key, fingerprint, receipt_id)
+            conn.commit()
+    except idempotency.SubmitInProgress as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 409, {"Retry-After": "5"}
+    except idempotency.KeyReused as exc:
+        abort(422, description=str(exc))
     except Exception as exc:
-        app.logger.exception("Failed to create receipt record")
+        app.logger.exception("Failed to register donation receipt")
         return jsonify({"ok": False, "error": str(exc)}), 500
     finally:
         if conn:
+            if locked:
+                try:
+                    idempotency.release_lock(conn, idempotency_key)
+                except Exception:
+                    # MySQL drops the lock with the session if the connection is gone.
+                    app.logger.exception("Failed to release submit idempotency lock")
+            # Always hand the connection back, or the pool slot leaks.
             try:
                 conn.close()
             except Exception:
                 pass
+        if slot is not None:
+            submit_slots.release(slot)
+
+    result = {
+        "fingerprint": fingerprint,
+        "name": name,
+        "token": token,
+        "certificate_no": certificate_no,
+        "payment_method": payment_method,
+    }
+    if idempotency_key:
+        submit_results.put(idempotency_key, result)
+    return submit_response(result)
+
+
+submit_results = idempotency.ResultCache(IDEMPOTENCY_CACHE_TTL)
+submit_buckets = (
+    admission.TokenBucketStore(ADMISSION_DIR, SUBMIT_RATE_PER_MINUTE / 60, SUBMIT_RATE_BURST)
+    if SUBMIT_RATE_PER_MINUTE > 0
+    else None
+)
+submit_slots = (
+    admission.SlotLimiter(ADMISSION_DIR, SUBMIT_MAX_IN_FLIGHT, wait=SUBMIT_QUEUE_WAIT)
+    if SUBMIT_MAX_IN_FLIGHT > 0
+    else None
+)
 
-    pdf_bytes = build_receipt_pdf(
-        name=name,
-        address=address,
-        amount=amount,
-        payment_method=payment_method,
-        donated_at=donated_at,
-        certificate_no=certificate_no,
-    )
 
-    credit_card_input_url = build_credit_card_input_url(certificate_no)
+def admit_submit() -> int | None:
+    """Apply the per-IP rate limit, then take one of the in-flight slots.
 
-    try:
-        send_receipt_email(
-            name=name,
-            email=email,
-            pdf_bytes=pdf_bytes,
-            payment_method=payment_method,
-            credit_card_input_url=credit_card_input_url,
-        )
-    except Exception as exc:
-        app.logger.exception("Failed to send receipt email")
-        conn = None
+    Returns the slot to release when the submission is done (None when
+    the limit is off), or raises admission.Overloaded: 429 for a client
+    over its rate, 503 when every slot stayed busy for SUBMIT_QUEUE_WAIT
+    seconds. If the admission files cannot be used, the request is let
+    through rather than failing the donation.
+    """
+    if submit_buckets is not None:
         try:
-            conn = get_db_connection()
-            update_receipt_status(conn, receipt_id=receipt_id, status="mail_failed")
-        except Exception:
-            pass
-        finally:
-            if conn:
-                try:
-                    conn.close()
-                except Exception:
-                    pass
-        return jsonify({"ok": False, "error": str(exc)}), 502
-
-    token = save_receipt(pdf_bytes)
-    conn = None
+            wait = submit_buckets.take(f"submit:{request.remote_addr}")
+        except (OSError, sqlite3.Error):
+            app.logger.exception("Submit rate limit unavailable")
+            wait = 0.0
+        if wait > 0:
+            metrics.inc("donation_submit_shed_total", {"reason": "rate_limit"})
+            raise admission.Overloaded(
+                "短時間に送信が集中しています。しばらくしてから再度お試しください。", retry_after=wait, status=429
+            )
+    if submit_slots is None:
+        return None
     try:
-        conn = get_db_connection()
-        update_receipt_status(conn, receipt_id=receipt_id, status="issued", token=token)
-    except Exception:
-        app.logger.exception("Failed to update receipt status")
-    finally:
-        if conn:
-            try:
-                conn.close()
-            except Exception:
-                pass
+        return submit_slots.acquire()
+    except admission.Overloaded:
+        metrics.inc("donation_submit_shed_total", {"reason": "concurrency"})
+        raise
+    except OSError:
+        app.logger.exception("Submit concurrency limit unavailable")
+        return None
 
-    payment_kind = normalize_payment_method(payment_method)
+
+def replay_submit(result: dict, fingerprint: str, source: str):
+    """Answer a repeated submission with the original result, doing no work."""
+    idempotency.check_fingerprint(result, fingerprint)
+    metrics.inc("donation_submit_replayed_total", {"source": source})
+    return submit_response(result)
+
+
+def submit_response(result: dict):
+    payment_kind = normalize_payment_method(result["payment_method"])
     if payment_kind == "credit_card":
-        return redirect(credit_card_input_url)
+        return redirect(build_credit_card_input_url(result["certificate_no"]))
 
     return render_template(
         "thanks.html",
-        name=name,
-        token=token,
-        certificate_no=certificate_no,
-        payment_method=payment_method,
+        name=result["name"],
+        token=result["token"],
+        certificate_no=result["certificate_no"],
+        payment_method=result["payment_method"],
         payment_kind=payment_kind,
         bank_transfer_info=BANK_TRANSFER_INFO,
     )
@@ -922,5 +1788,363 @@ def credit_card_input_page():
     return render_template("credit_card.html", certificate_no=certificate_no)
 
 
+@app.cli.command("outbox-worker")
+@click.option("--once", is_flag=True, help="Exit when no due messages remain.")
+def outbox_worker_command(once: bool):
+    """Deliver queued emails from email_outbox."""
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    smtp_bucket = None
+    if OUTBOX_SEND_RATE_PER_MINUTE > 0:
+        smtp_bucket = admission.TokenBucketStore(ADMISSION_DIR, OUTBOX_SEND_RATE_PER_MINUTE / 60, OUTBOX_SEND_BURST)
+
+    def throttle() -> None:
+        # Stay under the provider's limit instead of collecting retries; shared
+        # by every outbox worker on this host.
+        try:
+            smtp_bucket.wait("smtp", stop_event)
+        except (OSError, sqlite3.Error) as exc:
+            click.echo(f"outbox send rate limit unavailable: {exc}")
+    outbox.run_worker(
+        get_db_connection,
+        build_smtp_session(),
+        FROM_MAIL,
+        stage_hooks=[lambda stage, seconds: metrics.observe("donation_email_stage_seconds", seconds, {"stage": stage})],
+        outcome_hook=lambda outcome: metrics.inc("donation_email_messages_total", {"outcome": outcome}),
+        throttle=throttle if smtp_bucket is not None else None,
+        poll_interval=OUTBOX_POLL_INTERVAL,
+        once=once,
+        stop_event=stop_event,
+        log=click.echo,
+        batch_size=OUTBOX_BATCH_SIZE,
+        max_attempts=OUTBOX_MAX_ATTEMPTS,
+        retry_base=OUTBOX_RETRY_BASE,
+        retry_max=OUTBOX_RETRY_MAX,
+    )
+
+
+@app.cli.command("outbox-requeue")
+def outbox_requeue_command():
+    """Retry dead outbox rows and re-send receipts left in mail_failed."""
+    conn = get_db_connection()
+    try:
+        ensure_receipts_table(conn)
+        requeued = outbox.requeue_dead(conn)
+        # Receipts that failed before the outbox existed have no outbox row;
+        # render their PDF again from the stored fields.
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT r.id, r.certificate_no, r.donor_name, r.donor_address, r.donor_email,
+                       r.amount_yen, r.payment_method, r.donated_at
+                FROM donation_receipts r
+                LEFT JOIN email_outbox o ON o.receipt_id = r.id
+                WHERE r.status='mail_failed' AND r.is_deleted=0 AND o.id IS NULL
+                """
+            )
+            orphans = cur.fetchall()
+            for row in orphans:
+                pdf_bytes = build_receipt_pdf(
+                    name=row["donor_name"],
+                    address=row["donor_address"],
+                    amount=row["amount_yen"],
+                    payment_method=row["payment_method"],
+                    donated_at=row["donated_at"],
+                    certificate_no=row["certificate_no"],
+                )
+                with app.test_request_context():
+                    credit_card_input_url = build_credit_card_input_url(row["certificate_no"])
+                enqueue_receipt_email(
+                    cur,
+                    receipt_id=row["id"],
+                    name=row["donor_name"],
+                    email=row["donor_email"],
+                    pdf_bytes=pdf_bytes,
+                    payment_method=row["payment_method"],
+                    credit_card_input_url=credit_card_input_url,
+                )
+        conn.commit()
+    finally:
+        conn.close()
+    click.echo(f"requeued dead: {requeued}, enqueued mail_failed: {len(orphans)}")
+
+
+@app.cli.command("reissue-receipts")
+@click.option("--year", type=int, required=True, help="Donation year to re-render.")
+@click.option("--out", "out_dir", type=click.Path(file_okay=False, path_type=Path), required=True)
+@click.option("--workers", type=int, default=None, help="Render processes (default: all cores).")
+def reissue_receipts_command(year: int, out_dir: Path, workers: int | None):
+    """Re-render every receipt PDF of a year into a directory."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    executor = ReceiptRenderExecutor(
+        SEAL_IMAGE_PATH,
+        SIGNATURE_IMAGE_PATH,
+        image_dpi=RECEIPT_IMAGE_DPI,
+        mode="process",
+        workers=workers,
+    )
+    conn = get_db_connection()
+    started = time.monotonic()
+    count = 0
+    try:
+        ensure_receipts_table(conn)
+        jobs = (
+            {
+                "name": row["donor_name"],
+                "address": row["donor_address"],
+                "amount": row["amount_yen"],
+                "payment_method": row["payment_method"],
+                "donated_at": row["donated_at"],
+                "certificate_no": row["certificate_no"],
+            }
+            for row in bulk_mail.iter_receipt_recipients(conn, year)
+        )
+        for fields, pdf_bytes in executor.map(jobs):
+            (out_dir / f"{fields['certificate_no']}.pdf").write_bytes(pdf_bytes)
+            count += 1
+            if count % 500 == 0:
+                click.echo(f"rendered {count}")
+    finally:
+        conn.close()
+        executor.shutdown()
+    elapsed = time.monotonic() - started
+    click.echo(f"rendered {count} receipts in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.1f}/s)")
+
+
+@app.cli.command("annual-certificates")
+@click.option("--year", type=int, required=True, help="Donation year to certify.")
+@click.option("--out", "out_dir", type=click.Path(file_okay=False, path_type=Path), required=True)
+@click.option("--workers", type=int, default=None, help="Render processes (default: all cores).")
+@click.option("--per-archive", type=click.IntRange(min=1), default=annual.DONORS_PER_ARCHIVE, show_default=True)
+@click.option("--checked-only", is_flag=True, help="Only receipts confirmed on the dashboard.")
+def annual_certificates_command(year: int, out_dir: Path, workers: int | None, per_archive: int, checked_only: bool):
+    """Render one consolidated certificate per donor for a year into ZIP archives.
+
+    Rerunning with the same --out resumes after the last finished archive.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    progress = annual.AnnualProgress(out_dir / f"annual-{year}.progress")
+    if progress.donors_done:
+        click.echo(f"resuming after {progress.donors_done} donors (archive {progress.next_part})")
+    executor = ReceiptRenderExecutor(
+        SEAL_IMAGE_PATH,
+        SIGNATURE_IMAGE_PATH,
+        image_dpi=RECEIPT_IMAGE_DPI,
+        mode="process",
+        workers=workers,
+    )
+    conn = get_db_connection()
+    try:
+        ensure_receipts_table(conn)
+        report = annual.write_annual_archives(
+            annual.iter_annual_donors(conn, year, checked_only=checked_only, after_key=progress.last_key),
+            lambda jobs: executor.map(jobs, method="render_annual"),
+            out_dir,
+            year,
+            progress,
+            per_archive=per_archive,
+            log=click.echo,
+        )
+    finally:
+        conn.close()
+        executor.shutdown()
+    click.echo(json.dumps(report, ensure_ascii=False))
+
+
+@app.cli.command("import-donations")
+@click.argument("csv_path", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option("--dry-run", is_flag=True, help="Validate only; nothing is written.")
+@click.option("--skip-invalid", is_flag=True, help="Import the valid rows even if some rows have errors.")
+@click.option(
+    "--errors",
+    "errors_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Write the per-row error report to this CSV.",
+)
+@click.option(
+    "--receipts-out",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Also render a receipt PDF per imported row into this directory.",
+)
+@click.option("--workers", type=int, default=None, help="Render processes (default: all cores).")
+@click.option("--batch-size", type=click.IntRange(min=1), default=receipt_import.IMPORT_BATCH_SIZE, show_default=True)
+def import_donations_command(
+    csv_path: Path,
+    dry_run: bool,
+    skip_invalid: bool,
+    errors_path: Path | None,
+    receipts_out: Path | None,
+    workers: int | None,
+    batch_size: int,
+):
+    """Import offline donations (cash, bank transfer) from a CSV without sending mail.
+
+    Columns: name, postal_code, address, email, amount, payment_method and
+    optionally donated_at (the Japanese headers of export-receipts work too).
+    Rows are checked with the same rules as the donation form.
+    """
+    started = time.monotonic()
+    donations, errors = receipt_import.parse_import_csv(
+        csv_path.read_bytes(), ALLOWED_PAYMENT_METHODS, datetime.now().replace(microsecond=0)
+    )
+    click.echo(f"valid rows: {len(donations)}, errors: {len(errors)} ({time.monotonic() - started:.2f}s)")
+    if errors_path is not None:
+        with open(errors_path, "w", encoding="utf-8-sig", newline="") as fh:
+            receipt_import.write_error_report(errors, fh)
+    else:
+        for error in errors[:20]:
+            click.echo(f"line {error['line']}: {error['error']}", err=True)
+        if len(errors) > 20:
+            click.echo(f"... {len(errors) - 20} more (use --errors to write them all)", err=True)
+    if dry_run or not donations:
+        return
+    if errors and not skip_invalid:
+        raise click.ClickException("errors found; fix the file or rerun with --skip-invalid")
+
+    conn = get_db_connection()
+    try:
+        ensure_receipts_table(conn)
+        imported = receipt_import.import_donations(conn, donations, batch_size=batch_size, log=click.echo)
+    except receipt_import.ImportFailed as exc:
+        # Earlier batches are committed; say how far it got before failing.
+        committed = f"{exc.imported} rows were imported"
+        if exc.imported:
+            committed += f" ({donations[0]['certificate_no']} .. {donations[exc.imported - 1]['certificate_no']})"
+        raise click.ClickException(f"{exc}\n{committed}") from exc
+    finally:
+        conn.close()
+    elapsed = time.monotonic() - started
+    click.echo(
+        f"imported {imported} rows in {elapsed:.2f}s ({imported / elapsed if elapsed else 0:.0f}/s): "
+        f"{donations[0]['certificate_no']} .. {donations[-1]['certificate_no']}"
+    )
+
+    if receipts_out is None:
+        return
+    receipts_out.mkdir(parents=True, exist_ok=True)
+    executor = ReceiptRenderExecutor(
+        SEAL_IMAGE_PATH,
+        SIGNATURE_IMAGE_PATH,
+        image_dpi=RECEIPT_IMAGE_DPI,
+        mode="process",
+        workers=workers,
+    )
+    jobs = (
+        {
+            "name": donation["name"],
+            "address": donation["address"],
+            "amount": donation["amount"],
+            "payment_method": donation["payment_method"],
+            "donated_at": donation["donated_at"],
+            "certificate_no": donation["certificate_no"],
+        }
+        for donation in donations
+    )
+    started = time.monotonic()
+    count = 0
+    try:
+        for fields, pdf_bytes in executor.map(jobs):
+            (receipts_out / f"{fields['certificate_no']}.pdf").write_bytes(pdf_bytes)
+            count += 1
+            if count % 1000 == 0:
+                click.echo(f"rendered {count}")
+    finally:
+        executor.shutdown()
+    elapsed = time.monotonic() - started
+    click.echo(f"rendered {count} receipts in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.1f}/s)")
+
+
+def render_mail_template(template_name: str, **context) -> tuple[str, str]:
+    """Render templates/mail/<name>.txt; its first line is the subject."""
+    text = app.jinja_env.get_template(f"mail/{template_name}.txt").render(**context)
+    subject, _, body = text.partition("\n")
+    return subject.strip(), body.lstrip("\n")
+
+
+@app.cli.command("bulk-mail")
+@click.option("--year", type=int, required=True, help="Donation year to select.")
+@click.option(
+    "--template",
+    "template_name",
+    type=click.Choice(["annual_thanks", "receipt_resend"]),
+    default="annual_thanks",
+    show_default=True,
+    help="annual_thanks mails each donor once; receipt_resend re-sends every receipt PDF.",
+)
+@click.option("--status", "statuses", multiple=True, help="Only receipts in this status (repeatable).")
+@click.option("--payment-method", default=None, type=click.Choice(sorted(ALLOWED_PAYMENT_METHODS)))
+@click.option("--connections", type=int, default=2, show_default=True, help="Concurrent SMTP sessions.")
+@click.option("--rate", type=float, default=1.0, show_default=True, help="Messages per second; 0 disables.")
+@click.option("--checkpoint", "checkpoint_path", default=None, help="Progress log; rerun with it to resume.")
+@click.option("--dry-run", is_flag=True, help="Count recipients without sending.")
+def bulk_mail_command(
+    year: int,
+    template_name: str,
+    statuses: tuple[str, ...],
+    payment_method: str | None,
+    connections: int,
+    rate: float,
+    checkpoint_path: str | None,
+    dry_run: bool,
+):
+    """Send a templated mail to the year's donors."""
+    conn = get_db_connection()
+    try:
+        ensure_receipts_table(conn)
+        filters = {"statuses": list(statuses), "payment_method": payment_method}
+        if template_name == "receipt_resend":
+            recipients = (
+                (f"receipt:{row['id']}", row)
+                for row in bulk_mail.iter_receipt_recipients(conn, year, **filters)
+            )
+        else:
+            recipients = (
+                (f"donor:{year}:{donor['donor_email'].strip().lower()}", donor)
+                for donor in bulk_mail.iter_donor_recipients(conn, year, **filters)
+            )
+
+        if dry_run:
+            click.echo(f"recipients: {sum(1 for _ in recipients)}")
+            return
+
+        def render(recipient: dict):
+            subject, body = render_mail_template(template_name, **recipient)
+            attachment = None
+            if template_name == "receipt_resend":
+                attachment = build_receipt_pdf(
+                    name=recipient["donor_name"],
+                    address=recipient["donor_address"],
+                    amount=recipient["amount_yen"],
+                    payment_method=recipient["payment_method"],
+                    donated_at=recipient["donated_at"],
+                    certificate_no=recipient["certificate_no"],
+                )
+            return outbox.build_message(
+                {
+                    "recipient": recipient["donor_email"],
+                    "subject": subject,
+                    "body": body,
+                    "attachment": attachment,
+                    "attachment_name": RECEIPT_ATTACHMENT_NAME,
+                },
+                FROM_MAIL,
+            )
+
+        report = bulk_mail.send_bulk(
+            recipients,
+            render,
+            build_smtp_session,
+            connections=connections,
+            rate=rate,
+            checkpoint=bulk_mail.Checkpoint(checkpoint_path),
+            log=click.echo,
+        )
+    finally:
+        conn.close()
+    click.echo(json.dumps(report, ensure_ascii=False))
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
@@ -0,0 +1,73 @@
+"""CSV import throughput against a scratch database.
+
+Generates an import file of ``--rows`` offline donations (with a few
+invalid rows mixed in), then times parsing/validation and the batched
+insert separately.
+
+Usage: python bench/bench_import.py --database donation_scratch [--rows 50000] [--batch-size 1000]
+
+The database must already exist and DB_USER must be able to create
+tables in it. It is migrated first; imported rows are kept.
+"""
+
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_search import fake_donor  # noqa: E402
+
+
+def build_csv(rows: int) -> bytes:
+    rng = random.Random(rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+    writer.writerow(["name", "postal_code", "address", "email", "amount", "payment_method", "donated_at"])
+    for n in range(rows):
+        name, postal_code, address, email, amount = fake_donor(n, rng)
+        amount_text = f"{amount:,}円" if n % 1000 else "未定"
+        writer.writerow([name, postal_code, address, email, amount_text, rng.choice(["現金", "振込"]), "2025/11/3"])
+    return buffer.getvalue().encode("utf-8")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", required=True, help="scratch database name (never the production one)")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    os.environ["DB_NAME"] = args.database
+    import app  # noqa: E402  (reads DB_NAME at import time)
+    import migrations  # noqa: E402
+    import receipt_import  # noqa: E402
+
+    data = build_csv(args.rows)
+    print(f"generated {args.rows} rows ({len(data) / 1e6:.1f} MB)")
+
+    started = time.monotonic()
+    donations, errors = receipt_import.parse_import_csv(data, app.ALLOWED_PAYMENT_METHODS, datetime.now())
+    parsed = time.monotonic() - started
+    print(f"parse+validate: {parsed:.2f}s ({len(donations)} valid, {len(errors)} errors)")
+
+    conn = app.open_db_connection()
+    try:
+        migrations.run_migrations(conn)
+        started = time.monotonic()
+        imported = receipt_import.import_donations(conn, donations, batch_size=args.batch_size)
+        inserted = time.monotonic() - started
+    finally:
+        conn.close()
+    print(f"insert: {imported} rows in {inserted:.2f}s ({imported / inserted:.0f}/s)")
+    print(f"total: {parsed + inserted:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
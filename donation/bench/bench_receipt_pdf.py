@@ -0,0 +1,123 @@
+"""Receipts-per-second microbenchmark: legacy per-call rendering vs ReceiptRenderer.
+
+Usage: python bench/bench_receipt_pdf.py [-n 200] [--seal PNG] [--signature PNG]
+
+Without --seal/--signature the real assets/seals images are used when
+present, otherwise synthetic PNGs of typical scan size are generated.
+"""
+
+import argparse
+import io
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image, ImageDraw  # noqa: E402
+from reportlab.lib.pagesizes import A4  # noqa: E402
+from reportlab.pdfbase import pdfmetrics  # noqa: E402
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont  # noqa: E402
+from reportlab.pdfgen import canvas  # noqa: E402
+
+from receipt_renderer import ReceiptRenderer  # noqa: E402
+
+ASSETS_DIR = Path(__file__).resolve().parent.parent / "assets/seals"
+SAMPLE = {
+    "name": "山田 太郎",
+    "address": "京都府京都市伏見区深草ヲカヤ町23-6",
+    "amount": "10000",
+    "payment_method": "振込",
+    "donated_at": datetime(2025, 4, 1, 10, 30, 0),
+    "certificate_no": "RCPT-2025-000123",
+}
+
+
+def legacy_build_receipt_pdf(seal_path: Path, signature_path: Path, **fields) -> bytes:
+    """build_receipt_pdf() as it was before ReceiptRenderer, kept as the baseline."""
+    pdfmetrics.registerFont(UnicodeCIDFont("HeiseiKakuGo-W5"))
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    c.setFont("HeiseiKakuGo-W5", 12)
+    text = c.beginText(50, 800)
+    text.setFont("HeiseiKakuGo-W5", 12)
+    for line in (
+        "寄付受領書",
+        "",
+        f"証明書番号：{fields['certificate_no']}",
+        "",
+        f"{fields['name']} 様",
+        f"住所：{fields['address']}",
+        "",
+        f"寄附金額：{fields['amount']} 円",
+        f"支払方法：{fields['payment_method']}",
+        f"日付：{fields['donated_at'].strftime('%Y年%m月%d日 %H:%M:%S')}",
+        "",
+        "受け入れ団体：NPO法人ほっこり サポートホーム／ほっこりくろちゃん",
+        "所在地：〒612-8403 京都市伏見区深草ヲカヤ町23-6 サポートホーム",
+    ):
+        text.textLine(line)
+    c.drawText(text)
+    c.setFont("HeiseiKakuGo-W5", 10)
+    if seal_path.exists():
+        c.drawString(60, 140, "略印")
+        c.drawImage(str(seal_path), x=60, y=55, width=130, height=75, preserveAspectRatio=True, mask="auto")
+    if signature_path.exists():
+        c.drawString(250, 140, "代表者署名")
+        c.drawImage(
+            str(signature_path), x=250, y=55, width=220, height=75, preserveAspectRatio=True, mask="auto"
+        )
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def synthetic_images(directory: Path) -> tuple[Path, Path]:
+    seal = Image.new("RGBA", (800, 800), (0, 0, 0, 0))
+    ImageDraw.Draw(seal).ellipse((40, 40, 760, 760), outline=(200, 0, 0, 255), width=40)
+    seal_path = directory / "issuer_seal.png"
+    seal.save(seal_path)
+    signature = Image.new("RGBA", (1200, 400), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(signature)
+    for x in range(0, 1200, 7):
+        draw.line((x, 100 + (x * 37) % 200, x + 40, 300 - (x * 13) % 150), fill=(0, 0, 0, 255), width=6)
+    signature_path = directory / "issuer_signature.png"
+    signature.save(signature_path)
+    return seal_path, signature_path
+
+
+def measure(func, iterations: int) -> float:
+    func()  # warm-up
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return iterations / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    parser.add_argument("--seal", type=Path, default=None)
+    parser.add_argument("--signature", type=Path, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seal_path = args.seal or ASSETS_DIR / "issuer_seal.png"
+        signature_path = args.signature or ASSETS_DIR / "issuer_signature.png"
+        if not args.seal and not args.signature and not (seal_path.exists() or signature_path.exists()):
+            seal_path, signature_path = synthetic_images(Path(tmp))
+
+        renderer = ReceiptRenderer(seal_path, signature_path)
+        before = measure(lambda: legacy_build_receipt_pdf(seal_path, signature_path, **SAMPLE), args.iterations)
+        after = measure(lambda: renderer.render(**SAMPLE), args.iterations)
+
+    print(f"images: {seal_path.name} / {signature_path.name}")
+    print(f"legacy build_receipt_pdf: {before:8.1f} receipts/s")
+    print(f"ReceiptRenderer.render:   {after:8.1f} receipts/s")
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
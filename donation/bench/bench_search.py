@@ -0,0 +1,167 @@
+"""Donor search latency on a large generated table in a scratch database.
+
+Fills donation_receipts with synthetic donors (Japanese names and
+addresses, emails, postal codes) until it holds ``--rows`` rows, then
+times each kind of search the dashboard runs and prints the EXPLAIN plan
+of every index branch, so a full scan shows up as ``type: ALL``.
+
+Usage: python bench/bench_search.py --database donation_scratch [--rows 1000000] [--repeat 50]
+
+The database must already exist and DB_USER must be able to create
+tables in it. It is migrated first; generated rows are kept so later
+runs skip the fill. Receipt counters are reconciled after filling.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+SURNAMES = ["山田", "佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "中村", "小林", "加藤", "吉田", "山本", "松本", "井上", "木村"]
+GIVEN_NAMES = ["太郎", "花子", "一郎", "美咲", "健太", "陽子", "大輔", "さくら", "翔太", "由美", "誠", "愛"]
+KANA_NAMES = ["ヤマダ", "サトウ", "スズキ", "ﾀﾅｶ", "ｲﾄｳ", "ナカムラ"]
+PREFECTURES = ["京都府", "大阪府", "東京都", "北海道", "福岡県", "愛知県", "兵庫県", "奈良県"]
+CITIES = ["京都市伏見区", "大阪市北区", "札幌市中央区", "福岡市博多区", "名古屋市中区", "神戸市灘区", "奈良市", "新宿区"]
+TOWNS = ["深草", "桃山町", "中之島", "大通西", "博多駅前", "栄", "六甲台町", "登大路町", "西新宿"]
+DOMAINS = ["example.jp", "example.com", "example.org", "mail.example.ne.jp"]
+PAYMENT_METHODS = ["現金", "銀行振込", "クレジットカード"]
+
+QUERIES = {
+    "name prefix": ["山田", "佐藤花", "ヤマダ", "ｽｽﾞｷ", "中村 翔"],
+    "email prefix": ["taro", "hanako.sa", "user12", "Donor-9"],
+    "postal prefix": ["612", "612-84", "5300005", "０６０"],
+    "certificate prefix": ["BENCH-0012", "BENCH-09999"],
+    "address text": ["伏見区", "桃山町", "中之島", "博多駅前3"],
+    "no match": ["存在しない寄付者"],
+}
+
+
+def fake_donor(n: int, rng: random.Random) -> tuple:
+    surname = rng.choice(SURNAMES if rng.random() < 0.8 else KANA_NAMES)
+    name = f"{surname}{rng.choice([' ', '　', ''])}{rng.choice(GIVEN_NAMES)}"
+    postal_code = f"{rng.randrange(1, 999):03d}-{rng.randrange(0, 9999):04d}"
+    address = (
+        f"{rng.choice(PREFECTURES)}{rng.choice(CITIES)}{rng.choice(TOWNS)}"
+        f"{rng.randrange(1, 9)}丁目{rng.randrange(1, 30)}-{rng.randrange(1, 20)}"
+    )
+    email = f"{rng.choice(['taro', 'hanako.sato', 'user', 'donor-'])}{n}@{rng.choice(DOMAINS)}"
+    amount = rng.choice([1000, 3000, 5000, 10000, 30000, 100000])
+    return name, postal_code, address, email, amount
+
+
+def fill(counters, search, conn, target_rows: int, batch_size: int) -> None:
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS total FROM donation_receipts")
+        existing = cur.fetchone()["total"]
+    conn.commit()
+    if existing >= target_rows:
+        print(f"table already has {existing} rows")
+        return
+
+    rng = random.Random(existing)
+    base_time = datetime(2020, 1, 1)
+    started = time.monotonic()
+    n = existing
+    with conn.cursor() as cur:
+        while n < target_rows:
+            batch = []
+            for _ in range(min(batch_size, target_rows - n)):
+                name, postal_code, address, email, amount = fake_donor(n, rng)
+                columns = search.search_columns(name, email, postal_code)
+                batch.append(
+                    (
+                        f"BENCH-{n:08d}",
+                        name,
+                        postal_code,
+                        address,
+                        email,
+                        str(amount),
+                        amount,
+                        rng.choice(PAYMENT_METHODS),
+                        base_time + timedelta(minutes=n),
+                        columns["search_name"],
+                        columns["search_email"],
+                        columns["search_postal"],
+                    )
+                )
+                n += 1
+            cur.executemany(
+                """
+                INSERT INTO donation_receipts (
+                    certificate_no, donor_name, donor_postal_code, donor_address, donor_email,
+                    amount_yen, amount_value, payment_method, donated_at,
+                    search_name, search_email, search_postal
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                batch,
+            )
+            conn.commit()
+            if n % (batch_size * 50) == 0:
+                print(f"  {n} rows ({n / (time.monotonic() - started):.0f}/s)")
+    print(f"filled to {n} rows in {time.monotonic() - started:.1f}s")
+    # Rows were inserted without counter updates; add them back in one go.
+    counters.reconcile(conn, fix=True)
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", required=True, help="scratch database name (never the production one)")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs per query")
+    args = parser.parse_args()
+
+    os.environ["DB_NAME"] = args.database
+    import app  # noqa: E402  (reads DB_NAME at import time)
+    import counters  # noqa: E402
+    import migrations  # noqa: E402
+    import receipt_queries  # noqa: E402
+    import search  # noqa: E402
+
+    conn = app.open_db_connection()
+    try:
+        migrations.run_migrations(conn)
+        fill(counters, search, conn, args.rows, args.batch_size)
+
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE TABLE donation_receipts")
+            cur.fetchall()
+            for kind, queries in QUERIES.items():
+                samples: list[float] = []
+                matches = 0
+                for query in queries:
+                    for _ in range(args.repeat):
+                        started = time.perf_counter()
+                        rows = search.search_receipts(cur, query, receipt_queries.DASHBOARD_COLUMNS)
+                        samples.append((time.perf_counter() - started) * 1000)
+                    matches += len(rows)
+                print(
+                    f"{kind:<20} p50 {statistics.median(samples):7.2f} ms  "
+                    f"p95 {percentile(samples, 95):7.2f} ms  max {max(samples):7.2f} ms  "
+                    f"({matches / len(queries):.0f} rows/query)"
+                )
+
+            print()
+            for query in ("山田", "612-84"):
+                for sql, params in search.search_branches(query):
+                    cur.execute("EXPLAIN " + sql.strip("()"), params)
+                    for row in cur.fetchall():
+                        print(f"{query!r}: key={row['key']} type={row['type']} rows={row['rows']}  {params[0]}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Helpers shared by the benchmark scripts: percentiles and result files.
+
+Results are written to bench/results/<UTC time>-<commit>-<kind>.json so
+runs on different commits can be diffed with bench/compare.py.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples: list[float], elapsed: float | None = None) -> dict:
+    """Latency summary in milliseconds for per-operation ``samples`` in seconds."""
+    summary = {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples, default=0.0) * 1000, 3),
+    }
+    total = elapsed if elapsed is not None else sum(samples)
+    summary["ops_per_sec"] = round(len(samples) / total, 2) if total > 0 else 0.0
+    return summary
+
+
+def time_calls(func, iterations: int, warmup: int = 3) -> dict:
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def git_revision() -> dict:
+    def git(*args: str) -> str:
+        try:
+            return subprocess.run(
+                ["git", *args], cwd=BENCH_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ""
+
+    return {"commit": git("rev-parse", "--short", "HEAD") or "unknown", "dirty": bool(git("status", "--porcelain"))}
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(kind: str, results: dict, out: Path | None = None) -> Path:
+    revision = git_revision()
+    now = datetime.now(timezone.utc)
+    document = {
+        "kind": kind,
+        "recorded_at": now.isoformat(timespec="seconds"),
+        **revision,
+        "environment": environment(),
+        "argv": sys.argv[1:],
+        "results": results,
+    }
+    if out is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        out = RESULTS_DIR / f"{now:%Y%m%dT%H%M%SZ}-{revision['commit']}-{kind}.json"
+    out.write_text(json.dumps(document, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    return out
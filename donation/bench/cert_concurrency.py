@@ -0,0 +1,128 @@
+"""Concurrent certificate-number allocation check against a scratch database.
+
+Allocates numbers and inserts receipts from many threads, each on its own
+connection, then verifies that every committed certificate_no is unique
+and that each year's numbers have no duplicates or collisions with the
+sequence table.
+
+Usage: python bench/cert_concurrency.py --database donation_scratch [--threads 16] [--per-thread 50]
+
+The database must already exist and DB_USER must be able to create
+tables in it. It is migrated first; rows are never deleted.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", required=True, help="scratch database name (never the production one)")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--per-thread", type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ["DB_NAME"] = args.database
+    import app  # noqa: E402  (reads DB_NAME at import time)
+    import migrations  # noqa: E402
+
+    conn = app.open_db_connection()
+    try:
+        migrations.run_migrations(conn)
+        with conn.cursor() as cur:
+            cur.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM donation_receipts")
+            start_id = cur.fetchone()["max_id"]
+        conn.commit()
+    finally:
+        conn.close()
+
+    errors: list[Exception] = []
+    barrier = threading.Barrier(args.threads)
+
+    def worker(index: int) -> None:
+        worker_conn = app.open_db_connection()
+        try:
+            barrier.wait()
+            for n in range(args.per_thread):
+                try:
+                    donated_at = datetime.now()
+                    certificate_no = app.allocate_certificate_no(worker_conn, donated_at)
+                    with worker_conn.cursor() as cur:
+                        app.insert_receipt_record(
+                            cur,
+                            certificate_no=certificate_no,
+                            name=f"concurrency-{index}-{n}",
+                            postal_code="000-0000",
+                            address="scratch",
+                            email="concurrency@example.invalid",
+                            amount="1",
+                            payment_method="現金",
+                            donated_at=donated_at,
+                        )
+                    worker_conn.commit()
+                except Exception as exc:
+                    worker_conn.rollback()
+                    errors.append(exc)
+        finally:
+            worker_conn.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    conn = app.open_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT COUNT(*) AS total, COUNT(DISTINCT certificate_no) AS distinct_numbers
+                FROM donation_receipts
+                WHERE id > %s
+                """,
+                (start_id,),
+            )
+            counts = cur.fetchone()
+            cur.execute(
+                """
+                SELECT s.year, s.last_value,
+                       MAX(CAST(SUBSTRING_INDEX(r.certificate_no, '-', -1) AS UNSIGNED)) AS max_issued
+                FROM certificate_sequences s
+                JOIN donation_receipts r ON r.certificate_no LIKE CONCAT('RCPT-', s.year, '-%%')
+                GROUP BY s.year, s.last_value
+                """
+            )
+            sequences = cur.fetchall()
+    finally:
+        conn.close()
+
+    expected = args.threads * args.per_thread
+    print(f"inserted {counts['total']} / {expected} in {elapsed:.2f}s ({counts['total'] / elapsed:.0f}/s)")
+    print(f"distinct certificate numbers: {counts['distinct_numbers']}")
+    for row in sequences:
+        print(f"year {row['year']}: sequence at {row['last_value']}, highest issued {row['max_issued']}")
+    if errors:
+        print(f"{len(errors)} errors, first: {errors[0]!r}")
+
+    ok = (
+        not errors
+        and counts["total"] == expected
+        and counts["distinct_numbers"] == counts["total"]
+        and all(row["last_value"] >= row["max_issued"] for row in sequences)
+    )
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Compare two benchmark result files (from micro.py or load_test.py).
+
+Prints throughput and p95 latency for every entry present in both runs
+with the change in percent, and exits with status 1 when any entry got
+slower than --threshold percent (lower ops/s or higher p95).
+
+Usage: python bench/compare.py BASELINE.json CANDIDATE.json [--threshold 10]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# (key, unit, higher is better); load stage entries only carry a mean.
+METRICS = (("ops_per_sec", "ops/s", True), ("p95_ms", "ms p95", False), ("mean_ms", "ms mean", False))
+
+
+def entries(document: dict) -> dict[str, dict]:
+    results = document["results"]
+    if document.get("kind") == "load":
+        flat = {f"load:{name}": summary for name, summary in results["scenarios"].items()}
+        flat.update({f"stage:{name}": summary for name, summary in results["stages"].items()})
+        return flat
+    return results
+
+
+def change(before: float, after: float) -> float | None:
+    if not before:
+        return None
+    return (after - before) / before * 100
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    args = parser.parse_args()
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    candidate = json.loads(args.candidate.read_text(encoding="utf-8"))
+    if baseline.get("kind") != candidate.get("kind"):
+        raise SystemExit(f"cannot compare {baseline.get('kind')} with {candidate.get('kind')}")
+    print(f"baseline  {baseline['commit']}{' (dirty)' if baseline['dirty'] else ''}  {baseline['recorded_at']}")
+    print(f"candidate {candidate['commit']}{' (dirty)' if candidate['dirty'] else ''}  {candidate['recorded_at']}")
+
+    before, after = entries(baseline), entries(candidate)
+    regressions = []
+    for name in sorted(before.keys() & after.keys()):
+        old, new = before[name], after[name]
+        columns = []
+        for key, unit, higher_better in METRICS:
+            if key not in old or key not in new:
+                continue
+            delta = change(old[key], new[key])
+            if delta is None:
+                continue
+            columns.append(f"{old[key]:>10} -> {new[key]:>10} {unit} ({delta:+6.1f}%)")
+            worse = -delta if higher_better else delta
+            if worse > args.threshold and name not in regressions:
+                regressions.append(name)
+        print(f"{'!' if name in regressions else ' '} {name:<28} " + "  ".join(columns))
+
+    for name in sorted(before.keys() ^ after.keys()):
+        print(f"  {name:<28} only in {'baseline' if name in before else 'candidate'}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
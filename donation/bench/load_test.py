@@ -0,0 +1,345 @@
+"""Concurrent load against /submit, /download/<token> and the admin pages.
+
+Each client thread picks a scenario by weight until --duration runs out:
+
+- submit: POST /submit as a cash or bank-transfer donation (the thanks page
+  carries the download token)
+- download: GET /download/<token> for a token from an earlier submit
+- admin: a logged-in GET of /admin, an /admin search or /admin/reports
+
+It reports throughput and p50/p95/p99 latency per scenario, and the
+per-stage /submit and outbox timings from the difference between two
+/metrics scrapes.
+
+Against a running server (admin needs ADMIN_PASSWORD's value):
+
+    python bench/load_test.py --url http://127.0.0.1:5000 --admin-password secret
+
+Fully offline with --start-server. This starts devtools/smtp_sink.py,
+the outbox worker and gunicorn (2 workers, like deploy/systemd) on a
+scratch database, then stops them. It needs a local MySQL reachable with
+DB_HOST/DB_PORT/DB_USER/DB_PASSWORD from the environment or .env. A
+throwaway container is enough:
+
+    docker run -d --name donation-bench-mysql -p 3307:3306 \\
+        -e MYSQL_ROOT_PASSWORD=bench -e MYSQL_DATABASE=donation_bench mysql:8.0
+    DB_HOST=127.0.0.1 DB_PORT=3307 DB_USER=root DB_PASSWORD=bench \\
+        python bench/load_test.py --start-server --database donation_bench
+
+Results go to bench/results/ as JSON; compare runs with bench/compare.py.
+"""
+
+import argparse
+import http.client
+import http.cookiejar
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_search import fake_donor  # noqa: E402
+from benchlib import summarize, write_results  # noqa: E402
+
+APP_DIR = Path(__file__).resolve().parent.parent
+TOKEN_RE = re.compile(r"/download/((?:\d{10}-)?[0-9a-f]{32})")
+METRIC_RE = re.compile(r'^(\w+?)(_bucket|_sum|_count)?\{(.*)\} (\S+)$')
+ADMIN_PATHS = ("/admin", "/admin?q=" + urllib.parse.quote("山田"), "/admin?q=612", "/admin/reports")
+STAGE_HISTOGRAMS = ("donation_submit_stage_seconds", "donation_email_stage_seconds")
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """One simulated user with its own cookies (and admin session)."""
+
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect()
+        )
+
+    def request(self, path: str, data: dict | None = None) -> tuple[int, bytes]:
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(self.base_url + path, data=body, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.read()
+
+
+class LoadRun:
+    def __init__(self, args):
+        self.args = args
+        self.weights = parse_mix(args.mix)
+        self.samples: dict[str, list[float]] = {name: [] for name in self.weights}
+        self.statuses: dict[str, dict[str, int]] = {name: {} for name in self.weights}
+        self.tokens: list[str] = []
+        self.lock = threading.Lock()
+
+    def record(self, scenario: str, seconds: float, status: int | str) -> None:
+        with self.lock:
+            if status in (200, 302):
+                self.samples[scenario].append(seconds)
+            counts = self.statuses[scenario]
+            counts[str(status)] = counts.get(str(status), 0) + 1
+
+    def submit(self, client: Client, rng: random.Random, n: int) -> int:
+        name, postal_code, address, email, amount = fake_donor(n, rng)
+        status, body = client.request(
+            "/submit",
+            {
+                "name": name,
+                "postal_code": postal_code,
+                "address": address,
+                "email": email,
+                "amount": str(amount),
+                "payment_method": rng.choice(["振込", "現金"]),
+            },
+        )
+        match = TOKEN_RE.search(body.decode("utf-8", "replace")) if status == 200 else None
+        if match:
+            with self.lock:
+                self.tokens.append(match.group(1))
+        return status
+
+    def client_loop(self, index: int, deadline: float) -> None:
+        rng = random.Random(index)
+        client = Client(self.args.url, self.args.timeout)
+        logged_in = False
+        names, weights = zip(*self.weights.items())
+        n = index * 1_000_000
+        while time.monotonic() < deadline:
+            scenario = rng.choices(names, weights)[0]
+            if scenario == "download" and not self.tokens:
+                scenario = "submit" if "submit" in self.weights else scenario
+            if scenario == "admin" and not logged_in:
+                status, _ = client.request(
+                    "/admin/login", {"username": self.args.admin_user, "password": self.args.admin_password}
+                )
+                logged_in = status == 302
+                if not logged_in:
+                    self.record("admin", 0.0, f"login {status}")
+                    time.sleep(1)
+                    continue
+            started = time.perf_counter()
+            try:
+                if scenario == "submit":
+                    n += 1
+                    status = self.submit(client, rng, n)
+                elif scenario == "download":
+                    if not self.tokens:
+                        time.sleep(0.1)
+                        continue
+                    status, _ = client.request(f"/download/{rng.choice(self.tokens)}")
+                else:
+                    status, _ = client.request(rng.choice(ADMIN_PATHS))
+            except (OSError, http.client.HTTPException) as exc:
+                status = type(exc).__name__
+            self.record(scenario, time.perf_counter() - started, status)
+
+    def run(self) -> dict:
+        before = scrape_metrics(self.args.url)
+        deadline = time.monotonic() + self.args.duration
+        threads = [
+            threading.Thread(target=self.client_loop, args=(i, deadline), daemon=True)
+            for i in range(self.args.concurrency)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        # Let the outbox worker and the metrics files catch up.
+        time.sleep(self.args.settle)
+        after = scrape_metrics(self.args.url)
+
+        scenarios = {}
+        for name, samples in self.samples.items():
+            scenarios[name] = {**summarize(samples, elapsed), "statuses": self.statuses[name]}
+        total_ok = sum(len(samples) for samples in self.samples.values())
+        return {
+            "duration_sec": round(elapsed, 3),
+            "concurrency": self.args.concurrency,
+            "mix": self.weights,
+            "requests_per_sec": round(total_ok / elapsed, 2) if elapsed else 0.0,
+            "scenarios": scenarios,
+            "stages": stage_deltas(before, after),
+        }
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    weights = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("submit", "download", "admin"):
+            raise SystemExit(f"unknown scenario in --mix: {name}")
+        weights[name.strip()] = int(weight or 1)
+    return weights
+
+
+def scrape_metrics(base_url: str) -> dict:
+    """{(metric, stage, suffix, le): value} for the stage histograms, {} if unavailable."""
+    try:
+        with urllib.request.urlopen(base_url.rstrip("/") + "/metrics", timeout=10) as response:
+            text = response.read().decode()
+    except (OSError, urllib.error.URLError):
+        return {}
+    values = {}
+    for line in text.splitlines():
+        match = METRIC_RE.match(line)
+        if not match or match.group(1) not in STAGE_HISTOGRAMS:
+            continue
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', match.group(3)))
+        key = (match.group(1), labels.get("stage"), match.group(2), labels.get("le"))
+        values[key] = float(match.group(4))
+    return values
+
+
+def stage_deltas(before: dict, after: dict) -> dict:
+    """Mean and bucket-resolution p95 of each stage during the run."""
+    stages: dict = {}
+    for (metric, stage, suffix, _), value in after.items():
+        if suffix != "_count":
+            continue
+        count = value - before.get((metric, stage, "_count", None), 0)
+        if count <= 0:
+            continue
+        total = after[(metric, stage, "_sum", None)] - before.get((metric, stage, "_sum", None), 0)
+        buckets = sorted(
+            (float("inf") if le == "+Inf" else float(le), v - before.get((metric, stage, "_bucket", le), 0))
+            for (m, s, sfx, le), v in after.items()
+            if m == metric and s == stage and sfx == "_bucket"
+        )
+        p95 = next((bound for bound, cumulative in buckets if cumulative >= count * 0.95), float("inf"))
+        prefix = "email" if metric.startswith("donation_email") else "submit"
+        stages[f"{prefix}:{stage}"] = {
+            "count": int(count),
+            "mean_ms": round(total / count * 1000, 3),
+            "p95_le_ms": None if p95 == float("inf") else round(p95 * 1000, 1),
+        }
+    return stages
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return
+        except (OSError, urllib.error.URLError):
+            time.sleep(0.3)
+    raise SystemExit(f"server did not come up: {url}")
+
+
+@contextmanager
+def local_stack(args):
+    """smtp sink + outbox worker + 2-worker gunicorn on a scratch database."""
+    work_dir = Path(tempfile.mkdtemp(prefix="donation-bench-"))
+    smtp_port, http_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "DB_NAME": args.database,
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(smtp_port),
+        "SMTP_STARTTLS": "0",
+        "SMTP_AUTH": "0",
+        "FROM_MAIL": "bench@example.invalid",
+        "METRICS_DIR": str(work_dir / "metrics"),
+        "RECEIPT_DIR": str(work_dir / "receipts"),
+        # Both workers must accept the same admin session cookie.
+        "FLASK_SECRET_KEY": "bench-secret",
+        "ADMIN_PASSWORD": args.admin_password,
+        "ADMIN_USERNAME": args.admin_user,
+    }
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "db-migrate"], cwd=APP_DIR, env=env, check=True)
+    processes = [
+        subprocess.Popen(
+            [sys.executable, str(APP_DIR / "devtools/smtp_sink.py"), "--port", str(smtp_port)], env=env
+        ),
+        subprocess.Popen([sys.executable, "-m", "flask", "--app", "app", "outbox-worker"], cwd=APP_DIR, env=env),
+        subprocess.Popen(
+            [
+                sys.executable, "-m", "gunicorn",
+                "--workers", str(args.server_workers),
+                "--bind", f"127.0.0.1:{http_port}",
+                "--timeout", "60",
+                "app:app",
+            ],
+            cwd=APP_DIR,
+            env=env,
+        ),
+    ]
+    try:
+        args.url = f"http://127.0.0.1:{http_port}"
+        wait_for(args.url + "/db-check/pool")
+        yield
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mix", default="submit=6,download=3,admin=1", help="scenario weights")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds to wait before the final /metrics")
+    parser.add_argument("--admin-user", default=os.getenv("ADMIN_USERNAME", "admin"))
+    parser.add_argument("--admin-password", default=os.getenv("ADMIN_PASSWORD", "bench"))
+    parser.add_argument("--start-server", action="store_true", help="run sink, outbox worker and gunicorn locally")
+    parser.add_argument("--database", default=None, help="scratch database for --start-server")
+    parser.add_argument("--server-workers", type=int, default=2)
+    parser.add_argument("--out", type=Path, default=None, help="result file (default: bench/results/...)")
+    args = parser.parse_args()
+    if args.start_server and not args.database:
+        parser.error("--start-server needs --database (a scratch one, never production)")
+
+    if args.start_server:
+        with local_stack(args):
+            results = LoadRun(args).run()
+    else:
+        results = LoadRun(args).run()
+
+    print(f"{results['requests_per_sec']} req/s over {results['duration_sec']}s, concurrency {args.concurrency}")
+    for name, summary in results["scenarios"].items():
+        print(
+            f"{name:<10} {summary['ops_per_sec']:>8} req/s  p50 {summary['p50_ms']:8.1f} ms  "
+            f"p95 {summary['p95_ms']:8.1f} ms  p99 {summary['p99_ms']:8.1f} ms  {summary['statuses']}"
+        )
+    for stage, summary in results["stages"].items():
+        print(f"  {stage:<22} mean {summary['mean_ms']:8.1f} ms  p95 <= {summary['p95_le_ms']} ms  (n={summary['count']})")
+    print(f"wrote {write_results('load', results, args.out)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Microbenchmarks for the hot paths of a submission and a download.
+
+Times, per call: receipt rendering (what build_receipt_pdf() runs inline),
+an annual certificate, the receipt cache write and hit that replaced
+saving each PDF, input validation and search normalization, CSV import
+parsing and a metrics observation. With --database it also times
+ensure_receipts_table() cold (first call in a process) and warm.
+
+Usage: python bench/micro.py [-n 200] [--database donation_scratch] [--out FILE]
+
+Results go to bench/results/ as JSON; compare runs with bench/compare.py.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_import import build_csv  # noqa: E402
+from bench_receipt_pdf import ASSETS_DIR, SAMPLE, synthetic_images  # noqa: E402
+from benchlib import summarize, time_calls, write_results  # noqa: E402
+
+
+def bench_schema(database: str, iterations: int) -> dict:
+    os.environ["DB_NAME"] = database
+    import app  # noqa: E402  (reads DB_NAME at import time)
+
+    conn = app.open_db_connection()
+    try:
+        app._schema_current = False
+        started = time.perf_counter()
+        app.ensure_receipts_table(conn)
+        cold = time.perf_counter() - started
+        warm = time_calls(lambda: app.ensure_receipts_table(conn), iterations)
+    finally:
+        conn.close()
+    return {"ensure_receipts_table_cold": summarize([cold]), "ensure_receipts_table_warm": warm}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    parser.add_argument("--database", default=None, help="scratch database for ensure_receipts_table()")
+    parser.add_argument("--out", type=Path, default=None, help="result file (default: bench/results/...)")
+    args = parser.parse_args()
+
+    from amounts import parse_amount_yen
+    from donation_fields import validate_donation
+    from metrics import MetricsRegistry
+    from receipt_cache import ReceiptCache
+    from receipt_import import parse_import_csv
+    from receipt_renderer import ReceiptRenderer
+    from search import search_columns
+
+    results: dict = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        seal_path = ASSETS_DIR / "issuer_seal.png"
+        signature_path = ASSETS_DIR / "issuer_signature.png"
+        if not (seal_path.exists() or signature_path.exists()):
+            seal_path, signature_path = synthetic_images(Path(tmp))
+
+        started = time.perf_counter()
+        renderer = ReceiptRenderer(seal_path, signature_path)
+        results["renderer_init"] = summarize([time.perf_counter() - started])
+        results["render_receipt"] = time_calls(lambda: renderer.render(**SAMPLE), args.iterations)
+        pdf_bytes = renderer.render(**SAMPLE)
+
+        donations = [
+            {
+                "donated_at": datetime(2025, month, 1),
+                "certificate_no": f"RCPT-2025-{month:06d}",
+                "payment_method": "振込",
+                "amount_value": 10000,
+            }
+            for month in range(1, 13)
+        ]
+        results["render_annual_12"] = time_calls(
+            lambda: renderer.render_annual(
+                name=SAMPLE["name"],
+                address=SAMPLE["address"],
+                year=2025,
+                certificate_no="ANNUAL-2025-000001",
+                total_amount=120000,
+                donations=donations,
+            ),
+            max(1, args.iterations // 4),
+        )
+
+        cache = ReceiptCache(Path(tmp) / "receipts", max_bytes=64 * 1024 * 1024, salt="bench")
+        counter = iter(range(10**9))
+
+        def cache_put() -> None:
+            fields = {**SAMPLE, "certificate_no": f"RCPT-2025-{next(counter):06d}"}
+            cache.put(cache.key_for(fields), pdf_bytes)
+
+        results["receipt_cache_put"] = time_calls(cache_put, args.iterations)
+        hit_key = cache.key_for(SAMPLE)
+        cache.put(hit_key, pdf_bytes)
+        results["receipt_cache_get"] = time_calls(lambda: cache.get(hit_key), args.iterations * 10)
+
+    form = {
+        "name": "ﾔﾏﾀﾞ 太郎",
+        "postal_code": "612-8403",
+        "address": "京都府京都市伏見区深草ヲカヤ町23-6",
+        "email": "Taro@Example.JP",
+        "amount": "１０,０００円",
+        "payment_method": "振込",
+    }
+    results["parse_amount_yen"] = time_calls(lambda: parse_amount_yen(form["amount"]), args.iterations * 50)
+    results["validate_donation"] = time_calls(
+        lambda: validate_donation(form, {"現金", "振込", "クレジットカード"}), args.iterations * 50
+    )
+    results["search_columns"] = time_calls(
+        lambda: search_columns(form["name"], form["email"], form["postal_code"]), args.iterations * 50
+    )
+
+    csv_data = build_csv(10_000)
+    parse = time_calls(lambda: parse_import_csv(csv_data, {"現金", "振込"}, datetime.now()), 3, warmup=1)
+    parse["rows_per_sec"] = round(10_000 / (parse["p50_ms"] / 1000), 1) if parse["p50_ms"] else 0.0
+    results["parse_import_csv_10k"] = parse
+
+    registry = MetricsRegistry()
+    registry.histogram("bench_seconds", "bench")
+    results["metrics_observe"] = time_calls(
+        lambda: registry.observe("bench_seconds", 0.01, {"stage": "render"}), args.iterations * 50
+    )
+
+    if args.database:
+        results.update(bench_schema(args.database, args.iterations))
+
+    for name, summary in results.items():
+        print(
+            f"{name:<28} p50 {summary['p50_ms']:9.3f} ms  p95 {summary['p95_ms']:9.3f} ms  "
+            f"{summary['ops_per_sec']:>10} ops/s"
+        )
+    print(f"wrote {write_results('micro', results, args.out)}")
+
+
+if __name__ == "__main__":
+    main()
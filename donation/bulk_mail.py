@@ -0,0 +1,209 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from email.message import EmailMessage
+from typing import Callable, Iterable, Iterator
+
+PAGE_SIZE = 500
+
+
+class RateLimiter:
+    """Token bucket shared by all sender threads (``rate`` messages/second)."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class Checkpoint:
+    """Append-only progress log: one "<key>\\t<sent|failed>" line per message.
+
+    Keys logged as sent are skipped on the next run; failed ones are retried.
+    """
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self.sent: set[str] = set()
+        self._lock = threading.Lock()
+        self._fh = None
+        if not path:
+            return
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as fh:
+                for line in fh:
+                    key, _, status = line.rstrip("\n").partition("\t")
+                    if status == "sent":
+                        self.sent.add(key)
+                    else:
+                        self.sent.discard(key)
+        self._fh = open(path, "a", encoding="utf-8")
+
+    def done(self, key: str) -> bool:
+        return key in self.sent
+
+    def record(self, key: str, status: str) -> None:
+        if self._fh is None:
+            return
+        with self._lock:
+            self._fh.write(f"{key}\t{status}\n")
+            self._fh.flush()
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+def iter_receipt_recipients(
+    conn,
+    year: int,
+    statuses: list[str] | None = None,
+    payment_method: str | None = None,
+) -> Iterator[dict]:
+    """Yield one row per active receipt donated in ``year``, paging by id."""
+    where = ["is_deleted=0", "donated_at >= %s", "donated_at < %s", "id > %s"]
+    params: list = [datetime(year, 1, 1), datetime(year + 1, 1, 1)]
+    if statuses:
+        where.append(f"status IN ({', '.join(['%s'] * len(statuses))})")
+    if payment_method:
+        where.append("payment_method=%s")
+    last_id = 0
+    while True:
+        page_params = [*params, last_id, *(statuses or []), *([payment_method] if payment_method else [])]
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT id, certificate_no, donor_name, donor_address, donor_email,
+                       amount_yen, amount_value, payment_method, status, donated_at
+                FROM donation_receipts
+                WHERE {' AND '.join(where)}
+                ORDER BY id
+                LIMIT {PAGE_SIZE}
+                """,
+                page_params,
+            )
+            rows = cur.fetchall()
+        conn.commit()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1]["id"]
+
+
+def iter_donor_recipients(conn, year: int, **filters) -> Iterator[dict]:
+    """Group the year's receipts by donor email (rows arrive in id order)."""
+    donors: dict[str, dict] = {}
+    for row in iter_receipt_recipients(conn, year, **filters):
+        key = row["donor_email"].strip().lower()
+        donor = donors.get(key)
+        if donor is None:
+            donor = donors[key] = {
+                "donor_email": row["donor_email"],
+                "donor_name": row["donor_name"],
+                "year": year,
+                "total_amount": 0,
+                "donations": [],
+            }
+        donor["donor_name"] = row["donor_name"]
+        donor["donations"].append(row)
+        # amount_value is NULL for amounts flagged invalid by migration 7.
+        donor["total_amount"] += row["amount_value"] or 0
+    yield from donors.values()
+
+
+def send_bulk(
+    jobs: Iterable[tuple[str, object]],
+    render: Callable[[object], EmailMessage],
+    session_factory: Callable[[], object],
+    connections: int = 2,
+    rate: float = 0.0,
+    checkpoint: Checkpoint | None = None,
+    log: Callable[[str], None] | None = None,
+    progress_every: int = 100,
+) -> dict:
+    """Render ``(key, recipient)`` jobs and send them over persistent SMTP sessions.
+
+    Keys already logged as sent in ``checkpoint`` are skipped before rendering.
+    Messages pass through a bounded queue to ``connections`` sender threads,
+    so memory stays flat however many recipients the query returns.
+    """
+    checkpoint = checkpoint or Checkpoint(None)
+    limiter = RateLimiter(rate, burst=connections)
+    work: queue.Queue = queue.Queue(maxsize=connections * 4)
+    stats = {"sent": 0, "failed": 0, "skipped": 0, "connects": 0}
+    stats_lock = threading.Lock()
+    started = time.monotonic()
+
+    def sender(session) -> None:
+        try:
+            while True:
+                job = work.get()
+                if job is None:
+                    return
+                key, msg = job
+                limiter.acquire()
+                try:
+                    session.send(msg)
+                except Exception as exc:
+                    session.close()
+                    checkpoint.record(key, "failed")
+                    with stats_lock:
+                        stats["failed"] += 1
+                    if log:
+                        log(f"{key}: {exc}")
+                    continue
+                checkpoint.record(key, "sent")
+                with stats_lock:
+                    stats["sent"] += 1
+                    done = stats["sent"] + stats["failed"]
+                if log and done % progress_every == 0:
+                    elapsed = time.monotonic() - started
+                    log(f"progress: {done} messages, {done / elapsed:.1f} msg/s")
+        finally:
+            session.close()
+            with stats_lock:
+                stats["connects"] += getattr(session, "connects", 0)
+
+    sessions = [session_factory() for _ in range(max(1, connections))]
+    threads = [threading.Thread(target=sender, args=(session,), daemon=True) for session in sessions]
+    for thread in threads:
+        thread.start()
+    try:
+        for key, recipient in jobs:
+            if checkpoint.done(key):
+                stats["skipped"] += 1
+                continue
+            work.put((key, render(recipient)))
+    finally:
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+        checkpoint.close()
+
+    elapsed = time.monotonic() - started
+    sent_or_failed = stats["sent"] + stats["failed"]
+    return {
+        **stats,
+        "elapsed_sec": round(elapsed, 3),
+        "messages_per_sec": round(sent_or_failed / elapsed, 2) if elapsed > 0 else 0.0,
+    }
@@ -0,0 +1,27 @@
+CERTIFICATE_PREFIX = "RCPT"
+
+
+def format_certificate_no(year: int, sequence: int) -> str:
+    return f"{CERTIFICATE_PREFIX}-{year}-{sequence:06d}"
+
+
+def allocate_certificate_sequence(cur, year: int, count: int = 1) -> int:
+    """Reserve ``count`` consecutive numbers for ``year``; returns the first.
+
+    One statement bumps the per-year counter and hands the new value back
+    through LAST_INSERT_ID(expr), which the server reports as the insert id.
+    The counter row stays locked until the caller's transaction ends, so
+    concurrent workers are serialised per year; a rollback returns the
+    numbers, while a crash between transactions at worst leaves a gap.
+    """
+    if count < 1:
+        raise ValueError("count must be >= 1")
+    cur.execute(
+        """
+        INSERT INTO certificate_sequences (year, last_value)
+        VALUES (%s, LAST_INSERT_ID(%s))
+        ON DUPLICATE KEY UPDATE last_value = LAST_INSERT_ID(last_value + %s)
+        """,
+        (year, count, count),
+    )
+    return cur.lastrowid - count + 1
@@ -0,0 +1,160 @@
+import random
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+COUNTERS_TABLE = "receipt_counters"
+# Writers add to a random slot so concurrent submissions do not all queue
+# on one counter row; readers sum the slots.
+COUNTER_SLOTS = 8
+STATE_COLUMNS = "is_deleted, is_checked, status, payment_method"
+
+
+def counter_names(state: dict | None) -> set[str]:
+    """Counters a donation_receipts row with ``state`` contributes 1 to."""
+    if state is None:
+        return set()
+    if state["is_deleted"]:
+        return {"deleted"}
+    names = {"active", f"status:{state['status']}", f"payment:{state['payment_method']}"}
+    if state["is_checked"]:
+        names.add("checked")
+    return names
+
+
+def apply_deltas(cur, deltas: dict[str, int]) -> None:
+    changes = [(name, random.randrange(COUNTER_SLOTS), delta) for name, delta in deltas.items() if delta]
+    if not changes:
+        return
+    cur.execute(
+        f"""
+        INSERT INTO {COUNTERS_TABLE} (name, slot, value)
+        VALUES {', '.join(['(%s, %s, %s)'] * len(changes))}
+        ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+        """,
+        [value for change in changes for value in change],
+    )
+
+
+def add_transition(deltas: dict[str, int], before: dict | None, after: dict | None) -> None:
+    old, new = counter_names(before), counter_names(after)
+    for name in new - old:
+        deltas[name] = deltas.get(name, 0) + 1
+    for name in old - new:
+        deltas[name] = deltas.get(name, 0) - 1
+
+
+def record_transition(cur, before: dict | None, after: dict | None) -> None:
+    """Adjust counters for a row going from ``before`` to ``after`` (None = absent).
+
+    Must run in the same transaction as the row change itself.
+    """
+    deltas: dict[str, int] = {}
+    add_transition(deltas, before, after)
+    apply_deltas(cur, deltas)
+
+
+def lock_receipt_states(cur, receipt_ids: list[int]) -> dict[int, dict]:
+    """Read receipts' counted columns and lock the rows until commit."""
+    if not receipt_ids:
+        return {}
+    cur.execute(
+        f"""
+        SELECT id, {STATE_COLUMNS} FROM donation_receipts
+        WHERE id IN ({', '.join(['%s'] * len(receipt_ids))})
+        FOR UPDATE
+        """,
+        list(receipt_ids),
+    )
+    return {row["id"]: row for row in cur.fetchall()}
+
+
+@contextmanager
+def track_receipt_changes(cur, receipt_ids: list[int]) -> Iterator[dict[int, dict]]:
+    """Lock receipts, let the caller update them, then apply the counter changes.
+
+    Yields ``{id: state}`` from before the update for the rows that exist.
+    All changes go into one counters write.
+    """
+    before = lock_receipt_states(cur, receipt_ids)
+    yield before
+    if not before:
+        return
+    cur.execute(
+        f"SELECT id, {STATE_COLUMNS} FROM donation_receipts WHERE id IN ({', '.join(['%s'] * len(before))})",
+        list(before),
+    )
+    deltas: dict[str, int] = {}
+    for after in cur.fetchall():
+        add_transition(deltas, before[after["id"]], after)
+    apply_deltas(cur, deltas)
+
+
+@contextmanager
+def track_receipt_change(cur, receipt_id: int) -> Iterator[dict | None]:
+    """Single-row track_receipt_changes(); yields the prior state or None."""
+    with track_receipt_changes(cur, [receipt_id]) as before:
+        yield before.get(receipt_id)
+
+
+def read_counters(cur) -> dict[str, int]:
+    cur.execute(f"SELECT name, SUM(value) AS value FROM {COUNTERS_TABLE} GROUP BY name")
+    return {row["name"]: int(row["value"]) for row in cur.fetchall()}
+
+
+def count_receipts(cur) -> dict[str, int]:
+    """Recompute every counter from donation_receipts (full scan)."""
+    cur.execute(
+        """
+        SELECT is_deleted, is_checked, status, payment_method, COUNT(*) AS cnt
+        FROM donation_receipts
+        GROUP BY is_deleted, is_checked, status, payment_method
+        """
+    )
+    totals: dict[str, int] = {}
+    for row in cur.fetchall():
+        for name in counter_names(row):
+            totals[name] = totals.get(name, 0) + int(row["cnt"])
+    return totals
+
+
+def count_for_filters(values: dict[str, int], filters: dict) -> int | None:
+    """Answer a dashboard count from counters, or None if it needs a query."""
+    if not filters:
+        return values.get("active", 0)
+    if len(filters) != 1:
+        return None
+    (key, value), = filters.items()
+    if key == "status":
+        return values.get(f"status:{value}", 0)
+    if key == "payment_method":
+        return values.get(f"payment:{value}", 0)
+    if key == "is_checked":
+        checked = values.get("checked", 0)
+        return checked if value == "1" else values.get("active", 0) - checked
+    return None
+
+
+def reconcile(conn, fix: bool = False, log: Callable[[str], None] | None = None) -> dict[str, int]:
+    """Return ``{name: actual - counted}`` for every counter that drifted.
+
+    The recount and the counter read come from one consistent snapshot, and
+    writers change a receipt and its counters in one transaction, so the
+    drift can be added back as a delta while the site keeps taking writes.
+    """
+    with conn.cursor() as cur:
+        cur.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+        actual = count_receipts(cur)
+        counted = read_counters(cur)
+        conn.commit()
+        drift = {
+            name: actual.get(name, 0) - counted.get(name, 0)
+            for name in sorted(set(actual) | set(counted))
+            if actual.get(name, 0) != counted.get(name, 0)
+        }
+        if log:
+            for name, delta in drift.items():
+                log(f"{name}: counted {counted.get(name, 0)}, actual {actual.get(name, 0)} ({delta:+d})")
+        if fix and drift:
+            apply_deltas(cur, drift)
+            conn.commit()
+    return drift
@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+from pymysql.constants import SERVER_STATUS
+
+
+class PoolExhaustedError(RuntimeError):
+    pass
+
+
+class PooledConnection:
+    """Proxy for a pooled connection; close() hands it back to the pool."""
+
+    def __init__(self, pool: "ConnectionPool", raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get("_raw")
+        if raw is None:
+            raise RuntimeError("接続は既にプールへ返却されています。")
+        return getattr(raw, name)
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def close(self) -> None:
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of DB-API connections.
+
+    Idle connections are kept LIFO so the hot ones are reused and the cold
+    ones age out after ``idle_timeout`` seconds. A connection that sat idle
+    longer than ``ping_interval`` is pinged (with reconnect) on checkout.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], object],
+        max_size: int = 4,
+        max_idle: int = 2,
+        idle_timeout: float = 300.0,
+        ping_interval: float = 30.0,
+        checkout_timeout: float = 10.0,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        self._connect = connect
+        self.max_size = max_size
+        self.max_idle = max(0, min(max_idle, max_size))
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self.checkout_timeout = checkout_timeout
+        self._idle: deque = deque()
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            "created": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "reconnects": 0,
+            "evicted_idle": 0,
+            "discarded": 0,
+        }
+
+    def acquire(self) -> PooledConnection:
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("接続プールは既に閉じられています。")
+                self._evict_expired_locked()
+                if self._idle:
+                    raw, last_used = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use < self.max_size:
+                    raw, last_used = None, None
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolExhaustedError(
+                        f"DB接続プールが上限（{self.max_size}）に達しています。"
+                    )
+                self._stats["waits"] += 1
+                self._cond.wait(remaining)
+            self._stats["checkouts"] += 1
+
+        try:
+            if raw is None:
+                raw = self._create()
+            elif time.monotonic() - last_used >= self.ping_interval:
+                raw = self._health_check(raw)
+        except BaseException:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw)
+
+    def release(self, raw) -> None:
+        keep = True
+        try:
+            if getattr(raw, "server_status", 0) & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                raw.rollback()
+        except Exception:
+            keep = False
+
+        with self._cond:
+            self._in_use -= 1
+            if keep and not self._closed and len(self._idle) < self.max_idle:
+                self._idle.append((raw, time.monotonic()))
+                raw = None
+            elif not keep:
+                self._stats["discarded"] += 1
+            self._cond.notify()
+        if raw is not None:
+            _close_quietly(raw)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._cond.notify_all()
+        for raw, _ in idle:
+            _close_quietly(raw)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                **self._stats,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "max_size": self.max_size,
+                "max_idle": self.max_idle,
+                "idle_timeout": self.idle_timeout,
+            }
+
+    def _create(self):
+        raw = self._connect()
+        with self._cond:
+            self._stats["created"] += 1
+        return raw
+
+    def _health_check(self, raw):
+        try:
+            raw.ping(reconnect=True)
+            return raw
+        except Exception:
+            _close_quietly(raw)
+            with self._cond:
+                self._stats["reconnects"] += 1
+            return self._create()
+
+    def _evict_expired_locked(self) -> None:
+        now = time.monotonic()
+        # Oldest connections sit at the left end.
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            raw, _ = self._idle.popleft()
+            self._stats["evicted_idle"] += 1
+            _close_quietly(raw)
+
+
+def _close_quietly(raw) -> None:
+    try:
+        raw.close()
+    except Exception:
+        pass
@@ -0,0 +1,142 @@
+import threading
+import time
+from typing import Callable
+
+import pymysql
+
+from db_pool import ConnectionPool, PoolExhaustedError, PooledConnection
+
+STATUS_QUERIES = (
+    ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+    # MySQL < 8.0.22 and MariaDB
+    ("SHOW SLAVE STATUS", "Seconds_Behind_Master"),
+)
+
+
+def replica_lag(conn) -> float | None:
+    """Seconds the replica is behind its source, or None if it is not replicating.
+
+    None covers both a server with no replication configured and a stopped
+    SQL thread (Seconds_Behind_Source is NULL then). Needs the
+    REPLICATION CLIENT privilege.
+    """
+    for index, (query, column) in enumerate(STATUS_QUERIES):
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                cur.execute(query)
+                row = cur.fetchone()
+        except pymysql.err.ProgrammingError:
+            if index == len(STATUS_QUERIES) - 1:
+                raise
+            continue
+        if not row or row.get(column) is None:
+            return None
+        return float(row[column])
+    return None
+
+
+class ReplicaRouter:
+    """Hands out connections to a read replica while it is usable.
+
+    acquire() returns None instead of a connection when the caller should
+    read from the primary: the replica could not be reached in the last
+    ``retry_interval`` seconds, its pool is exhausted, or it is more than
+    ``max_lag`` seconds behind (or not replicating at all). The lag is
+    read with one of the pooled connections at most every
+    ``check_interval`` seconds; ``max_lag <= 0`` turns the check off.
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        max_lag: float = 5.0,
+        check_interval: float = 5.0,
+        retry_interval: float = 30.0,
+        on_fallback: Callable[[str], None] | None = None,
+        lag_of: Callable[[object], float | None] = replica_lag,
+    ):
+        self.pool = pool
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self._on_fallback = on_fallback
+        self._lag_of = lag_of
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self._last_error = ""
+        self._lag: float | None = None
+        self._lag_ok = True
+        self._lag_checked_at: float | None = None
+
+    def acquire(self) -> PooledConnection | None:
+        now = time.monotonic()
+        with self._lock:
+            if now < self._down_until:
+                return self._fallback("down")
+            lag_fresh = self._lag_checked_at is not None and now - self._lag_checked_at < self.check_interval
+            if not self._lag_ok and lag_fresh:
+                return self._fallback("lag")
+            check_lag = self.max_lag > 0 and not lag_fresh
+            if check_lag:
+                # Other threads keep the previous verdict until this check lands.
+                self._lag_checked_at = now
+
+        try:
+            conn = self.pool.acquire()
+        except PoolExhaustedError:
+            return self._fallback("busy")
+        except Exception as exc:
+            self._mark_down(exc)
+            return self._fallback("down")
+        if not check_lag:
+            return conn
+
+        try:
+            lag = self._lag_of(conn)
+        except Exception as exc:
+            conn.close()
+            self._mark_down(exc)
+            return self._fallback("down")
+        with self._lock:
+            self._lag = lag
+            self._lag_ok = lag is not None and lag <= self.max_lag
+            lag_ok = self._lag_ok
+        if not lag_ok:
+            conn.close()
+            return self._fallback("lag")
+        return conn
+
+    def available(self) -> bool:
+        """Whether reads may go to the replica now (runs the same checks as acquire())."""
+        conn = self.acquire()
+        if conn is None:
+            return False
+        conn.close()
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            if time.monotonic() < self._down_until:
+                state = "down"
+            elif not self._lag_ok:
+                state = "lagging"
+            else:
+                state = "ok"
+            return {
+                "state": state,
+                "lag_seconds": self._lag,
+                "max_lag": self.max_lag,
+                "last_error": self._last_error,
+                "pool": self.pool.stats(),
+            }
+
+    def _mark_down(self, exc: Exception) -> None:
+        with self._lock:
+            self._down_until = time.monotonic() + self.retry_interval
+            self._last_error = str(exc)
+            self._lag_checked_at = None
+
+    def _fallback(self, reason: str) -> None:
+        if self._on_fallback is not None:
+            self._on_fallback(reason)
+        return None
@@ -0,0 +1,94 @@
+"""Minimal SMTP sink for local testing of the outbox worker and bulk mailer.
+
+Accepts every message without TLS or authentication, counts it and
+optionally writes it to a directory as .eml. Point the app at it with:
+
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=2525 SMTP_STARTTLS=0 SMTP_AUTH=0 FROM_MAIL=noreply@example.org
+
+Usage: python devtools/smtp_sink.py [--port 2525] [--out DIR] [--delay SEC]
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+from pathlib import Path
+from uuid import uuid4
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        self.reply("220 smtp-sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip().upper()
+            if command.startswith("EHLO"):
+                self.wfile.write(b"250-smtp-sink\r\n250-8BITMIME\r\n250 SMTPUTF8\r\n")
+            elif command.startswith("HELO"):
+                self.reply("250 smtp-sink")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                self.receive_data()
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+    def receive_data(self) -> None:
+        chunks = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line in (b".\r\n", b".\n"):
+                break
+            chunks.append(line[1:] if line.startswith(b"..") else line)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.received += 1
+        if self.server.out_dir:
+            (self.server.out_dir / f"{uuid4().hex}.eml").write_bytes(b"".join(chunks))
+        self.reply("250 OK queued")
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, out_dir: Path | None = None, delay: float = 0.0):
+        super().__init__(address, SinkHandler)
+        self.out_dir = out_dir
+        self.delay = delay
+        self.received = 0
+        self.lock = threading.Lock()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--out", type=Path, default=None, help="write received messages here")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to stall per message")
+    args = parser.parse_args()
+    if args.out:
+        args.out.mkdir(parents=True, exist_ok=True)
+
+    server = SinkServer((args.host, args.port), out_dir=args.out, delay=args.delay)
+    print(f"smtp sink listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"received {server.received} messages")
+
+
+if __name__ == "__main__":
+    main()
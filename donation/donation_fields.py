@@ -0,0 +1,25 @@
+from typing import Mapping
+
+from amounts import parse_amount_yen
+
+
+def validate_donation(fields: Mapping[str, str], payment_methods) -> dict:
+    """Check one donation's input the way the donation form does.
+
+    Returns the stripped fields plus ``amount_value``; raises ValueError
+    with the message shown to the donor (or in an import's error report).
+    """
+    donation = {
+        "name": (fields.get("name") or "").strip() or "匿名",
+        "postal_code": (fields.get("postal_code") or "").strip(),
+        "address": (fields.get("address") or "").strip(),
+        "email": (fields.get("email") or "").strip(),
+        "amount": (fields.get("amount") or "").strip(),
+        "payment_method": (fields.get("payment_method") or "").strip() or "未指定",
+    }
+    if not donation["postal_code"] or not donation["address"] or not donation["email"] or not donation["amount"]:
+        raise ValueError("postal_code / address / email / amount は必須です。")
+    if donation["payment_method"] not in payment_methods:
+        raise ValueError("payment_method は 現金 / 振込 / クレジットカード のみ指定できます。")
+    donation["amount_value"] = parse_amount_yen(donation["amount"])
+    return donation
@@ -0,0 +1,124 @@
+import hashlib
+import re
+import threading
+import time
+from typing import Mapping
+
+IDEMPOTENCY_TABLE = "submit_idempotency"
+# GET_LOCK names are limited to 64 characters: prefix + the longest key.
+LOCK_PREFIX = "donation_submit:"
+KEY_RE = re.compile(r"^[A-Za-z0-9_-]{16,48}$")
+FINGERPRINT_FIELDS = ("name", "postal_code", "address", "email", "amount", "payment_method")
+
+
+class SubmitInProgress(RuntimeError):
+    """Another request with the same key is still being processed."""
+
+
+class KeyReused(ValueError):
+    """The key was already used for a donation with different input."""
+
+
+def request_fingerprint(donation: Mapping[str, str]) -> str:
+    payload = "\x1f".join(str(donation.get(field, "")) for field in FINGERPRINT_FIELDS)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def check_fingerprint(result: dict, fingerprint: str) -> dict:
+    if result["fingerprint"] != fingerprint:
+        raise KeyReused("この送信は既に別の内容で受け付けています。ページを再読み込みしてから送信してください。")
+    return result
+
+
+class ResultCache:
+    """Per-process memory of recent submit results by idempotency key.
+
+    A double click usually lands on the same gunicorn worker within a
+    second; answering it from here skips the pool checkout and lock.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: dict[str, tuple[float, dict]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def put(self, key: str, result: dict) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                while len(self._entries) >= self.max_entries:
+                    # Insertion order: the oldest entry goes first.
+                    del self._entries[next(iter(self._entries))]
+            self._entries[key] = (now + self.ttl, result)
+
+
+def acquire_lock(conn, key: str, timeout: float) -> None:
+    """Take the MySQL named lock for ``key`` on this connection's session.
+
+    A concurrent duplicate waits here until the first request has
+    committed (or failed) and released it.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT GET_LOCK(%s, %s) AS locked", (LOCK_PREFIX + key, timeout))
+        if cur.fetchone()["locked"] != 1:
+            raise SubmitInProgress("同じ寄付を処理中です。しばらくしてから再度お試しください。")
+
+
+def release_lock(conn, key: str) -> None:
+    with conn.cursor() as cur:
+        cur.execute("SELECT RELEASE_LOCK(%s)", (LOCK_PREFIX + key,))
+        cur.fetchone()
+
+
+def find_result(cur, key: str) -> dict | None:
+    cur.execute(
+        f"""
+        SELECT
+            k.request_hash AS fingerprint,
+            r.donor_name AS name,
+            r.download_token AS token,
+            r.certificate_no,
+            r.payment_method
+        FROM {IDEMPOTENCY_TABLE} k
+        JOIN donation_receipts r ON r.id = k.receipt_id
+        WHERE k.idem_key=%s
+        """,
+        (key,),
+    )
+    return cur.fetchone()
+
+
+def record_result(cur, key: str, fingerprint: str, receipt_id: int) -> None:
+    """Remember ``key`` in the caller's transaction (the one inserting the receipt)."""
+    cur.execute(
+        f"INSERT INTO {IDEMPOTENCY_TABLE} (idem_key, request_hash, receipt_id) VALUES (%s, %s, %s)",
+        (key, fingerprint, receipt_id),
+    )
+
+
+def purge_expired(conn, retention_days: int, batch_size: int = 5000) -> int:
+    """Delete keys older than ``retention_days`` in small committed batches."""
+    removed = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute(
+                f"DELETE FROM {IDEMPOTENCY_TABLE} WHERE created_at < NOW() - INTERVAL %s DAY LIMIT %s",
+                (retention_days, batch_size),
+            )
+            deleted = cur.rowcount
+            conn.commit()
+            removed += deleted
+            if deleted < batch_size:
+                return removed
@@ -0,0 +1,93 @@
+import smtplib
+import time
+from email.message import EmailMessage
+
+
+class SMTPSession:
+    """A lazily opened SMTP connection reused across many messages.
+
+    The connection is re-established when the server drops it, when it has
+    been idle for ``idle_timeout`` seconds, or after ``max_messages`` sends
+    (providers such as Gmail cap messages per connection).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str = "",
+        password: str = "",
+        starttls: bool = True,
+        timeout: float = 20.0,
+        idle_timeout: float = 60.0,
+        max_messages: int = 100,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self._server: smtplib.SMTP | None = None
+        self._sent_on_connection = 0
+        self._last_used = 0.0
+        self.connects = 0
+
+    def send(self, msg: EmailMessage) -> None:
+        self._ensure_connected()
+        try:
+            self._server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # Stale connection: reconnect once and retry.
+            self.close()
+            self._ensure_connected()
+            self._server.send_message(msg)
+        self._sent_on_connection += 1
+        self._last_used = time.monotonic()
+
+    def close(self) -> None:
+        server, self._server = self._server, None
+        self._sent_on_connection = 0
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def close_if_idle(self) -> None:
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+
+    def _ensure_connected(self) -> None:
+        if self._server is not None and (
+            self._sent_on_connection >= self.max_messages
+            or time.monotonic() - self._last_used > self.idle_timeout
+        ):
+            self.close()
+        if self._server is not None:
+            return
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.user:
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        self._sent_on_connection = 0
+        self._last_used = time.monotonic()
+        self.connects += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
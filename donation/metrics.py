@@ -0,0 +1,273 @@
+import atexit
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable
+from uuid import uuid4
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ARCHIVE_NAME = "archive.json"
+LOCK_NAME = ".lock"
+
+GaugeSource = Callable[[], Iterable[tuple[str, dict, float]]]
+
+
+def _label_key(labels: dict | None) -> tuple:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class MetricsRegistry:
+    """Counters, histograms and gauges rendered in Prometheus text format.
+
+    Without ``directory`` the values live in this process only. With it,
+    every process (gunicorn workers, the outbox worker) writes its totals
+    to ``<directory>/metrics-<pid>-<id>.json`` from a background thread
+    every ``flush_interval`` seconds, and render() sums all the files, so a
+    scrape sees the whole service whichever worker answers it. Files of
+    processes that have exited are folded into archive.json, keeping the
+    counters monotonic across worker restarts. Gauges only come from
+    processes that are still running.
+    """
+
+    def __init__(self, directory: str | Path | None = None, flush_interval: float = 1.0):
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self._meta: dict[str, tuple[str, str, tuple]] = {}
+        self._gauge_sources: list[GaugeSource] = []
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        # Also runs in a forked child: the parent's values are not ours.
+        self._pid = os.getpid()
+        self._counters: dict[tuple, float] = {}
+        self._histograms: dict[tuple, list] = {}
+        self._path = None
+        if self.directory is not None:
+            self._path = self.directory / f"metrics-{self._pid}-{uuid4().hex[:8]}.json"
+        self._flusher: threading.Thread | None = None
+
+    def _check_pid(self) -> None:
+        if self._pid != os.getpid():
+            self._reset()
+
+    def counter(self, name: str, help_text: str) -> None:
+        self._meta[name] = ("counter", help_text, ())
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self._meta[name] = ("histogram", help_text, tuple(sorted(buckets)))
+
+    def gauge(self, name: str, help_text: str) -> None:
+        self._meta[name] = ("gauge", help_text, ())
+
+    def gauge_source(self, source: GaugeSource) -> None:
+        """Register ``source()`` -> ``[(name, labels, value), ...]``, read at each flush."""
+        self._gauge_sources.append(source)
+
+    def inc(self, name: str, labels: dict | None = None, amount: float = 1) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._check_pid()
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._start_flusher()
+
+    def observe(self, name: str, value: float, labels: dict | None = None) -> None:
+        buckets = self._meta[name][2]
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._check_pid()
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+            self._start_flusher()
+
+    def _gauges(self) -> list:
+        values = []
+        for source in self._gauge_sources:
+            try:
+                values.extend([name, dict(labels), value] for name, labels, value in source())
+            except Exception:
+                pass
+        return values
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            self._check_pid()
+            return {
+                "pid": self._pid,
+                "updated": time.time(),
+                "counters": [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [
+                    [name, dict(labels), list(entry[0]), entry[1], entry[2]]
+                    for (name, labels), entry in self._histograms.items()
+                ],
+            }
+
+    def _start_flusher(self) -> None:
+        if self._path is None or self._flusher is not None:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, args=(self._pid,), daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self, pid: int) -> None:
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def flush(self) -> None:
+        """Write this process's values to its file (atomically)."""
+        if self._path is None:
+            return
+        snapshot = self._snapshot()
+        snapshot["gauges"] = self._gauges()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._path.with_name(f".{self._path.name}.tmp")
+        tmp_path.write_text(json.dumps(snapshot), encoding="utf-8")
+        os.replace(tmp_path, self._path)
+
+    def _read(self, path: Path) -> dict | None:
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _collect_files(self) -> list[dict]:
+        """Read every process file, folding those of exited processes into the archive."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / LOCK_NAME, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            archive_path = self.directory / ARCHIVE_NAME
+            archive = self._read(archive_path) or {"counters": [], "histograms": []}
+            live: list[dict] = []
+            dead: list[Path] = []
+            for path in sorted(self.directory.glob("metrics-*.json")):
+                data = self._read(path)
+                if data is None:
+                    continue
+                if data["pid"] == os.getpid() or _pid_alive(data["pid"]):
+                    if data.get("updated", 0) < time.time() - max(10.0, self.flush_interval * 5):
+                        # A reused pid can make a dead file look alive; its gauges are stale.
+                        data["gauges"] = []
+                    live.append(data)
+                else:
+                    dead.append(path)
+                    archive = self._merge([archive, data], include_gauges=False)
+            if dead:
+                tmp_path = archive_path.with_name(f".{ARCHIVE_NAME}.tmp")
+                tmp_path.write_text(json.dumps(archive), encoding="utf-8")
+                os.replace(tmp_path, archive_path)
+                for path in dead:
+                    path.unlink(missing_ok=True)
+        return [archive, *live]
+
+    def _merge(self, snapshots: list[dict], include_gauges: bool = True) -> dict:
+        counters: dict[tuple, float] = {}
+        histograms: dict[tuple, list] = {}
+        gauges: dict[tuple, float] = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot.get("counters", []):
+                key = (name, _label_key(labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, bucket_counts, total, count in snapshot.get("histograms", []):
+                key = (name, _label_key(labels))
+                entry = histograms.get(key)
+                if entry is None:
+                    histograms[key] = [list(bucket_counts), total, count]
+                elif len(entry[0]) == len(bucket_counts):
+                    entry[0] = [a + b for a, b in zip(entry[0], bucket_counts)]
+                    entry[1] += total
+                    entry[2] += count
+            if include_gauges:
+                for name, labels, value in snapshot.get("gauges", []):
+                    key = (name, _label_key(labels))
+                    gauges[key] = gauges.get(key, 0) + value
+        return {
+            "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+            "histograms": [[name, dict(labels), *entry] for (name, labels), entry in histograms.items()],
+            "gauges": [[name, dict(labels), value] for (name, labels), value in gauges.items()],
+        }
+
+    def collect(self) -> dict:
+        if self.directory is None:
+            snapshot = self._snapshot()
+            snapshot["gauges"] = self._gauges()
+            return self._merge([snapshot])
+        self.flush()
+        return self._merge(self._collect_files())
+
+    def render(self) -> str:
+        merged = self.collect()
+        series: dict[str, list] = {}
+        for kind in ("counters", "histograms", "gauges"):
+            for item in merged[kind]:
+                series.setdefault(item[0], []).append(item)
+        lines: list[str] = []
+        for name, (kind, help_text, buckets) in sorted(self._meta.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for item in sorted(series.get(name, []), key=lambda item: _label_key(item[1])):
+                labels = _label_key(item[1])
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(item[2])}")
+                    continue
+                bucket_counts, total, count = item[2], item[3], item[4]
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, bucket_counts):
+                    cumulative += bucket_count
+                    le = (("le", _format_value(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+                lines.append(f'{name}_bucket{_format_labels(labels, (("le", "+Inf"),))} {count}')
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        """Write a final snapshot; registered with atexit for the process."""
+        if self._pid == os.getpid():
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def install_atexit(self) -> None:
+        atexit.register(self.close)
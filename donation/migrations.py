@@ -0,0 +1,352 @@
+from typing import Callable
+
+import counters
+import idempotency
+from amounts import parse_amount_yen
+from search import search_columns
+
+SCHEMA_VERSION_TABLE = "schema_version"
+MIGRATION_LOCK_NAME = "donation_schema_migration"
+
+# (version, description, apply(cur)) in ascending version order.
+MIGRATIONS: list[tuple[int, str, Callable]] = []
+
+
+def migration(version: int, description: str):
+    def register(func: Callable) -> Callable:
+        if MIGRATIONS and MIGRATIONS[-1][0] >= version:
+            raise ValueError(f"migration {version} is out of order")
+        MIGRATIONS.append((version, description, func))
+        return func
+
+    return register
+
+
+def column_exists(cur, table: str, column: str) -> bool:
+    cur.execute(
+        """
+        SELECT COUNT(*) AS cnt
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND COLUMN_NAME=%s
+        """,
+        (table, column),
+    )
+    return cur.fetchone()["cnt"] > 0
+
+
+def index_exists(cur, table: str, index: str) -> bool:
+    cur.execute(
+        """
+        SELECT COUNT(*) AS cnt
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND INDEX_NAME=%s
+        """,
+        (table, index),
+    )
+    return cur.fetchone()["cnt"] > 0
+
+
+def add_column_if_missing(cur, table: str, column: str, definition: str) -> None:
+    if not column_exists(cur, table, column):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def add_index_if_missing(cur, table: str, index: str, columns: str) -> None:
+    # INPLACE/LOCK=NONE keeps the table writable while a large index builds.
+    if not index_exists(cur, table, index):
+        cur.execute(f"ALTER TABLE {table} ADD INDEX {index} ({columns}), ALGORITHM=INPLACE, LOCK=NONE")
+
+
+@migration(1, "create donation_receipts")
+def _create_donation_receipts(cur) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS donation_receipts (
+            id BIGINT NOT NULL AUTO_INCREMENT,
+            certificate_no VARCHAR(32) NOT NULL,
+            donor_name VARCHAR(255) NOT NULL,
+            donor_postal_code VARCHAR(16) NOT NULL,
+            donor_address VARCHAR(255) NOT NULL,
+            donor_email VARCHAR(255) NOT NULL,
+            amount_yen VARCHAR(64) NOT NULL,
+            payment_method VARCHAR(64) NOT NULL,
+            donated_at DATETIME NOT NULL,
+            download_token VARCHAR(64) DEFAULT NULL,
+            status VARCHAR(32) NOT NULL DEFAULT 'created',
+            is_checked TINYINT(1) NOT NULL DEFAULT 0,
+            checked_at DATETIME DEFAULT NULL,
+            checked_by VARCHAR(64) DEFAULT NULL,
+            is_deleted TINYINT(1) NOT NULL DEFAULT 0,
+            deleted_at DATETIME DEFAULT NULL,
+            deleted_by VARCHAR(64) DEFAULT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id),
+            UNIQUE KEY uk_certificate_no (certificate_no),
+            UNIQUE KEY uk_download_token (download_token)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """
+    )
+
+
+@migration(2, "add donor/check/delete columns to pre-existing donation_receipts")
+def _add_legacy_columns(cur) -> None:
+    # Tables created by early versions of the app lack these columns.
+    add_column_if_missing(cur, "donation_receipts", "donor_postal_code", "VARCHAR(16) NOT NULL DEFAULT ''")
+    add_column_if_missing(cur, "donation_receipts", "donor_address", "VARCHAR(255) NOT NULL DEFAULT ''")
+    add_column_if_missing(cur, "donation_receipts", "is_checked", "TINYINT(1) NOT NULL DEFAULT 0")
+    add_column_if_missing(cur, "donation_receipts", "checked_at", "DATETIME DEFAULT NULL")
+    add_column_if_missing(cur, "donation_receipts", "checked_by", "VARCHAR(64) DEFAULT NULL")
+    add_column_if_missing(cur, "donation_receipts", "is_deleted", "TINYINT(1) NOT NULL DEFAULT 0")
+    add_column_if_missing(cur, "donation_receipts", "deleted_at", "DATETIME DEFAULT NULL")
+    add_column_if_missing(cur, "donation_receipts", "deleted_by", "VARCHAR(64) DEFAULT NULL")
+
+
+@migration(3, "create email_outbox")
+def _create_email_outbox(cur) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id BIGINT NOT NULL AUTO_INCREMENT,
+            receipt_id BIGINT DEFAULT NULL,
+            recipient VARCHAR(255) NOT NULL,
+            subject VARCHAR(255) NOT NULL,
+            body TEXT NOT NULL,
+            attachment MEDIUMBLOB DEFAULT NULL,
+            attachment_name VARCHAR(255) DEFAULT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            claimed_by VARCHAR(64) DEFAULT NULL,
+            claimed_at DATETIME DEFAULT NULL,
+            last_error VARCHAR(1024) DEFAULT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            sent_at DATETIME DEFAULT NULL,
+            PRIMARY KEY (id),
+            KEY idx_outbox_due (status, next_attempt_at),
+            KEY idx_outbox_claim (claimed_by),
+            KEY idx_outbox_receipt (receipt_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """
+    )
+
+
+@migration(4, "create certificate_sequences seeded from issued numbers")
+def _create_certificate_sequences(cur) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS certificate_sequences (
+            year SMALLINT NOT NULL,
+            last_value BIGINT NOT NULL,
+            PRIMARY KEY (year)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """
+    )
+    # Numbers used to be RCPT-<year>-<id>; continue each year after the
+    # highest one already issued so new numbers never collide.
+    cur.execute(
+        """
+        INSERT INTO certificate_sequences (year, last_value)
+        SELECT seq.year, seq.last_value
+        FROM (
+            SELECT
+                CAST(SUBSTRING(certificate_no, 6, 4) AS UNSIGNED) AS year,
+                MAX(CAST(SUBSTRING_INDEX(certificate_no, '-', -1) AS UNSIGNED)) AS last_value
+            FROM donation_receipts
+            WHERE certificate_no LIKE 'RCPT-____-%'
+            GROUP BY CAST(SUBSTRING(certificate_no, 6, 4) AS UNSIGNED)
+        ) AS seq
+        ON DUPLICATE KEY UPDATE last_value = GREATEST(certificate_sequences.last_value, seq.last_value)
+        """
+    )
+
+
+@migration(5, "add dashboard filter indexes to donation_receipts")
+def _add_dashboard_indexes(cur) -> None:
+    # Each index starts with is_deleted and ends with id so a filtered,
+    # keyset-paginated dashboard page is an index range read of 100 rows.
+    add_index_if_missing(cur, "donation_receipts", "idx_active_id", "is_deleted, id")
+    add_index_if_missing(cur, "donation_receipts", "idx_active_status", "is_deleted, status, id")
+    add_index_if_missing(cur, "donation_receipts", "idx_active_payment", "is_deleted, payment_method, id")
+    add_index_if_missing(cur, "donation_receipts", "idx_active_checked", "is_deleted, is_checked, id")
+    add_index_if_missing(cur, "donation_receipts", "idx_active_donated", "is_deleted, donated_at, id")
+
+
+@migration(6, "create receipt_counters seeded from donation_receipts")
+def _create_receipt_counters(cur) -> None:
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {counters.COUNTERS_TABLE} (
+            name VARCHAR(96) NOT NULL,
+            slot TINYINT UNSIGNED NOT NULL,
+            value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, slot)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """
+    )
+    # Start from an exact count; writes that land while this runs are
+    # caught by `flask reconcile-counters --fix`.
+    cur.execute(f"DELETE FROM {counters.COUNTERS_TABLE}")
+    counters.apply_deltas(cur, counters.count_receipts(cur))
+
+
+BACKFILL_BATCH_SIZE = 2000
+
+
+@migration(7, "add validated amount_value to donation_receipts")
+def _add_amount_value(cur) -> None:
+    add_column_if_missing(cur, "donation_receipts", "amount_value", "INT UNSIGNED DEFAULT NULL")
+    add_column_if_missing(cur, "donation_receipts", "amount_invalid", "TINYINT(1) NOT NULL DEFAULT 0")
+    # Parsed in Python so the backfill accepts exactly what /submit does.
+    # Committed per batch to keep transactions small; rows already handled
+    # are skipped, so an interrupted run simply resumes.
+    last_id = 0
+    while True:
+        cur.execute(
+            """
+            SELECT id, amount_yen
+            FROM donation_receipts
+            WHERE id > %s AND amount_value IS NULL AND amount_invalid=0
+            ORDER BY id
+            LIMIT %s
+            """,
+            (last_id, BACKFILL_BATCH_SIZE),
+        )
+        rows = cur.fetchall()
+        if not rows:
+            break
+        valid, invalid = [], []
+        for row in rows:
+            try:
+                valid.append((parse_amount_yen(row["amount_yen"]), row["id"]))
+            except ValueError:
+                invalid.append((row["id"],))
+        if valid:
+            cur.executemany("UPDATE donation_receipts SET amount_value=%s WHERE id=%s", valid)
+        if invalid:
+            cur.executemany("UPDATE donation_receipts SET amount_invalid=1 WHERE id=%s", invalid)
+        cur.connection.commit()
+        last_id = rows[-1]["id"]
+    # Covers the report GROUP BYs so they never touch the clustered index.
+    add_index_if_missing(
+        cur,
+        "donation_receipts",
+        "idx_active_report",
+        "is_deleted, donated_at, payment_method, status, amount_value",
+    )
+
+
+@migration(8, "add normalized search columns and address FULLTEXT index")
+def _add_search_columns(cur) -> None:
+    add_column_if_missing(cur, "donation_receipts", "search_name", "VARCHAR(255) DEFAULT NULL")
+    add_column_if_missing(cur, "donation_receipts", "search_email", "VARCHAR(255) DEFAULT NULL")
+    add_column_if_missing(cur, "donation_receipts", "search_postal", "VARCHAR(16) DEFAULT NULL")
+    # Normalized in Python (NFKC) exactly as new rows are, in committed batches.
+    last_id = 0
+    while True:
+        cur.execute(
+            """
+            SELECT id, donor_name, donor_email, donor_postal_code
+            FROM donation_receipts
+            WHERE id > %s AND search_name IS NULL
+            ORDER BY id
+            LIMIT %s
+            """,
+            (last_id, BACKFILL_BATCH_SIZE),
+        )
+        rows = cur.fetchall()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            values = search_columns(row["donor_name"], row["donor_email"], row["donor_postal_code"])
+            updates.append((values["search_name"], values["search_email"], values["search_postal"], row["id"]))
+        cur.executemany(
+            "UPDATE donation_receipts SET search_name=%s, search_email=%s, search_postal=%s WHERE id=%s",
+            updates,
+        )
+        cur.connection.commit()
+        last_id = rows[-1]["id"]
+    add_index_if_missing(cur, "donation_receipts", "idx_search_name", "search_name")
+    add_index_if_missing(cur, "donation_receipts", "idx_search_email", "search_email")
+    add_index_if_missing(cur, "donation_receipts", "idx_search_postal", "search_postal")
+    if not index_exists(cur, "donation_receipts", "ft_donor_address"):
+        # FULLTEXT cannot be built with LOCK=NONE; writes wait while it builds.
+        cur.execute(
+            "ALTER TABLE donation_receipts ADD FULLTEXT INDEX ft_donor_address (donor_address) WITH PARSER ngram"
+        )
+
+
+@migration(9, "create submit_idempotency")
+def _create_submit_idempotency(cur) -> None:
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {idempotency.IDEMPOTENCY_TABLE} (
+            idem_key VARCHAR(48) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+            request_hash CHAR(64) CHARACTER SET ascii NOT NULL,
+            receipt_id BIGINT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (idem_key),
+            KEY idx_idempotency_created (created_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """
+    )
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def ensure_version_table(cur) -> None:
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+            version INT NOT NULL,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (version)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """
+    )
+
+
+def current_version(conn) -> int:
+    """Return the applied schema version, or 0 when nothing has been applied."""
+    with conn.cursor() as cur:
+        cur.execute("SHOW TABLES LIKE %s", (SCHEMA_VERSION_TABLE,))
+        if cur.fetchone() is None:
+            return 0
+        cur.execute(f"SELECT COALESCE(MAX(version), 0) AS version FROM {SCHEMA_VERSION_TABLE}")
+        return int(cur.fetchone()["version"])
+
+
+def run_migrations(conn, lock_timeout: int = 60, log: Callable[[str], None] | None = None) -> list[int]:
+    """Apply pending migrations in order and return the versions applied.
+
+    A MySQL named lock serialises concurrent runners (several gunicorn
+    workers or a deploy hook racing a worker).
+    """
+    applied: list[int] = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT GET_LOCK(%s, %s) AS locked", (MIGRATION_LOCK_NAME, lock_timeout))
+        if cur.fetchone()["locked"] != 1:
+            raise RuntimeError("スキーマ移行のロックを取得できませんでした。")
+        try:
+            ensure_version_table(cur)
+            conn.commit()
+            version = current_version(conn)
+            for migration_version, description, apply in MIGRATIONS:
+                if migration_version <= version:
+                    continue
+                if log:
+                    log(f"applying migration {migration_version}: {description}")
+                apply(cur)
+                cur.execute(
+                    f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, description) VALUES (%s, %s)",
+                    (migration_version, description),
+                )
+                conn.commit()
+                applied.append(migration_version)
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+            cur.fetchone()
+    return applied
@@ -0,0 +1,254 @@
+import os
+import smtplib
+import socket
+import threading
+from email.message import EmailMessage
+from typing import Callable
+from uuid import uuid4
+
+import counters
+from pipeline import StageHook, StageTimer
+
+# Outbox row lifecycle: pending -> sending -> sent, or back to pending with a
+# backoff after a failure, or dead once max_attempts is reached.
+
+
+def enqueue_email(
+    cur,
+    recipient: str,
+    subject: str,
+    body: str,
+    receipt_id: int | None = None,
+    attachment: bytes | None = None,
+    attachment_name: str | None = None,
+) -> int:
+    """Insert an outbox row using the caller's cursor (and transaction)."""
+    cur.execute(
+        """
+        INSERT INTO email_outbox (
+            receipt_id, recipient, subject, body, attachment, attachment_name, status
+        ) VALUES (%s, %s, %s, %s, %s, %s, 'pending')
+        """,
+        (receipt_id, recipient, subject, body, attachment, attachment_name),
+    )
+    return cur.lastrowid
+
+
+def build_message(row: dict, from_addr: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = row["subject"]
+    msg["From"] = from_addr
+    msg["To"] = row["recipient"]
+    msg.set_content(row["body"])
+    if row.get("attachment"):
+        msg.add_attachment(
+            bytes(row["attachment"]),
+            maintype="application",
+            subtype="pdf",
+            filename=row.get("attachment_name") or "attachment.pdf",
+        )
+    return msg
+
+
+def claim_batch(conn, batch_size: int, stale_after: int) -> list[dict]:
+    """Claim due rows for this worker.
+
+    Rows stuck in 'sending' longer than ``stale_after`` seconds belong to a
+    worker that died mid-send and are claimed again.
+    """
+    claim_id = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid4().hex[:8]}"
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE email_outbox
+            SET status='sending', claimed_by=%s, claimed_at=NOW(), attempts=attempts+1
+            WHERE (status='pending' AND next_attempt_at<=NOW())
+               OR (status='sending' AND claimed_at < NOW() - INTERVAL %s SECOND)
+            ORDER BY id
+            LIMIT %s
+            """,
+            (claim_id, stale_after, batch_size),
+        )
+        if cur.rowcount == 0:
+            conn.commit()
+            return []
+        cur.execute(
+            """
+            SELECT id, receipt_id, recipient, subject, body, attachment, attachment_name, attempts
+            FROM email_outbox
+            WHERE claimed_by=%s AND status='sending'
+            ORDER BY id
+            """,
+            (claim_id,),
+        )
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def mark_sent(conn, row: dict) -> None:
+    with conn.cursor() as cur:
+        # The PDF is no longer needed once delivered.
+        cur.execute(
+            """
+            UPDATE email_outbox
+            SET status='sent', sent_at=NOW(), attachment=NULL, last_error=NULL
+            WHERE id=%s
+            """,
+            (row["id"],),
+        )
+        if row.get("receipt_id"):
+            with counters.track_receipt_change(cur, row["receipt_id"]):
+                cur.execute(
+                    """
+                    UPDATE donation_receipts
+                    SET status='issued'
+                    WHERE id=%s AND status IN ('created', 'mail_failed')
+                    """,
+                    (row["receipt_id"],),
+                )
+    conn.commit()
+
+
+def mark_failed(conn, row: dict, error: str, retry_in: float | None) -> None:
+    """Schedule a retry in ``retry_in`` seconds, or give up when it is None."""
+    with conn.cursor() as cur:
+        if retry_in is None:
+            cur.execute(
+                "UPDATE email_outbox SET status='dead', last_error=%s WHERE id=%s",
+                (error[:1024], row["id"]),
+            )
+        else:
+            cur.execute(
+                """
+                UPDATE email_outbox
+                SET status='pending', last_error=%s, next_attempt_at=NOW() + INTERVAL %s SECOND
+                WHERE id=%s
+                """,
+                (error[:1024], int(retry_in), row["id"]),
+            )
+        if row.get("receipt_id"):
+            with counters.track_receipt_change(cur, row["receipt_id"]):
+                cur.execute(
+                    "UPDATE donation_receipts SET status='mail_failed' WHERE id=%s AND status='created'",
+                    (row["receipt_id"],),
+                )
+    conn.commit()
+
+
+def retry_delay(attempts: int, base: float, cap: float) -> float:
+    return min(cap, base * (2 ** max(0, attempts - 1)))
+
+
+def is_permanent_failure(exc: Exception) -> bool:
+    return isinstance(exc, smtplib.SMTPRecipientsRefused)
+
+
+def requeue_dead(conn, receipt_ids: list[int] | None = None) -> int:
+    with conn.cursor() as cur:
+        sql = "UPDATE email_outbox SET status='pending', attempts=0, next_attempt_at=NOW() WHERE status='dead'"
+        params: tuple = ()
+        if receipt_ids:
+            sql += f" AND receipt_id IN ({', '.join(['%s'] * len(receipt_ids))})"
+            params = tuple(receipt_ids)
+        cur.execute(sql, params)
+        count = cur.rowcount
+    conn.commit()
+    return count
+
+
+def deliver_batch(
+    conn,
+    session,
+    from_addr: str,
+    batch_size: int = 20,
+    max_attempts: int = 8,
+    retry_base: float = 30.0,
+    retry_max: float = 3600.0,
+    stale_after: int = 600,
+    log: Callable[[str], None] | None = None,
+    stage_hooks: list[StageHook] | tuple[StageHook, ...] = (),
+    outcome_hook: Callable[[str], None] | None = None,
+    throttle: Callable[[], None] | None = None,
+) -> tuple[int, int]:
+    """Claim one batch and send it over ``session``; returns (sent, failed).
+
+    ``stage_hooks`` get the time of each "send" and "status_update";
+    ``outcome_hook`` is called with "sent", "retry" or "dead" per message.
+    ``throttle()`` runs before each send and may block to keep under the
+    SMTP provider's rate limit.
+    """
+    sent = failed = 0
+    for row in claim_batch(conn, batch_size, stale_after):
+        timer = StageTimer(stage_hooks)
+        if throttle is not None:
+            throttle()
+        try:
+            with timer.stage("send"):
+                session.send(build_message(row, from_addr))
+        except Exception as exc:
+            failed += 1
+            session.close()
+            if is_permanent_failure(exc) or row["attempts"] >= max_attempts:
+                retry_in = None
+            else:
+                retry_in = retry_delay(row["attempts"], retry_base, retry_max)
+            if log:
+                log(f"outbox {row['id']} failed (attempt {row['attempts']}): {exc}")
+            with timer.stage("status_update"):
+                mark_failed(conn, row, str(exc), retry_in)
+            _report_outcome(outcome_hook, "dead" if retry_in is None else "retry")
+            continue
+        with timer.stage("status_update"):
+            mark_sent(conn, row)
+        _report_outcome(outcome_hook, "sent")
+        sent += 1
+    return sent, failed
+
+
+def _report_outcome(hook: Callable[[str], None] | None, outcome: str) -> None:
+    # Like the stage hooks, instrumentation must not break delivery.
+    if hook is None:
+        return
+    try:
+        hook(outcome)
+    except Exception:
+        pass
+
+
+def run_worker(
+    get_conn: Callable[[], object],
+    session,
+    from_addr: str,
+    poll_interval: float = 5.0,
+    once: bool = False,
+    stop_event: threading.Event | None = None,
+    log: Callable[[str], None] | None = None,
+    **batch_options,
+) -> None:
+    """Drain the outbox until stopped; with once=True stop when it is empty."""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        conn = None
+        try:
+            conn = get_conn()
+            sent, failed = deliver_batch(conn, session, from_addr, log=log, **batch_options)
+        except Exception as exc:
+            if log:
+                log(f"outbox worker error: {exc}")
+            sent = failed = 0
+            if once:
+                raise
+        finally:
+            if conn:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        if sent or failed:
+            continue
+        if once:
+            break
+        session.close_if_idle()
+        stop_event.wait(poll_interval)
+    session.close()
@@ -0,0 +1,32 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+StageHook = Callable[[str, float], None]
+
+
+class StageTimer:
+    """Times the named stages of one request and reports them to hooks.
+
+    Each hook is called as ``hook(stage, seconds)`` when a stage ends,
+    whether it succeeded or raised. Hook errors are swallowed so that
+    instrumentation can never fail a submission.
+    """
+
+    def __init__(self, hooks: list[StageHook] | tuple[StageHook, ...] = ()):
+        self.hooks = hooks
+        self.timings: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.timings[name] = elapsed
+            for hook in self.hooks:
+                try:
+                    hook(name, elapsed)
+                except Exception:
+                    pass
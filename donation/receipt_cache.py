@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+SHARD_RE = re.compile(r"^[0-9a-f]{2}$")
+# Hour directories written by the previous time-bucketed store.
+LEGACY_BUCKET_RE = re.compile(r"^\d{10}$")
+UNSAFE_NAME_RE = re.compile(r"[^A-Za-z0-9_-]")
+TMP_MAX_AGE = 60 * 60
+
+
+class ReceiptCache:
+    """Bounded on-disk cache of rendered receipt PDFs.
+
+    Entries are keyed by certificate number plus a hash of every field that
+    goes into the PDF, so an edited receipt never hits a stale file. Any
+    entry can be rebuilt from its donation_receipts row, so files are
+    evicted least-recently-used first whenever the cache outgrows
+    ``max_bytes``. A hit bumps the file's mtime, which is the LRU clock.
+    Eviction walks the whole cache, so it only runs from the sweep job
+    (``flask receipts-sweep``), never on a request.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, salt: str = ""):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.salt = salt
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def key_for(self, fields: dict) -> str:
+        payload = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+        digest = hashlib.sha256(f"{self.salt}\n{payload}".encode("utf-8")).hexdigest()
+        safe_no = UNSAFE_NAME_RE.sub("_", str(fields["certificate_no"]))
+        return f"{digest[:2]}/{safe_no}-{digest[:24]}"
+
+    def path_for(self, key: str) -> Path:
+        return self.root / f"{key}.pdf"
+
+    def get(self, key: str) -> Path | None:
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key: str, pdf_bytes: bytes) -> Path:
+        # Written under a temporary name and renamed, so a concurrent reader
+        # (or nginx) never sees a partial file.
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as fh:
+            fh.write(pdf_bytes)
+        os.replace(tmp_path, path)
+        return path
+
+    def prune(self) -> int:
+        """Evict least recently used files until under 90% of max_bytes; returns files removed."""
+        removed = 0
+        entries = []
+        total = 0
+        now = time.time()
+        for entry in self.root.iterdir():
+            if entry.is_dir() and LEGACY_BUCKET_RE.match(entry.name):
+                removed += sum(1 for _ in entry.rglob("*.pdf"))
+                shutil.rmtree(entry, ignore_errors=True)
+            elif entry.is_file() and entry.suffix == ".pdf":
+                entry.unlink(missing_ok=True)
+                removed += 1
+            elif entry.is_dir() and SHARD_RE.match(entry.name):
+                for path in entry.iterdir():
+                    try:
+                        stat = path.stat()
+                    except OSError:
+                        continue
+                    if path.suffix == ".tmp":
+                        if now - stat.st_mtime > TMP_MAX_AGE:
+                            path.unlink(missing_ok=True)
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+        if total <= self.max_bytes:
+            return removed
+        target = self.max_bytes * 0.9
+        entries.sort()
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
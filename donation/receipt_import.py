@@ -0,0 +1,198 @@
+import csv
+import io
+import re
+from datetime import datetime
+from typing import Callable
+from uuid import uuid4
+
+import counters
+from certificates import allocate_certificate_sequence, format_certificate_no
+from donation_fields import validate_donation
+from search import search_columns
+
+IMPORT_BATCH_SIZE = 1000
+# Accepted header names per field; the Japanese ones match export.py, so
+# an exported file can be edited and imported again.
+IMPORT_HEADERS = {
+    "name": ("name", "名前"),
+    "postal_code": ("postal_code", "郵便番号"),
+    "address": ("address", "住所"),
+    "email": ("email", "メール"),
+    "amount": ("amount", "金額（入力値）", "金額"),
+    "payment_method": ("payment_method", "支払方法"),
+    "donated_at": ("donated_at", "寄付日時", "寄付日"),
+}
+OPTIONAL_FIELDS = ("name", "donated_at")
+# 2025-04-01, 2025/4/1 10:30, 2025-04-01 10:30:00 (Excel drops zero padding).
+DONATED_AT_RE = re.compile(r"(\d{4})[-/](\d{1,2})[-/](\d{1,2})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?")
+
+
+class ImportFailed(RuntimeError):
+    """A batch failed; ``imported`` rows from earlier batches were committed."""
+
+    def __init__(self, message: str, imported: int):
+        super().__init__(message)
+        self.imported = imported
+
+
+def decode_csv(data: bytes) -> str:
+    """UTF-8 (with or without BOM), falling back to Shift_JIS as saved by Excel."""
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        pass
+    try:
+        return data.decode("cp932")
+    except UnicodeDecodeError as exc:
+        raise ValueError("CSVの文字コードを判別できません。UTF-8 で保存してください。") from exc
+
+
+def parse_donated_at(value: str) -> datetime:
+    # A regex rather than strptime, which dominated the time of a large import.
+    match = DONATED_AT_RE.fullmatch(value.strip())
+    if match:
+        try:
+            return datetime(*(int(part) for part in match.groups(default="0")))
+        except ValueError:
+            pass
+    raise ValueError("寄付日時は YYYY-MM-DD または YYYY-MM-DD HH:MM:SS 形式で指定してください。")
+
+
+def _header_map(header: list[str]) -> dict[str, int]:
+    positions = {name.strip(): index for index, name in enumerate(header)}
+    columns: dict[str, int] = {}
+    for field, names in IMPORT_HEADERS.items():
+        for name in names:
+            if name in positions:
+                columns[field] = positions[name]
+                break
+    missing = [
+        IMPORT_HEADERS[field][0]
+        for field in IMPORT_HEADERS
+        if field not in columns and field not in OPTIONAL_FIELDS
+    ]
+    if missing:
+        raise ValueError(f"CSVに必須の列がありません: {', '.join(missing)}")
+    return columns
+
+
+def parse_import_csv(data: bytes, payment_methods, default_donated_at: datetime) -> tuple[list[dict], list[dict]]:
+    """Validate every row of an import file with the donation form's rules.
+
+    Returns ``(donations, errors)``. Each error is ``{"line", "error",
+    "values"}`` with the file's line number. Raises ValueError when the
+    file itself cannot be read (encoding, missing columns).
+    """
+    reader = csv.reader(io.StringIO(decode_csv(data), newline=""))
+    header = next(reader, None)
+    if header is None:
+        raise ValueError("CSVが空です。")
+    columns = _header_map(header)
+    donations: list[dict] = []
+    errors: list[dict] = []
+    for values in reader:
+        line = reader.line_num
+        if not any(value.strip() for value in values):
+            continue
+        fields = {field: values[index] if index < len(values) else "" for field, index in columns.items()}
+        try:
+            donation = validate_donation(fields, payment_methods)
+            raw_donated_at = (fields.get("donated_at") or "").strip()
+            donation["donated_at"] = parse_donated_at(raw_donated_at) if raw_donated_at else default_donated_at
+        except ValueError as exc:
+            errors.append({"line": line, "error": str(exc), "values": values})
+            continue
+        donation["line"] = line
+        donations.append(donation)
+    return donations, errors
+
+
+def insert_import_batch(cur, donations: list[dict]) -> None:
+    """Insert donations in state "created" with one executemany.
+
+    Certificate numbers are reserved per year in one allocation each, in
+    file order, and the counters get one combined update.
+    """
+    by_year: dict[int, list[dict]] = {}
+    for donation in donations:
+        by_year.setdefault(donation["donated_at"].year, []).append(donation)
+    for year, items in by_year.items():
+        first = allocate_certificate_sequence(cur, year, count=len(items))
+        for offset, donation in enumerate(items):
+            donation["certificate_no"] = format_certificate_no(year, first + offset)
+            donation["download_token"] = uuid4().hex
+
+    rows = []
+    deltas: dict[str, int] = {}
+    for donation in donations:
+        search = search_columns(donation["name"], donation["email"], donation["postal_code"])
+        rows.append(
+            (
+                donation["certificate_no"],
+                donation["name"],
+                donation["postal_code"],
+                donation["address"],
+                donation["email"],
+                donation["amount"],
+                donation["amount_value"],
+                donation["payment_method"],
+                donation["donated_at"],
+                "created",
+                donation["download_token"],
+                search["search_name"],
+                search["search_email"],
+                search["search_postal"],
+            )
+        )
+        counters.add_transition(
+            deltas,
+            None,
+            {"is_deleted": 0, "is_checked": 0, "status": "created", "payment_method": donation["payment_method"]},
+        )
+    # PyMySQL sends this as multi-row INSERTs because VALUES holds only placeholders.
+    cur.executemany(
+        """
+        INSERT INTO donation_receipts (
+            certificate_no, donor_name, donor_postal_code, donor_address, donor_email, amount_yen,
+            amount_value, payment_method, donated_at, status, download_token,
+            search_name, search_email, search_postal
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+        rows,
+    )
+    counters.apply_deltas(cur, deltas)
+
+
+def import_donations(
+    conn,
+    donations: list[dict],
+    batch_size: int = IMPORT_BATCH_SIZE,
+    log: Callable[[str], None] | None = None,
+) -> int:
+    """Insert validated donations, committing every ``batch_size`` rows.
+
+    Each donation gains certificate_no and download_token. Batches that
+    committed before an error stay imported; ImportFailed says how many.
+    """
+    imported = 0
+    for start in range(0, len(donations), batch_size):
+        batch = donations[start:start + batch_size]
+        try:
+            with conn.cursor() as cur:
+                insert_import_batch(cur, batch)
+            conn.commit()
+        except Exception as exc:
+            conn.rollback()
+            raise ImportFailed(f"{batch[0]['line']}行目以降の取り込みに失敗しました: {exc}", imported) from exc
+        imported += len(batch)
+        if log:
+            log(f"imported {imported} / {len(donations)}")
+    return imported
+
+
+def write_error_report(errors: list[dict], out) -> None:
+    """Write errors as CSV: line, error, then the row's original values."""
+    writer = csv.writer(out, lineterminator="\r\n")
+    writer.writerow(["line", "error", "values..."])
+    for error in errors:
+        writer.writerow([error["line"], error["error"], *error["values"]])
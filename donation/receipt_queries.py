@@ -0,0 +1,151 @@
+from datetime import date, datetime, timedelta
+from typing import Mapping
+
+RECEIPT_STATUSES = ("created", "mail_failed", "issued")
+DASHBOARD_PAGE_SIZE = 100
+# Counting every matching row is O(table); past this the page says "N+".
+DASHBOARD_COUNT_CAP = 10000
+DASHBOARD_COLUMNS = """
+    id,
+    certificate_no,
+    donor_name,
+    donor_postal_code,
+    donor_address,
+    donor_email,
+    amount_yen,
+    payment_method,
+    status,
+    is_checked,
+    checked_at,
+    checked_by,
+    is_deleted,
+    deleted_at,
+    deleted_by,
+    donated_at,
+    created_at
+"""
+
+
+def _parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError as exc:
+        raise ValueError("寄付日は YYYY-MM-DD 形式で指定してください。") from exc
+
+
+def parse_filters(args: Mapping[str, str], payment_methods) -> dict:
+    """Validate dashboard filters from query-string style ``args``.
+
+    Empty values mean "no filter". Raises ValueError with a message for
+    the admin when a value is not one the dashboard offers.
+    """
+    filters: dict = {}
+    status = (args.get("status") or "").strip()
+    if status:
+        if status not in RECEIPT_STATUSES:
+            raise ValueError("状態の指定が不正です。")
+        filters["status"] = status
+    payment_method = (args.get("payment_method") or "").strip()
+    if payment_method:
+        if payment_method not in payment_methods:
+            raise ValueError("支払方法の指定が不正です。")
+        filters["payment_method"] = payment_method
+    is_checked = (args.get("is_checked") or "").strip()
+    if is_checked:
+        if is_checked not in ("0", "1"):
+            raise ValueError("確認状態の指定が不正です。")
+        filters["is_checked"] = is_checked
+    for key in ("donated_from", "donated_to"):
+        value = (args.get(key) or "").strip()
+        if value:
+            filters[key] = _parse_date(value).isoformat()
+    return filters
+
+
+def filter_clause(filters: dict) -> tuple[list[str], list]:
+    """WHERE conditions and parameters for active receipts matching ``filters``."""
+    where = ["is_deleted=0"]
+    params: list = []
+    for column in ("status", "payment_method", "is_checked"):
+        if filters.get(column):
+            where.append(f"{column}=%s")
+            params.append(int(filters[column]) if column == "is_checked" else filters[column])
+    if filters.get("donated_from"):
+        where.append("donated_at >= %s")
+        params.append(datetime.fromisoformat(filters["donated_from"]))
+    if filters.get("donated_to"):
+        # The "to" date is inclusive.
+        where.append("donated_at < %s")
+        params.append(datetime.fromisoformat(filters["donated_to"]) + timedelta(days=1))
+    return where, params
+
+
+def page_query(
+    filters: dict,
+    before_id: int | None = None,
+    after_id: int | None = None,
+    limit: int = DASHBOARD_PAGE_SIZE,
+) -> tuple[str, list]:
+    """Newest-first keyset page: ids below ``before_id`` or just above ``after_id``.
+
+    One extra row is fetched to tell whether another page exists.
+    """
+    where, params = filter_clause(filters)
+    order = "DESC"
+    if after_id is not None:
+        where.append("id > %s")
+        params.append(after_id)
+        order = "ASC"
+    elif before_id is not None:
+        where.append("id < %s")
+        params.append(before_id)
+    sql = f"""
+        SELECT {DASHBOARD_COLUMNS}
+        FROM donation_receipts
+        WHERE {' AND '.join(where)}
+        ORDER BY id {order}
+        LIMIT {int(limit) + 1}
+    """
+    return sql, params
+
+
+def fetch_page(
+    cur,
+    filters: dict,
+    before_id: int | None = None,
+    after_id: int | None = None,
+    limit: int = DASHBOARD_PAGE_SIZE,
+) -> dict:
+    cur.execute(*page_query(filters, before_id, after_id, limit))
+    rows = list(cur.fetchall())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after_id is not None:
+        if not has_more:
+            # Paged back to the newest rows: show a full first page instead.
+            return fetch_page(cur, filters, limit=limit)
+        rows.reverse()
+        has_newer, has_older = True, True
+    else:
+        has_newer, has_older = before_id is not None, has_more
+    return {
+        "rows": rows,
+        "has_newer": has_newer and bool(rows),
+        "has_older": has_older and bool(rows),
+        "newest_id": rows[0]["id"] if rows else None,
+        "oldest_id": rows[-1]["id"] if rows else None,
+    }
+
+
+def count_capped(cur, filters: dict, cap: int = DASHBOARD_COUNT_CAP) -> tuple[int, bool]:
+    """Return ``(count, capped)``; counting stops after ``cap`` rows."""
+    where, params = filter_clause(filters)
+    cur.execute(
+        f"""
+        SELECT COUNT(*) AS total
+        FROM (SELECT 1 FROM donation_receipts WHERE {' AND '.join(where)} LIMIT {int(cap) + 1}) AS matched
+        """,
+        params,
+    )
+    total = cur.fetchone()["total"]
+    return min(total, cap), total > cap
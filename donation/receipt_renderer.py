@@ -0,0 +1,271 @@
+import copy
+import io
+import re
+from datetime import datetime
+from pathlib import Path
+
+import reportlab
+from PIL import Image
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfdoc, pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfgen import canvas
+from reportlab.pdfgen.canvas import aspectRatioFix
+
+FONT_NAME = "HeiseiKakuGo-W5"
+# Bump when the layout changes so cached PDFs are not served for new output.
+LAYOUT_VERSION = 1
+ISSUER_FORM_NAME = "issuer_assets"
+# Donation lines per page of an annual certificate; the issuer block
+# at the bottom of each page stays clear of the list.
+ANNUAL_ROWS_PER_PAGE = 28
+# Rendered once per renderer to verify the images are embedded.
+SELF_CHECK_FIELDS = {
+    "name": "check",
+    "address": "check",
+    "amount": "0",
+    "payment_method": "check",
+    "donated_at": datetime(2000, 1, 1),
+    "certificate_no": "CHECK",
+}
+ISSUER_LINES = (
+    "受け入れ団体：NPO法人ほっこり サポートホーム／ほっこりくろちゃん",
+    "所在地：〒612-8403 京都市伏見区深草ヲカヤ町23-6 サポートホーム",
+)
+
+
+class CachedImage:
+    """A seal/signature PNG decoded, downscaled and Flate-encoded once.
+
+    reportlab would otherwise re-read, hash and re-compress the PNG on every
+    drawImage() call. Each document gets a shallow copy of the encoded
+    XObject because reportlab stamps registration state onto the object.
+    draw() mirrors Canvas.drawImage() internals (reportlab is pinned in
+    requirements.txt): the public drawImage() redoes that work for every
+    document and is several times slower. ReceiptRenderer checks the
+    output once at startup (check_embedded_images), so a reportlab upgrade
+    that breaks this fails loudly instead of dropping the images.
+    """
+
+    def __init__(self, name: str, path: Path, box_width: float, box_height: float, dpi: int):
+        with Image.open(path) as im:
+            im.load()
+            image = im.copy()
+        # Keep enough pixels for `dpi` at the drawn size, never upscale.
+        image.thumbnail((max(1, round(box_width / 72 * dpi)), max(1, round(box_height / 72 * dpi))))
+        self.xobject = pdfdoc.PDFImageXObject(name, ImageReader(image), mask="auto")
+        self.smask = getattr(self.xobject, "_smask", None)
+        if self.smask is not None:
+            del self.xobject._smask
+        self.name = name
+        self.width = self.xobject.width
+        self.height = self.xobject.height
+
+    def draw(self, c: canvas.Canvas, x: float, y: float, width: float, height: float) -> None:
+        doc = c._doc
+        reg_name = doc.getXObjectName(self.name)
+        if doc.idToObject.get(reg_name) is None:
+            xobject = copy.copy(self.xobject)
+            c._setXObjects(xobject)
+            doc.Reference(xobject, reg_name)
+            doc.addForm(self.name, xobject)
+            if self.smask is not None:
+                smask = copy.copy(self.smask)
+                c._setXObjects(smask)
+                xobject.smask = doc.Reference(smask, doc.getXObjectName(smask.name))
+        x, y, width, height, _ = aspectRatioFix(True, "c", x, y, width, height, self.width, self.height)
+        c.saveState()
+        c.translate(x, y)
+        c.scale(width, height)
+        c._code.append(f"/{reg_name} Do")
+        c.restoreState()
+        c._formsinuse.append(self.name)
+        c._currentPageHasImages = 1
+
+
+class ImageEmbedError(RuntimeError):
+    """The seal/signature images did not make it into a rendered PDF."""
+
+
+def check_embedded_images(pdf: bytes, images: list[CachedImage]) -> None:
+    """Raise ImageEmbedError unless every image is an image XObject of ``pdf``."""
+    for image in images:
+        ref = re.search(rb"/%s (\d+) 0 R" % re.escape(pdfdoc.xObjectName(image.name).encode()), pdf)
+        obj = ref and re.search(rb"\n%s 0 obj\s*<<(.*?)>>" % ref.group(1), pdf, re.DOTALL)
+        if (
+            not obj
+            or b"/Subtype /Image" not in obj.group(1)
+            or b"/Width %d" % image.width not in obj.group(1)
+            or (image.smask is not None and b"/SMask " not in obj.group(1))
+        ):
+            raise ImageEmbedError(
+                f"{image.name} is missing from the rendered PDF; CachedImage.draw() does not work "
+                f"with reportlab {reportlab.Version} (tested with the version in requirements.txt)"
+            )
+
+
+def register_fonts() -> None:
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(UnicodeCIDFont(FONT_NAME))
+
+
+class ReceiptRenderer:
+    """Receipt PDF renderer meant to be built once per process.
+
+    Fonts are registered and the issuer images are prepared in the
+    constructor, so render() only lays out the per-donation text.
+    """
+
+    def __init__(self, seal_path: Path, signature_path: Path, image_dpi: int = 150):
+        register_fonts()
+        self.seal = self._load_image("issuer_seal", seal_path, 130, 75, image_dpi)
+        self.signature = self._load_image("issuer_signature", signature_path, 220, 75, image_dpi)
+        images = [image for image in (self.seal, self.signature) if image]
+        if images:
+            check_embedded_images(self.render(**SELF_CHECK_FIELDS), images)
+
+    @staticmethod
+    def _load_image(name: str, path: Path, width: float, height: float, dpi: int) -> CachedImage | None:
+        if not path.exists():
+            return None
+        try:
+            return CachedImage(name, path, width, height, dpi)
+        except Exception:
+            # Same as before: an unreadable image is left off the receipt.
+            return None
+
+    def render(
+        self,
+        name: str,
+        address: str,
+        amount: str,
+        payment_method: str,
+        donated_at: datetime,
+        certificate_no: str,
+    ) -> bytes:
+        buffer = io.BytesIO()
+        # invariant=1 fixes the creation date and document ID, so the same
+        # fields always produce byte-identical output and can be regenerated.
+        c = canvas.Canvas(buffer, pagesize=A4, invariant=1)
+        self.draw_receipt(c, name, address, amount, payment_method, donated_at, certificate_no)
+        c.showPage()
+        c.save()
+        return buffer.getvalue()
+
+    def render_annual(
+        self,
+        name: str,
+        address: str,
+        year: int,
+        certificate_no: str,
+        total_amount: int,
+        donations: list[dict],
+    ) -> bytes:
+        """Consolidated certificate listing a donor's ``donations`` in ``year``.
+
+        Each donation needs donated_at, certificate_no, payment_method and
+        amount_value (None when the stored amount could not be parsed; such
+        lines are shown but left out of ``total_amount``).
+        """
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer, pagesize=A4, invariant=1)
+        pages = [
+            donations[start:start + ANNUAL_ROWS_PER_PAGE]
+            for start in range(0, max(len(donations), 1), ANNUAL_ROWS_PER_PAGE)
+        ]
+        for page_no, page in enumerate(pages, start=1):
+            self.draw_annual_page(c, name, address, year, certificate_no, total_amount, len(donations), page)
+            if len(pages) > 1:
+                c.setFont(FONT_NAME, 9)
+                c.drawRightString(545, 30, f"{page_no} / {len(pages)}")
+            c.showPage()
+        c.save()
+        return buffer.getvalue()
+
+    def draw_annual_page(
+        self,
+        c: canvas.Canvas,
+        name: str,
+        address: str,
+        year: int,
+        certificate_no: str,
+        total_amount: int,
+        donation_count: int,
+        donations: list[dict],
+    ) -> None:
+        text = c.beginText(50, 800)
+        text.setFont(FONT_NAME, 12)
+        text.textLine(f"寄附金受領証明書（{year}年分）")
+        text.textLine("")
+        text.textLine(f"証明書番号：{certificate_no}")
+        text.textLine("")
+        text.textLine(f"{name} 様")
+        text.textLine(f"住所：{address}")
+        text.textLine("")
+        text.textLine(f"寄附金額合計：{total_amount:,} 円（{donation_count}件）")
+        text.textLine(f"{year}年1月1日から{year}年12月31日までに上記の寄附金を受領したことを証明します。")
+        text.textLine("")
+        for line in ISSUER_LINES:
+            text.textLine(line)
+        c.drawText(text)
+
+        c.setFont(FONT_NAME, 10)
+        y = 570
+        for x, label in ((50, "寄付日"), (150, "証明書番号"), (330, "支払方法")):
+            c.drawString(x, y, label)
+        c.drawRightString(545, y, "金額")
+        c.line(50, y - 4, 545, y - 4)
+        for donation in donations:
+            y -= 14
+            c.drawString(50, y, donation["donated_at"].strftime("%Y年%m月%d日"))
+            c.drawString(150, y, donation["certificate_no"])
+            c.drawString(330, y, donation["payment_method"])
+            amount = donation["amount_value"]
+            c.drawRightString(545, y, f"{amount:,} 円" if amount is not None else "金額不明")
+        self.draw_issuer_assets(c)
+
+    def draw_receipt(
+        self,
+        c: canvas.Canvas,
+        name: str,
+        address: str,
+        amount: str,
+        payment_method: str,
+        donated_at: datetime,
+        certificate_no: str,
+    ) -> None:
+        c.setFont(FONT_NAME, 12)
+        text = c.beginText(50, 800)
+        text.setFont(FONT_NAME, 12)
+        text.textLine("寄付受領書")
+        text.textLine("")
+        text.textLine(f"証明書番号：{certificate_no}")
+        text.textLine("")
+        text.textLine(f"{name} 様")
+        text.textLine(f"住所：{address}")
+        text.textLine("")
+        text.textLine(f"寄附金額：{amount} 円")
+        text.textLine(f"支払方法：{payment_method}")
+        text.textLine(f"日付：{donated_at.strftime('%Y年%m月%d日 %H:%M:%S')}")
+        text.textLine("")
+        for line in ISSUER_LINES:
+            text.textLine(line)
+        c.drawText(text)
+        self.draw_issuer_assets(c)
+
+    def draw_issuer_assets(self, c: canvas.Canvas) -> None:
+        # The labels and images are identical on every page, so they are
+        # defined once per document as a form XObject and referenced.
+        if not c.hasForm(ISSUER_FORM_NAME):
+            c.beginForm(ISSUER_FORM_NAME)
+            c.setFont(FONT_NAME, 10)
+            y_label = 140
+            if self.seal:
+                c.drawString(60, y_label, "略印")
+                self.seal.draw(c, 60, 55, 130, 75)
+            if self.signature:
+                c.drawString(250, y_label, "代表者署名")
+                self.signature.draw(c, 250, 55, 220, 75)
+            c.endForm()
+        c.doForm(ISSUER_FORM_NAME)
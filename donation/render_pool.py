@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from receipt_renderer import ReceiptRenderer
+
+RENDER_MODES = ("inline", "process")
+
+
+class RenderBusyError(RuntimeError):
+    """Raised when a render cannot be accepted or finished in time."""
+
+
+class RenderQueueFull(RenderBusyError):
+    pass
+
+
+class RenderTimeout(RenderBusyError):
+    pass
+
+
+_worker_renderer: ReceiptRenderer | None = None
+
+
+def _init_worker(seal_path: str, signature_path: str, image_dpi: int) -> None:
+    # Runs once in each pool process so fonts and images are warm.
+    global _worker_renderer
+    _worker_renderer = ReceiptRenderer(Path(seal_path), Path(signature_path), image_dpi=image_dpi)
+
+
+def _render_in_worker(fields: dict, method: str = "render") -> bytes:
+    return getattr(_worker_renderer, method)(**fields)
+
+
+class ReceiptRenderExecutor:
+    """Runs ReceiptRenderer.render() inline or in a pool of warm processes.
+
+    In process mode at most ``max_pending`` renders may be queued or running
+    at once; further requests fail fast with RenderQueueFull instead of
+    piling up CPU work behind a burst of submissions.
+    """
+
+    def __init__(
+        self,
+        seal_path: Path,
+        signature_path: Path,
+        image_dpi: int = 150,
+        mode: str = "inline",
+        workers: int | None = None,
+        timeout: float = 30.0,
+        max_pending: int = 8,
+    ):
+        if mode not in RENDER_MODES:
+            raise ValueError(f"unknown render mode: {mode}")
+        self.renderer_args = (str(seal_path), str(signature_path), image_dpi)
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_pending = max(1, max_pending)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
+        self._inline_renderer: ReceiptRenderer | None = None
+
+    @property
+    def inline_renderer(self) -> ReceiptRenderer:
+        if self._inline_renderer is None:
+            seal_path, signature_path, image_dpi = self.renderer_args
+            self._inline_renderer = ReceiptRenderer(Path(seal_path), Path(signature_path), image_dpi=image_dpi)
+        return self._inline_renderer
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=self.renderer_args,
+                )
+            return self._pool
+
+    def _discard_broken_pool(self, pool: ProcessPoolExecutor) -> None:
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, *args) -> tuple[ProcessPoolExecutor, Future]:
+        """Submit to the pool, replacing it once if it broke while idle."""
+        pool = self._get_pool()
+        try:
+            return pool, pool.submit(*args)
+        except BrokenProcessPool:
+            # A worker died since the last render; the executor is unusable.
+            self._discard_broken_pool(pool)
+        pool = self._get_pool()
+        return pool, pool.submit(*args)
+
+    def render(self, **fields) -> bytes:
+        if self.mode == "inline":
+            return self.inline_renderer.render(**fields)
+
+        if not self._slots.acquire(blocking=False):
+            raise RenderQueueFull("受領書PDFの生成が混み合っています。しばらくしてから再度お試しください。")
+        try:
+            pool, future = self._submit(_render_in_worker, fields)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the work really finishes, even after a
+        # timeout, so the limit reflects CPU actually in use.
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError as exc:
+            raise RenderTimeout("受領書PDFの生成がタイムアウトしました。") from exc
+        except BrokenProcessPool:
+            self._discard_broken_pool(pool)
+            raise
+
+    def map(
+        self,
+        items: Iterable[dict],
+        window: int | None = None,
+        method: str = "render",
+    ) -> Iterator[tuple[dict, bytes]]:
+        """Render many receipts, yielding ``(fields, pdf_bytes)`` in input order.
+
+        Meant for batch jobs: it ignores ``max_pending`` and keeps about
+        ``window`` renders in flight across all pool processes. ``method``
+        names the ReceiptRenderer method, e.g. "render_annual".
+        """
+        if self.mode == "inline":
+            for fields in items:
+                yield fields, getattr(self.inline_renderer, method)(**fields)
+            return
+
+        window = window or self.workers * 4
+        in_flight: deque = deque()
+        for fields in items:
+            in_flight.append((fields, *self._submit(_render_in_worker, fields, method)))
+            if len(in_flight) >= window:
+                yield self._map_result(in_flight.popleft())
+        while in_flight:
+            yield self._map_result(in_flight.popleft())
+
+    def _map_result(self, entry: tuple[dict, ProcessPoolExecutor, Future]) -> tuple[dict, bytes]:
+        fields, pool, future = entry
+        try:
+            return fields, future.result()
+        except BrokenProcessPool:
+            # The next submit (or call) gets a fresh pool.
+            self._discard_broken_pool(pool)
+            raise
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
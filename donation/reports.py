@@ -0,0 +1,92 @@
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable
+
+REPORT_GROUPINGS = {
+    "month": "DATE_FORMAT(donated_at, '%%Y-%%m')",
+    "payment_method": "payment_method",
+    "status": "status",
+}
+
+
+class TTLCache:
+    """Tiny per-process cache for values that may be a little stale."""
+
+    def __init__(self, ttl: float, max_entries: int = 64):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: dict = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute: Callable[[], object]):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+        value = compute()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def report_range(donated_from: str | None, donated_to: str | None) -> tuple[date, date]:
+    """Inclusive date range, defaulting to the current calendar year."""
+    today = date.today()
+    start = date.fromisoformat(donated_from) if donated_from else date(today.year, 1, 1)
+    end = date.fromisoformat(donated_to) if donated_to else date(start.year, 12, 31)
+    if end < start:
+        raise ValueError("寄付日の範囲が不正です。")
+    return start, end
+
+
+def donation_report(cur, start: date, end: date) -> dict:
+    """Counts and yen totals of active receipts by month, payment method and status.
+
+    Every query reads only idx_active_report. ``invalid`` counts receipts
+    whose amount could not be parsed; they are excluded from ``total_yen``.
+    """
+    params = (
+        datetime.combine(start, datetime.min.time()),
+        datetime.combine(end + timedelta(days=1), datetime.min.time()),
+    )
+    report: dict = {"from": start.isoformat(), "to": end.isoformat()}
+    for name, expression in REPORT_GROUPINGS.items():
+        cur.execute(
+            f"""
+            SELECT {expression} AS bucket,
+                   COUNT(*) AS donations,
+                   COALESCE(SUM(amount_value), 0) AS total_yen,
+                   COUNT(*) - COUNT(amount_value) AS invalid
+            FROM donation_receipts
+            WHERE is_deleted=0 AND donated_at >= %s AND donated_at < %s
+            GROUP BY bucket
+            ORDER BY bucket
+            """,
+            params,
+        )
+        report[f"by_{name}"] = [
+            {
+                name: row["bucket"],
+                "donations": int(row["donations"]),
+                "total_yen": int(row["total_yen"]),
+                "invalid": int(row["invalid"]),
+            }
+            for row in cur.fetchall()
+        ]
+    months = report["by_month"]
+    report["totals"] = {
+        "donations": sum(row["donations"] for row in months),
+        "total_yen": sum(row["total_yen"] for row in months),
+        "invalid": sum(row["invalid"] for row in months),
+    }
+    return report
@@ -0,0 +1,90 @@
+import re
+import unicodedata
+
+SEARCH_LIMIT = 100
+# Each index branch is capped before the rows are merged and sorted.
+BRANCH_LIMIT = 500
+_SPACE_RE = re.compile(r"[\s\-‐‑‒–—―]+")
+_POSTAL_RE = re.compile(r"[0-9]{1,7}")
+# ngram_token_size defaults to 2, so shorter terms cannot hit the index.
+FULLTEXT_MIN_CHARS = 2
+
+
+def normalize_search_text(value: str | None) -> str:
+    """Fold width and case and drop spaces and hyphens for prefix matching.
+
+    "ﾔﾏﾀﾞ　太郎" -> "ヤマダ太郎", "Taro@Example.JP" -> "taro@example.jp",
+    "612-8403" -> "6128403".
+    """
+    text = unicodedata.normalize("NFKC", value or "").casefold()
+    return _SPACE_RE.sub("", text)
+
+
+def search_columns(name: str, email: str, postal_code: str) -> dict:
+    """Values for the search_* columns stored alongside a receipt."""
+    return {
+        "search_name": normalize_search_text(name)[:255],
+        "search_email": normalize_search_text(email)[:255],
+        "search_postal": normalize_search_text(postal_code)[:16],
+    }
+
+
+def _like_prefix(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _fulltext_phrase(value: str) -> str:
+    # A quoted phrase in boolean mode matches the ngrams in sequence,
+    # which behaves like a substring search for Japanese text.
+    return '"' + value.replace('"', " ").strip() + '"'
+
+
+def search_branches(query: str) -> list[tuple[str, list]]:
+    """One ``(sql, params)`` id lookup per index that can answer ``query``."""
+    normalized = normalize_search_text(query)
+    if not normalized:
+        return []
+    text = unicodedata.normalize("NFKC", query).strip()
+    branches = [
+        ("search_name LIKE %s", [_like_prefix(normalized)]),
+        ("search_email LIKE %s", [_like_prefix(normalized)]),
+        ("certificate_no LIKE %s", [_like_prefix(text.upper())]),
+    ]
+    if _POSTAL_RE.fullmatch(normalized):
+        branches.append(("search_postal LIKE %s", [_like_prefix(normalized)]))
+    if len(text) >= FULLTEXT_MIN_CHARS:
+        branches.append(("MATCH(donor_address) AGAINST (%s IN BOOLEAN MODE)", [_fulltext_phrase(text)]))
+    return [
+        (f"(SELECT id FROM donation_receipts WHERE {condition} AND is_deleted=0 LIMIT {BRANCH_LIMIT})", params)
+        for condition, params in branches
+    ]
+
+
+def search_query(query: str, columns: str, limit: int = SEARCH_LIMIT) -> tuple[str, list] | None:
+    """Newest-first receipts matching ``query`` in any searchable column.
+
+    Each column contributes at most BRANCH_LIMIT ids, so a very broad
+    query (a single common character) returns a partial list quickly
+    rather than scanning; staff narrow it by typing more.
+    """
+    branches = search_branches(query)
+    if not branches:
+        return None
+    union = " UNION ".join(sql for sql, _ in branches)
+    params = [param for _, branch_params in branches for param in branch_params]
+    sql = f"""
+        SELECT {columns}
+        FROM donation_receipts
+        WHERE id IN (SELECT id FROM ({union}) AS matched)
+        ORDER BY id DESC
+        LIMIT {int(limit)}
+    """
+    return sql, params
+
+
+def search_receipts(cur, query: str, columns: str, limit: int = SEARCH_LIMIT) -> list[dict]:
+    built = search_query(query, columns, limit)
+    if built is None:
+        return []
+    cur.execute(*built)
+    return list(cur.fetchall())
@@ -0,0 +1,220 @@
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import threading
+from pathlib import Path
+from typing import Callable
+
+try:
+    import brotli
+except ImportError:  # .br variants are optional
+    brotli = None
+
+MANIFEST_NAME = "manifest.json"
+HASH_LENGTH = 10
+FINGERPRINT_EXTS = {".css", ".js", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico", ".woff", ".woff2"}
+COMPRESS_EXTS = {".html", ".css", ".js", ".svg", ".json", ".txt", ".xml"}
+# Too small to be worth a compressed copy.
+COMPRESS_MIN_BYTES = 256
+# Top-level entries of the site root that are not part of the public site.
+EXCLUDED_TOP_LEVEL = {"donation", "README.md"}
+# The donation form is the only file under donation/ served as a page.
+FORM_PAGE = "donation/index.html"
+REF_RE = re.compile(r"""(\b(?:href|src)\s*=\s*)(["'])([^"']+)\2""", re.IGNORECASE)
+CSS_URL_RE = re.compile(r"""(url\(\s*)(["']?)([^"')]+)\2(\s*\))""", re.IGNORECASE)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(rel_path: str, digest: str) -> str:
+    stem, ext = posixpath.splitext(rel_path)
+    return f"{stem}.{digest}{ext}"
+
+
+def site_files(site_root: Path, out_dir: Path) -> list[str]:
+    """Relative (posix) paths of everything published from ``site_root``."""
+    files = []
+    for top in sorted(site_root.iterdir()):
+        if top.name.startswith(".") or top.name in EXCLUDED_TOP_LEVEL or top.resolve() == out_dir.resolve():
+            continue
+        paths = [top] if top.is_file() else sorted(p for p in top.rglob("*") if p.is_file())
+        files.extend(p.relative_to(site_root).as_posix() for p in paths if not p.name.startswith("."))
+    if (site_root / FORM_PAGE).is_file():
+        files.append(FORM_PAGE)
+    return files
+
+
+def resolve_ref(ref: str, base_dir: str) -> tuple[str, str, str] | None:
+    """Split a same-site reference into (path relative to the root, path as written, suffix)."""
+    if re.match(r"^(?:[a-z][a-z0-9+.-]*:|//|#)", ref, re.IGNORECASE):
+        return None
+    split = re.search(r"[?#]", ref)
+    path, suffix = (ref[: split.start()], ref[split.start():]) if split else (ref, "")
+    if not path:
+        return None
+    if path.startswith("/"):
+        resolved = posixpath.normpath(path.lstrip("/"))
+    else:
+        resolved = posixpath.normpath(posixpath.join(base_dir, path))
+    return resolved, path, suffix
+
+
+def rewrite_refs(text: str, base_dir: str, manifest: dict[str, str], pattern: re.Pattern) -> str:
+    def replace(match: re.Match) -> str:
+        parts = resolve_ref(match.group(3), base_dir)
+        if parts is None or parts[0] not in manifest:
+            return match.group(0)
+        _, path, suffix = parts
+        # The hashed file sits next to the original: swap the last segment only.
+        new_path = posixpath.join(posixpath.dirname(path), posixpath.basename(manifest[parts[0]]))
+        closing = match.group(4) if pattern.groups >= 4 else ""
+        quote = match.group(2)
+        return f"{match.group(1)}{quote}{new_path}{suffix}{quote}{closing}"
+
+    return pattern.sub(replace, text)
+
+
+def write_compressed(path: Path, data: bytes) -> list[Path]:
+    written = []
+    if len(data) < COMPRESS_MIN_BYTES:
+        return written
+    gz_path = path.with_name(path.name + ".gz")
+    # mtime=0 keeps the output identical between builds of the same input.
+    gz_path.write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+    written.append(gz_path)
+    if brotli is not None:
+        br_path = path.with_name(path.name + ".br")
+        br_path.write_bytes(brotli.compress(data, quality=11))
+        written.append(br_path)
+    return written
+
+
+def build_site(site_root: Path, out_dir: Path, log: Callable[[str], None] | None = None) -> dict[str, str]:
+    """Build the public site into ``out_dir`` and return the asset manifest.
+
+    Every CSS/JS/image file is copied under its original name and under a
+    content-hashed one (``style.<hash>.css``); HTML pages (and url() in
+    CSS) are rewritten to the hashed names, so those can be cached
+    forever. Text files also get .gz (and .br with the brotli package)
+    variants for nginx's gzip_static/brotli_static. The build happens in
+    a temporary directory that then replaces ``out_dir``; hashed files of
+    the previous build are kept for one more generation so pages loaded
+    just before a deploy can still fetch their assets.
+    """
+    site_root = site_root.resolve()
+    out_dir = out_dir.resolve()
+    tmp_dir = out_dir.with_name(f".{out_dir.name}.tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    files = site_files(site_root, out_dir)
+    # Images and fonts first: CSS is hashed after its url()s are rewritten.
+    order = sorted(
+        (rel for rel in files if posixpath.splitext(rel)[1].lower() in FINGERPRINT_EXTS),
+        key=lambda rel: posixpath.splitext(rel)[1].lower() == ".css",
+    )
+    manifest: dict[str, str] = {}
+    compressed = 0
+    for rel in order:
+        data = (site_root / rel).read_bytes()
+        if rel.lower().endswith(".css"):
+            text = rewrite_refs(data.decode("utf-8"), posixpath.dirname(rel), manifest, CSS_URL_RE)
+            data = text.encode("utf-8")
+        manifest[rel] = hashed_name(rel, content_hash(data))
+        for name in (rel, manifest[rel]):
+            target = tmp_dir / name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(data)
+            if posixpath.splitext(rel)[1].lower() in COMPRESS_EXTS:
+                compressed += len(write_compressed(target, data))
+
+    for rel in files:
+        if rel in manifest:
+            continue
+        target = tmp_dir / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        ext = posixpath.splitext(rel)[1].lower()
+        if ext == ".html":
+            text = (site_root / rel).read_text(encoding="utf-8")
+            data = rewrite_refs(text, posixpath.dirname(rel), manifest, REF_RE).encode("utf-8")
+            target.write_bytes(data)
+        else:
+            shutil.copy2(site_root / rel, target)
+            data = target.read_bytes() if ext in COMPRESS_EXTS else b""
+        if ext in COMPRESS_EXTS:
+            compressed += len(write_compressed(target, data))
+
+    carried = 0
+    previous = _read_manifest(out_dir)
+    for hashed in previous.values():
+        if hashed in manifest.values() or not (out_dir / hashed).is_file():
+            continue
+        for source in (out_dir / posixpath.dirname(hashed)).glob(f"{posixpath.basename(hashed)}*"):
+            target = tmp_dir / posixpath.dirname(hashed) / source.name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(source, target)
+        carried += 1
+
+    (tmp_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    _swap_in(tmp_dir, out_dir)
+    if log:
+        log(
+            f"built {len(files)} files into {out_dir}: {len(manifest)} fingerprinted, "
+            f"{compressed} compressed variants{'' if brotli else ' (gzip only; pip install brotli for .br)'}, "
+            f"{carried} kept from the previous build"
+        )
+    return manifest
+
+
+def _read_manifest(out_dir: Path) -> dict[str, str]:
+    try:
+        return json.loads((out_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _swap_in(tmp_dir: Path, out_dir: Path) -> None:
+    old_dir = out_dir.with_name(f".{out_dir.name}.old")
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
+    if out_dir.exists():
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+class AssetManifest:
+    """Site path -> fingerprinted URL, from the manifest of the last build.
+
+    The manifest is re-read when its mtime changes, so a rebuild is picked
+    up without restarting the app. Without a build every path maps to
+    itself.
+    """
+
+    def __init__(self, out_dir: Path):
+        self.path = Path(out_dir) / MANIFEST_NAME
+        self._lock = threading.Lock()
+        self._mtime: float | None = None
+        self._entries: dict[str, str] = {}
+
+    def _current(self) -> dict[str, str]:
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime != self._mtime:
+                self._entries = _read_manifest(self.path.parent) if mtime is not None else {}
+                self._mtime = mtime
+            return self._entries
+
+    def url(self, path: str) -> str:
+        rel = path.lstrip("/")
+        return "/" + self._current().get(rel, rel)